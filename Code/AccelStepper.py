@@ -1,5 +1,6 @@
 import time
-from math import sqrt, fabs
+from math import sqrt, fabs, floor, log2
+from functools import lru_cache
 from gpiozero import DigitalOutputDevice
 
 DIRECTION_CCW = 0  # Counter-Clockwise
@@ -16,6 +17,52 @@ HALF4WIRE = 8  # 4 wire half stepper
 def constrain(val, min_val, max_val):
     return min(max_val, max(min_val, val))
 
+def micros():
+    """Time base of all step timing, in microseconds (monotonic)."""
+    return time.perf_counter_ns() // 1000
+
+# c_n / c_0 of the acceleration ramp. The recurrence c_n = c_(n-1) - 2 c_(n-1) / (4n + 1)
+# does not depend on the acceleration, so one shape serves every (acceleration, max speed)
+_ramp_shape = [1.0]
+
+
+# Table limits are rounded to this many steps per octave, so limits that change on
+# every update (MultiStepper scaling, track() caps) share a few cached tables
+RAMP_TABLE_STEPS_PER_OCTAVE = 32
+
+
+def ramp_table_key(acceleration: float, max_speed: float):
+    """
+    (acceleration, max_speed) for ramp_table(), both rounded down to the
+    grid, so the table never accelerates harder or runs faster than asked
+    (and at most 2.2% slower). Callers that must not cap below a speed
+    leave one grid step of headroom, see MultiStepper.track().
+    """
+    grid = RAMP_TABLE_STEPS_PER_OCTAVE
+    return (2.0 ** (floor(log2(acceleration) * grid) / grid),
+            2.0 ** (floor(log2(max_speed) * grid) / grid))
+
+
+@lru_cache(maxsize=256)
+def ramp_table(acceleration: float, max_speed: float):
+    """
+    Step intervals (us) and speeds (steps/s) of the ramp from standstill up
+    to max_speed, as compute_new_speed() would produce them one by one.
+    The last entry is the cruise interval.
+    """
+    c0 = 0.676 * sqrt(2.0 / acceleration) * 1000000.0
+    cmin = 1000000.0 / max_speed
+    n = 0
+    while True:
+        if n == len(_ramp_shape):
+            c = _ramp_shape[-1]
+            _ramp_shape.append(c - (2.0 * c) / (4.0 * n + 1))
+        if c0 * _ramp_shape[n] <= cmin:
+            break
+        n += 1
+    intervals = [c0 * f for f in _ramp_shape[:n]] + [cmin]
+    return tuple(intervals), tuple(1000000.0 / c for c in intervals)
+
 class AccelStepper:
     def __init__(self, *args):
         self._currentPos = 0
@@ -36,6 +83,10 @@ class AccelStepper:
         self._cmin = 1.0
         self._direction = DIRECTION_CCW
         self._pinInverted = [False, False, False, False]
+        self._table = None   # (intervals, speeds) when ramp tables are in use
+        self._ramp = 0       # index into the table; equals the steps needed to stop
+        self._table_key = None
+        self._clock = micros  # replaced by simulators with a virtual clock
 
         if len(args) == 6:
             self._interface = args[0]
@@ -66,7 +117,7 @@ class AccelStepper:
         if not self._stepInterval:
             return False
         
-        current_time = time.time() * 1000000  # microseconds
+        current_time = self._clock()
         if (current_time - self._lastStepTime) >= self._stepInterval:
             if self._direction == DIRECTION_CW:
                 self._currentPos += 1
@@ -77,6 +128,12 @@ class AccelStepper:
             return True
         return False
 
+    def next_step_time(self):
+        """micros() at which run()/run_speed() will issue the next step, or None when idle."""
+        if not self._stepInterval:
+            return None
+        return self._lastStepTime + self._stepInterval
+
     def distance_to_go(self) -> int:
         return self._targetPos - self._currentPos
 
@@ -89,10 +146,61 @@ class AccelStepper:
     def set_current_position(self, position: int) -> None:
         self._targetPos = self._currentPos = position
         self._n = 0
+        self._ramp = 0
         self._stepInterval = 0
         self._speed = 0.0
 
+    def use_ramp_table(self, enabled: bool = True) -> None:
+        """
+        Take step intervals from a precomputed ramp_table() instead of
+        evaluating the ramp recurrence on every step.
+        """
+        if enabled:
+            self._load_table()
+        elif self._table is not None:
+            self._cn = self._table[0][self._ramp]
+            self._n = self._ramp
+            self._table = None
+
+    def _load_table(self):
+        key = ramp_table_key(self._acceleration, self._maxSpeed)
+        if self._table is not None and key == self._table_key:
+            return
+        self._table_key = key
+        self._table = ramp_table(*key)
+        # keep the current speed: resume at the entry with as many steps to stop
+        steps_to_stop = int((self._speed * self._speed) / (2.0 * key[0]))
+        self._ramp = min(steps_to_stop, len(self._table[0]) - 1)
+
+    def _compute_new_speed_table(self) -> None:
+        distance_to = self._targetPos - self._currentPos
+        ramp = self._ramp
+        if distance_to == 0 and ramp <= 1:
+            self._stepInterval = 0
+            self._speed = 0.0
+            self._ramp = 0
+            return
+
+        intervals, speeds = self._table
+        forward = self._direction == DIRECTION_CW
+        if ramp and (forward != (distance_to > 0) or ramp >= abs(distance_to)):
+            # overshooting, reversing or close enough to the target: decelerate
+            ramp -= 1
+            i = ramp
+        else:
+            if not ramp:
+                self._direction = DIRECTION_CW if distance_to > 0 else DIRECTION_CCW
+                forward = distance_to > 0
+            i = ramp
+            if ramp < len(intervals) - 1:
+                ramp += 1
+        self._ramp = ramp
+        self._stepInterval = intervals[i]
+        self._speed = speeds[i] if forward else -speeds[i]
+
     def compute_new_speed(self) -> None:
+        if self._table is not None:
+            return self._compute_new_speed_table()
         distance_to = self.distance_to_go()
         steps_to_stop = int((self._speed * self._speed) / (2.0 * self._acceleration))
         
@@ -141,7 +249,9 @@ class AccelStepper:
         if self._maxSpeed != speed:
             self._maxSpeed = speed
             self._cmin = 1000000.0 / speed
-            if self._n > 0:
+            if self._table is not None:
+                self._load_table()
+            elif self._n > 0:
                 self._n = int((self._speed * self._speed) / (2.0 * self._acceleration))
                 self.compute_new_speed()
 
@@ -157,6 +267,8 @@ class AccelStepper:
             self._n = self._n * (self._acceleration / acceleration)
             self._c0 = 0.676 * sqrt(2.0 / acceleration) * 1000000.0
             self._acceleration = acceleration
+            if self._table is not None:
+                self._load_table()
             self.compute_new_speed()
 
     def set_speed(self, speed: float) -> None:
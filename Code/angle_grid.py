@@ -0,0 +1,282 @@
+# angle_grid.py
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+from surface_index import nearest_surface_labels
+
+logger = logging.getLogger("App")
+
+# Native camera resolution (see camera.py / main.js)
+FRAME_WIDTH = 1920
+FRAME_HEIGHT = 1080
+GRID_STRIDE = int(os.getenv("ANGLE_GRID_STRIDE", 4))  # pixels between grid nodes
+
+# Channels of each grid node
+CH_THETA1, CH_THETA2, CH_SURFACE = 0, 1, 2
+
+# Bump when the baking rules change so stale caches are rebuilt
+GRID_VERSION = 3
+
+
+class AngleGrid:
+    """
+    Dense pixel -> (theta1, theta2, surface) lookup baked from the per-surface
+    calibration models. Angles are bilinearly interpolated between grid nodes;
+    the surface is taken from the nearest node.
+    """
+
+    def __init__(self, grid, stride):
+        self.stride = stride
+        # plain ndarray view of the memmap; avoids memmap's per-index overhead
+        self.grid = np.asarray(grid)
+        self._max_r = self.grid.shape[0] - 1
+        self._max_c = self.grid.shape[1] - 1
+
+    def lookup(self, x, y):
+        """Returns (theta1, theta2, surface_idx) for pixel (x, y)."""
+        fx = min(max(x / self.stride, 0.0), self._max_c)
+        fy = min(max(y / self.stride, 0.0), self._max_r)
+        c = min(int(fx), self._max_c - 1)
+        r = min(int(fy), self._max_r - 1)
+        wx = fx - c
+        wy = fy - r
+        (a, b), (d, e) = self.grid[r:r + 2, c:c + 2].tolist()
+        w00 = (1 - wx) * (1 - wy)
+        w01 = wx * (1 - wy)
+        w10 = (1 - wx) * wy
+        w11 = wx * wy
+        theta1 = w00 * a[0] + w01 * b[0] + w10 * d[0] + w11 * e[0]
+        theta2 = w00 * a[1] + w01 * b[1] + w10 * d[1] + w11 * e[1]
+        near_row = (d, e) if wy >= 0.5 else (a, b)
+        surface = near_row[1 if wx >= 0.5 else 0][CH_SURFACE]
+        return theta1, theta2, int(surface)
+
+    def lookup_many(self, points):
+        """Vectorized lookup() for an (N, 2) array of pixels. Returns (N, 3) float64."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        fx = np.clip(points[:, 0] / self.stride, 0.0, self._max_c)
+        fy = np.clip(points[:, 1] / self.stride, 0.0, self._max_r)
+        c = np.minimum(fx.astype(np.intp), self._max_c - 1)
+        r = np.minimum(fy.astype(np.intp), self._max_r - 1)
+        wx = (fx - c)[:, None]
+        wy = (fy - r)[:, None]
+        g = self.grid
+        top = (1 - wx) * g[r, c, :2] + wx * g[r, c + 1, :2]
+        bottom = (1 - wx) * g[r + 1, c, :2] + wx * g[r + 1, c + 1, :2]
+
+        out = np.empty((points.shape[0], 3))
+        out[:, :2] = (1 - wy) * top + wy * bottom
+        out[:, CH_SURFACE] = g[r + (wy[:, 0] >= 0.5), c + (wx[:, 0] >= 0.5), CH_SURFACE]
+        return out
+
+
+# Columns of the array returned by AnglePredictor.predict_many
+PA_THETA1, PA_THETA2, PA_STEPS1, PA_STEPS2, PA_SURFACE, PA_FALLBACK = range(6)
+
+
+class AnglePredictor:
+    """
+    Pixel -> gimbal angles through the baked grid when there is one, else
+    through the calibration model of the surface containing or closest to
+    the pixel.
+    """
+
+    def __init__(self, surface_index, surface_models, angle_grid, degrees_per_step):
+        self.surface_index = surface_index
+        self.surface_models = surface_models
+        self.angle_grid = angle_grid
+        self.degrees_per_step = degrees_per_step
+
+    def predict(self, x, y):
+        """Returns (theta1, theta2) for pixel (x, y)."""
+        # 0. Fast path: baked grid already resolves the surface for every pixel
+        if self.angle_grid is not None:
+            theta1, theta2, _ = self.angle_grid.lookup(x, y)
+            return theta1, theta2
+
+        # 1. Surface containing the pixel, or the closest one if none does
+        idx = self.surface_index.nearest_surface(x, y)
+        if idx >= 0 and idx in self.surface_models:
+            theta1, theta2 = self.surface_models[idx].predict([[x, y]])[0]
+            return theta1, theta2
+
+        # 2. Otherwise, fallback
+        raise ValueError("Pixel not inside any surface and no close polygon found.")
+
+    def predict_many(self, points):
+        """
+        Batched predict() for an (N, 2) array of pixels. Returns (N, 6):
+        theta1, theta2, steps1, steps2, surface, fallback. Points outside every
+        surface never raise; they take the closest surface and get fallback=1.
+        Where predict() would raise the angles and steps are NaN.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        out = np.full((points.shape[0], 6), np.nan)
+        out[:, PA_FALLBACK] = self.surface_index.surface_at_many(points) < 0
+
+        if self.angle_grid is not None:
+            out[:, [PA_THETA1, PA_THETA2, PA_SURFACE]] = self.angle_grid.lookup_many(points)
+        else:
+            nearest = self.surface_index.nearest_surface_many(points)
+            out[:, PA_SURFACE] = nearest
+            for idx, model in self.surface_models.items():
+                mask = nearest == idx
+                if mask.any():
+                    out[mask, PA_THETA1:PA_THETA2 + 1] = model.predict(points[mask])
+
+        # same truncation as int(theta / DEGREES_PER_STEP) on the single-point path
+        out[:, PA_STEPS1] = np.trunc(out[:, PA_THETA1] / self.degrees_per_step[0])
+        out[:, PA_STEPS2] = np.trunc(out[:, PA_THETA2] / self.degrees_per_step[1])
+        return out
+
+
+def _cache_key(surfaces_path, model_paths, width, height, stride):
+    h = hashlib.sha1()
+    for path in [surfaces_path, *model_paths]:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    h.update(f"v{GRID_VERSION}/{width}x{height}/{stride}".encode())
+    return h.hexdigest()
+
+
+def bake_grid(surface_index, surface_models, width, height, stride):
+    """Evaluate the calibration models on every grid node. Returns (rows, cols, 3) float32."""
+    cols = width // stride + 1
+    rows = height // stride + 1
+    ys, xs = np.mgrid[0:rows, 0:cols] * stride
+    xs = xs.ravel().astype(np.float64)
+    ys = ys.ravel().astype(np.float64)
+
+    # each node takes the surface containing it, else the nearest one; surfaces
+    # without a model (train_surface.py skips those without points) are left
+    # out so their pixels resolve to the closest surface that has one
+    nearest = surface_index.nearest
+    if np.isin(nearest, list(surface_models), invert=True).any():
+        modelled = np.isin(surface_index.labels, list(surface_models))
+        nearest, _ = nearest_surface_labels(np.where(modelled, surface_index.labels, -1))
+    node_surface = nearest[
+        np.minimum(ys.astype(int), surface_index.height - 1),
+        np.minimum(xs.astype(int), surface_index.width - 1)]
+
+    # NaN rather than (0, 0) wherever no model applies
+    grid = np.full((rows * cols, 3), np.nan, np.float32)
+    grid[:, CH_SURFACE] = node_surface
+    for idx, model in surface_models.items():
+        mask = node_surface == idx
+        if mask.any():
+            grid[mask, :2] = model.predict(np.column_stack([xs[mask], ys[mask]]))
+    return grid.reshape(rows, cols, 3)
+
+
+def load_angle_grid(surface_index, surface_models, surfaces_path, model_paths, cache_dir,
+                    width=FRAME_WIDTH, height=FRAME_HEIGHT, stride=GRID_STRIDE):
+    """
+    Memory-map the baked grid from cache_dir, re-baking it when surfaces.json,
+    a model file or the grid geometry changed. Returns None without a
+    surface that has a model.
+    """
+    if not surface_models or not np.isin(surface_index.labels, list(surface_models)).any():
+        return None
+
+    grid_path = os.path.join(cache_dir, "angle_grid.f32")
+    meta_path = os.path.join(cache_dir, "angle_grid.json")
+    key = _cache_key(surfaces_path, model_paths, width, height, stride)
+
+    meta = None
+    if os.path.exists(meta_path) and os.path.exists(grid_path):
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+
+    if meta is None or meta.get("key") != key:
+        logger.info("Baking pixel-to-angle grid...")
+        grid = bake_grid(surface_index, surface_models, width, height, stride)
+        mm = np.memmap(grid_path, dtype=np.float32, mode="w+", shape=grid.shape)
+        mm[:] = grid
+        mm.flush()
+        del mm
+        meta = {"key": key, "shape": list(grid.shape), "stride": stride}
+        with open(meta_path, "w") as f:
+            json.dump(meta, f, indent=2)
+
+    grid = np.memmap(grid_path, dtype=np.float32, mode="r", shape=tuple(meta["shape"]))
+    logger.info(f"Loaded pixel-to-angle grid {meta['shape'][1]}x{meta['shape'][0]} (stride {stride})")
+    return AngleGrid(grid, stride)
+
+
+if __name__ == "__main__":
+    # Check AnglePredictor.predict_many against predict() on synthetic surfaces,
+    # with and without the baked grid, and benchmark both; exits non-zero on a mismatch
+    import sys
+    import time
+    from surface_index import SurfaceIndex, surface_labels
+    from surface_model import PolySurfaceModel
+
+    degrees_per_step = (360.0 / 200 / 4 * 16 / 80, 360.0 / 200 / 4 * 20 / 80)
+    surfaces = [
+        {"points": [[100, 80], [900, 80], [900, 700], [100, 700]]},
+        {"points": [[1000, 200], [1800, 150], [1700, 1000], [1100, 900]]},
+        {"points": [[300, 800], [700, 800], [500, 1050]]},  # no model, like a surface without points
+    ]
+    powers = [[0, 0], [1, 0], [0, 1], [2, 0], [1, 1], [0, 2]]
+    models = {
+        0: PolySurfaceModel(powers, [[0, 0.05, 0.001, 1e-6, 2e-6, 0], [0, 0.002, 0.04, 0, 1e-6, -2e-6]], [-48, -20]),
+        1: PolySurfaceModel(powers, [[0, 0.045, 0.0, 2e-6, 0, 1e-6], [0, 0.0, 0.042, 0, -1e-6, 0]], [-40, -22]),
+    }
+    labels = surface_labels(surfaces, FRAME_WIDTH, FRAME_HEIGHT)
+    index = SurfaceIndex(labels, *nearest_surface_labels(labels))
+    grid = AngleGrid(bake_grid(index, models, FRAME_WIDTH, FRAME_HEIGHT, GRID_STRIDE), GRID_STRIDE)
+
+    failures = []
+
+    def check(name, ok):
+        if not ok:
+            failures.append(name)
+            print(f"FAIL {name}")
+
+    rng = np.random.default_rng(0)
+    for n in (10_000, 50_000):
+        # a margin outside the frame exercises clamping
+        pts = rng.random((n, 2)) * [FRAME_WIDTH + 100, FRAME_HEIGHT + 100] - 50
+        fallback = np.array([index.surface_at(x, y) < 0 for x, y in pts])
+        check(f"{n}: points both inside and outside surfaces", fallback.any() and not fallback.all())
+
+        for name, predictor in (("grid", AnglePredictor(index, models, grid, degrees_per_step)),
+                                ("models", AnglePredictor(index, models, None, degrees_per_step))):
+            t0 = time.perf_counter()
+            many = predictor.predict_many(pts)
+            t_many = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            single = np.full((n, 2), np.nan)
+            for i, (x, y) in enumerate(pts):
+                try:
+                    single[i] = predictor.predict(x, y)
+                except ValueError:
+                    pass
+            t_single = time.perf_counter() - t0
+
+            raised = np.isnan(single[:, 0])
+            steps = np.trunc(single / degrees_per_step)
+            ok = ~raised
+            err = np.abs(many[ok, PA_THETA1:PA_THETA2 + 1] - single[ok]).max()
+            check(f"{n} {name}: angles match predict()", err < 1e-9)
+            check(f"{n} {name}: steps match int(theta / DEGREES_PER_STEP)",
+                  (many[ok][:, [PA_STEPS1, PA_STEPS2]] == steps[ok]).all())
+            check(f"{n} {name}: NaN exactly where predict() raises",
+                  (np.isnan(many[:, PA_THETA1]) == raised).all())
+            check(f"{n} {name}: fallback mask", (many[:, PA_FALLBACK] == fallback).all())
+            if name == "grid":
+                surface = [grid.lookup(x, y)[2] for x, y in pts]
+                check(f"{n} grid: no pixel left unresolved", not raised.any())
+            else:
+                surface = index.nearest_surface_many(pts)
+                check(f"{n} models: raises only on the surface without a model",
+                      raised.any() and not np.isin(surface[raised], list(models)).any())
+            check(f"{n} {name}: surface", (many[:, PA_SURFACE] == surface).all())
+            print(f"{n:>6} points, {name:>6}: predict_many {t_many * 1e3:7.2f} ms, "
+                  f"predict loop {t_single * 1e3:8.2f} ms, max diff {err:.2e}, "
+                  f"fallback {int(fallback.sum())}, raised {int(raised.sum())}")
+
+    sys.exit(1 if failures else 0)
@@ -5,10 +5,11 @@ from dotenv import load_dotenv
 load_dotenv(override=True)
 from flask_login import LoginManager, login_user, logout_user, login_required, UserMixin, current_user
 from app_state import app_state, GimbalState, ControlMode
-import joblib
 from app_utils import get_cpu_temp, register_shutdown
 from hardware import laser_pin, water_gun_pin, fan_pin, hall_sensor_1, hall_sensor_2, enable_pin_1, enable_pin_2
-from motors import Motor1, Motor2, homing_procedure, DEGREES_PER_STEP_1, DEGREES_PER_STEP_2
+from motors import Motor1, Motor2, gimbal, homing_procedure, step_scheduler, DEGREES_PER_STEP_1, DEGREES_PER_STEP_2
+from motors import wrap_step_target, STEPPER_MAX_SPEED, STEPPER_ACCELERATION
+from tracking import TrackingController
 from camera import capture_and_process, detect_in_background, stream_frames_over_zmq, set_detector
 from flask_socketio import SocketIO, emit
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
@@ -18,11 +19,15 @@ import logging
 import threading
 import time
 import json
-import cv2 
 import numpy as np
 from gimbal_client import listen_for_telemetry, update_gimbal_status_from_telemetry
+from latency_trace import frame_traces
+from angle_grid import load_angle_grid, AnglePredictor, FRAME_WIDTH, FRAME_HEIGHT
+from surface_index import load_surface_index
+from surface_model import load_surface_models
 from motors import request_home as local_request_home
 from gimbal_client import request_home as remote_request_home
+from gimbal_client import sample_trajectory, send_trajectory, link_delay, clock_stats
 
 
 detector_name = "none"
@@ -50,21 +55,56 @@ models_path = os.path.join(script_dir, "models")
 with open(os.path.join(script_dir, 'surfaces.json'), 'r') as f:
     surfaces = json.load(f)
 
-# Load model mapping
-with open(os.path.join(models_path, 'model_mapping.json'), 'r') as f:
-    model_mapping = json.load(f)
-
-# Load all models into memory
-surface_models = {}
-for idx_str, model_filename in model_mapping.items():
-    idx = int(idx_str)
-    model_path = os.path.join(script_dir, model_filename)
-    surface_models[idx] = joblib.load(model_path)
+# Load the calibration models; the compact .npz needs only NumPy, the
+# sklearn pickles from model_mapping.json are kept as a fallback
+compact_models_path = os.path.join(models_path, 'surface_models.npz')
+if os.path.exists(compact_models_path):
+    surface_models = load_surface_models(compact_models_path)
+    surface_model_files = [compact_models_path]
+else:
+    import joblib
+    with open(os.path.join(models_path, 'model_mapping.json'), 'r') as f:
+        model_mapping = json.load(f)
+    surface_models = {}
+    surface_model_files = []
+    for idx_str, model_filename in model_mapping.items():
+        idx = int(idx_str)
+        model_path = os.path.join(script_dir, model_filename)
+        surface_models[idx] = joblib.load(model_path)
+        surface_model_files.append(model_path)
+    logger.warning("models/surface_models.npz not found, loaded sklearn pickles instead "
+                   "(run export_surface_models.py)")
 
 logger.info(f"Loaded {len(surface_models)} models.")
 
+# Compile surfaces.json into label/nearest-surface rasters (cached under models/)
+surface_index = load_surface_index(
+    surfaces, os.path.join(script_dir, 'surfaces.json'),
+    os.path.join(models_path, 'surface_index.npz'), FRAME_WIDTH, FRAME_HEIGHT)
+
+# Bake the models into a dense pixel -> angle grid (cached under models/)
+angle_grid = load_angle_grid(
+    surface_index, surface_models,
+    os.path.join(script_dir, 'surfaces.json'),
+    surface_model_files,
+    models_path)
+angle_predictor = AnglePredictor(surface_index, surface_models, angle_grid,
+                                 (DEGREES_PER_STEP_1, DEGREES_PER_STEP_2))
+
 pcs = set()
 
+# Lead aiming: feed the tracked target's velocity forward to the tracking controller
+LEAD_AIM = os.getenv("LEAD_AIM", "True") == "True"
+LEAD_MAX_HORIZON = float(os.getenv("LEAD_MAX_HORIZON", 0.5))  # seconds a target is extrapolated
+VELOCITY_PROBE = 0.1  # seconds of target motion used to turn pixel velocity into step velocity
+TRACKING_IDLE_RESET = 0.5  # seconds without a new target after which tracking restarts from the motors
+# Remote gimbal: upload each detection's predicted path and let the Gimbal Pi play it back
+REMOTE_TRAJECTORY = (os.getenv("USE_REMOTE_GIMBAL", "False") == "True"
+                     and os.getenv("REMOTE_TRAJECTORY", "False") == "True")
+
+# Period of target/control updates in run_motor_loop; steps are issued in between
+CONTROL_PERIOD = 0.001
+
 motor_active = False
 water_gun_active = False
 
@@ -142,6 +182,39 @@ def offer_proxy():
         return jsonify({"error": "Failed to connect to WebRTC server"}), 500
 
 
+@app.route("/admin/traces")
+@login_required
+def admin_traces():
+    if not session.get("is_admin"):
+        return jsonify({"error": "Admin only"}), 403
+    n = request.args.get("n", default=100, type=int)
+    return jsonify(frame_traces.last(n))
+
+
+@app.route("/admin/stepper_stats")
+@login_required
+def admin_stepper_stats():
+    if not session.get("is_admin"):
+        return jsonify({"error": "Admin only"}), 403
+    return jsonify(step_scheduler.stats())
+
+
+@app.route("/admin/latency")
+@login_required
+def admin_latency():
+    if not session.get("is_admin"):
+        return jsonify({"error": "Admin only"}), 403
+    return jsonify(frame_traces.histograms())
+
+
+@app.route("/admin/clock")
+@login_required
+def admin_clock():
+    if not session.get("is_admin"):
+        return jsonify({"error": "Admin only"}), 403
+    return jsonify(clock_stats())
+
+
 @socketio.on('connect')
 def on_connect():
     enable_pin_1.on()
@@ -222,8 +295,7 @@ def handle_click_target(data):
     theta1, theta2 = predict_angles(x, y)
     steps1 = int(theta1 / DEGREES_PER_STEP_1)
     steps2 = int(theta2 / DEGREES_PER_STEP_2)
-    Motor1.move_to(steps1)
-    Motor2.move_to(steps2)
+    gimbal.move_to((steps1, steps2))
     emit('movement_ack', {
         'theta1': round(theta1, 2),
         'theta2': round(theta2, 2),
@@ -246,7 +318,7 @@ def handle_set_motor_position(data: dict):
         delta = target_deg - current_deg
         if abs(delta) < 1:
             return  # skip tiny moves
-        Motor1.move_to(int(target_deg / DEGREES_PER_STEP_1))
+        gimbal.move_to((int(target_deg / DEGREES_PER_STEP_1), None))
 
     elif motor_num == 2:
         current_deg = Motor2.current_position() * DEGREES_PER_STEP_2
@@ -254,7 +326,7 @@ def handle_set_motor_position(data: dict):
         delta = target_deg - current_deg
         if abs(delta) < 1:
             return
-        Motor2.move_to(int(target_deg / DEGREES_PER_STEP_2))
+        gimbal.move_to((None, int(target_deg / DEGREES_PER_STEP_2)))
 
 
 @socketio.on('change_model')
@@ -346,60 +418,47 @@ def handle_update_target(data):
         socketio.emit("target_updated", { "target": target })
 
 
-def point_in_polygon(polygon, x, y):
-    """Returns True if point (x, y) is inside polygon."""
-    poly_np = np.array(polygon, np.int32)
-    return cv2.pointPolygonTest(poly_np, (x, y), False) >= 0
-
-
 def predict_angles(x, y):
-    # 1. Find which surface the pixel belongs to
-    for idx, surface in enumerate(surfaces):
-        if point_in_polygon(surface["points"], x, y):
-            model = surface_models[idx]
-            theta1, theta2 = model.predict([[x, y]])[0]
-            return theta1, theta2
-
-    # 2. If no match, optionally: find closest polygon
-    closest_idx = find_closest_surface(x, y)
-    if closest_idx is not None:
-        model = surface_models[closest_idx]
-        theta1, theta2 = model.predict([[x, y]])[0]
-        return theta1, theta2
-
-    # 3. Otherwise, fallback
-    raise ValueError("Pixel not inside any surface and no close polygon found.")
-
-
-def find_closest_surface(x, y):
-    min_dist = float('inf')
-    closest_idx = None
-    for idx, surface in enumerate(surfaces):
-        center_x = np.mean([p[0] for p in surface["points"]])
-        center_y = np.mean([p[1] for p in surface["points"]])
-        dist = np.hypot(center_x - x, center_y - y)
-        if dist < min_dist:
-            min_dist = dist
-            closest_idx = idx
-    return closest_idx
-
-
-def perform_interpolated_movement(current_coords, last_steps):
-    x, y = current_coords
-    theta1, theta2 = predict_angles(x, y)
-    steps1 = int(theta1 / DEGREES_PER_STEP_1)
-    steps2 = int(theta2 / DEGREES_PER_STEP_2)
+    return angle_predictor.predict(x, y)
 
-    if last_steps == (None, None):
-        last_steps = (Motor1.current_position(), Motor2.current_position())
 
-    interp1 = int(last_steps[0] + (steps1 - last_steps[0]) * 0.1)
-    interp2 = int(last_steps[1] + (steps2 - last_steps[1]) * 0.1)
+def predict_angles_many(points):
+    """Batched predict_angles, see AnglePredictor.predict_many for the columns (PA_*)."""
+    return angle_predictor.predict_many(points)
 
-    Motor1.move_to(interp1)
-    Motor2.move_to(interp2)
 
-    return (interp1, interp2)
+def aim_setpoint(coords, motion):
+    """
+    Step targets for a detected pixel and, when the target is moving, the
+    step velocities that keep the aim on it, from predict_angles at the
+    pixel and at where it will be VELOCITY_PROBE seconds later.
+    """
+    x, y = coords
+    theta1, theta2 = predict_angles(x, y)
+    positions = [theta1 / DEGREES_PER_STEP_1, theta2 / DEGREES_PER_STEP_2]
+    if motion is None:
+        return positions, [0.0, 0.0]
+    vx, vy, _ = motion
+    ahead1, ahead2 = predict_angles(x + vx * VELOCITY_PROBE, y + vy * VELOCITY_PROBE)
+    velocities = [(ahead1 - theta1) / (VELOCITY_PROBE * DEGREES_PER_STEP_1),
+                  (ahead2 - theta2) / (VELOCITY_PROBE * DEGREES_PER_STEP_2)]
+    return positions, velocities
+
+
+def aim_path(coords, motion, now):
+    """
+    path(t) for sample_trajectory(): the angles to aim at t seconds after
+    `now`, moving the target along its pixel velocity from its capture time.
+    """
+    x, y = coords
+    if motion is None:
+        return lambda t: predict_angles(x, y)
+    vx, vy, captured = motion
+
+    def path(t):
+        ahead = min(max(now - captured + t, 0.0), LEAD_MAX_HORIZON)
+        return predict_angles(x + vx * ahead, y + vy * ahead)
+    return path
 
 
 def run_motor_loop():
@@ -407,23 +466,49 @@ def run_motor_loop():
         logger.info("Starting homing procedure")
         homing_procedure()
 
-        last_steps = (None, None)
-        current_coords = None
+        controller = TrackingController(STEPPER_MAX_SPEED, STEPPER_ACCELERATION,
+                                        max_extrapolation=LEAD_MAX_HORIZON)
+        pending_trace = None  # trace of a new target not yet turned into a move
 
         while True:
             if motor_active and app_state.target_lock.is_set():
                 app_state.target_lock.clear()
                 new_coords = app_state.latest_target_coords
                 if new_coords != (None, None):
-                    current_coords = new_coords  # Snap to the latest target
-
-            if motor_active and current_coords:
-                last_steps = perform_interpolated_movement(current_coords, last_steps)
+                    now = time.perf_counter()
+                    motion = app_state.latest_target_motion if LEAD_AIM else None
+                    if REMOTE_TRAJECTORY:
+                        send_trajectory(sample_trajectory(aim_path(new_coords, motion, now)), start_at=now)
+                        trace = app_state.latest_target_trace
+                        if trace is not None:
+                            trace.mark("move")
+                        continue
+                    # update() runs every loop, so only a recent target says the follower still
+                    # matches the motors; after target loss or a manual move start from where they are
+                    if controller.last_target is None or now - controller.last_target > TRACKING_IDLE_RESET:
+                        controller.reset([Motor1.current_position(), Motor2.current_position()], now)
+                    # setpoints are only recomputed here, once per detection
+                    positions, velocities = aim_setpoint(new_coords, motion)
+                    positions = [wrap_step_target(positions[0], controller.x[0], DEGREES_PER_STEP_1),
+                                 wrap_step_target(positions[1], controller.x[1], DEGREES_PER_STEP_2)]
+                    controller.set_target(positions, velocities, motion[2] if motion else now)
+                    pending_trace = app_state.latest_target_trace
+                    if pending_trace is not None:
+                        pending_trace.mark("predict")
+
+            if motor_active and controller.ref is not None:
+                # remote setpoints land a link delay from now, aim for then
+                command = controller.update(time.perf_counter() + link_delay())
+                if command is not None:
+                    gimbal.track(*command)
+                    if pending_trace is not None:
+                        pending_trace.mark("move")
+                        pending_trace = None
 
             if app_state.gimbal_state == GimbalState.READY:
-                Motor1.run()
-                Motor2.run()
-            time.sleep(0.001)
+                step_scheduler.service(CONTROL_PERIOD)
+            else:
+                time.sleep(CONTROL_PERIOD)
     except Exception as e:
         logger.exception("Error in motor_loop")
 
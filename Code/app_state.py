@@ -7,7 +7,9 @@ from enum import Enum
 
 class GimbalState(Enum):
     HOMING = "homing"
-    HOMING_ERROR = "homing_error"
+    HOMING_ERROR = "homing_error"                  # both axes failed to home
+    HOMING_ERROR_MOTOR1 = "homing_error_motor1"
+    HOMING_ERROR_MOTOR2 = "homing_error_motor2"
     GIMBAL_NOT_FOUND = "gimbal_not_found"
     READY = "ready"
     UNKNOWN = "unknown"
@@ -24,6 +26,10 @@ class AppState:
 
         # Target for motor movement
         self.latest_target_coords = (None, None)
+        # (vx px/s, vy px/s, capture time) of the tracked target, for lead aiming
+        self.latest_target_motion = None
+        # FrameTrace of the frame the latest target came from
+        self.latest_target_trace = None
         self.target_lock = Event()
 
         # Viewer tracking and control
@@ -43,6 +49,7 @@ class AppState:
         
         self.motor1_deg = 0.0
         self.motor2_deg = 0.0
+        self.motor_position_time = None  # perf_counter() time motor1/2_deg were sampled, remote only
         self.laser_on = False
         self.sensor1_triggered = False
         self.sensor2_triggered = False
@@ -54,6 +61,7 @@ class AppState:
         
         self.shutdown_event = threading.Event()
         self.home_requested = False
+        self.homing_errors = {}  # motor number -> why it failed in the last homing
         
         # ZMQ telemetry
         self.gimbal_status = {}
@@ -2,14 +2,24 @@
 import os
 import signal
 from hardware import fan_pin, laser_pin, water_gun_pin, hall_sensor_1, hall_sensor_2
-from motors import Motor1, Motor2
+from motors import Motor1, Motor2, position_journal, stepper_process
 from app_state import app_state
 import time
 import threading
 
+# vcgencmd spawns a process, so readings are reused for this many seconds
+CPU_TEMP_MAX_AGE = 5.0
+_cpu_temp = (None, 0.0)  # (reading, monotonic time taken)
+
+
 def get_cpu_temp():
-    temp = os.popen("vcgencmd measure_temp").readline()
-    return float(temp.replace("temp=", "").replace("'C", ""))
+    global _cpu_temp
+    reading, taken = _cpu_temp
+    if reading is None or time.monotonic() - taken > CPU_TEMP_MAX_AGE:
+        temp = os.popen("vcgencmd measure_temp").readline()
+        reading = float(temp.replace("temp=", "").replace("'C", ""))
+        _cpu_temp = (reading, time.monotonic())
+    return reading
 
 
 def graceful_exit(signum, frame):
@@ -23,8 +33,12 @@ def graceful_exit(signum, frame):
         water_gun_pin.off()
         Motor1.disable_outputs()
         Motor2.disable_outputs()
+        if position_journal is not None:
+            position_journal.mark_clean()
         hall_sensor_1.close()
         hall_sensor_2.close()
+        if stepper_process is not None:
+            stepper_process.stop()  # os._exit skips cleanup, this frees the shared memory
         time.sleep(0.2)
         os._exit(0)  # hard exit to avoid gevent issues
 
@@ -10,7 +10,7 @@ from app_state import app_state, GimbalState
 # Set CALIBRATION_MODE early
 os.environ["CALIBRATION_MODE"] = "1"
 
-from motors import Motor1, Motor2, homing_procedure, DEGREES_PER_STEP_1, DEGREES_PER_STEP_2
+from motors import Motor1, Motor2, gimbal, homing_procedure, step_scheduler, DEGREES_PER_STEP_1, DEGREES_PER_STEP_2
 from gimbal_client import listen_for_telemetry, update_gimbal_status_from_telemetry
 
 import time
@@ -267,8 +267,7 @@ def set_angles():
     steps1 = int(theta1 / DEGREES_PER_STEP_1)
     steps2 = int(theta2 / DEGREES_PER_STEP_2)
 
-    Motor1.move_to(steps1)
-    Motor2.move_to(steps2)
+    gimbal.move_to((steps1, steps2))
 
     return jsonify({'status': 'ok'})
 
@@ -315,10 +314,10 @@ def update_slider():
 def move_motor_to_position(motor_num, position_deg):
     if motor_num == 1:
         steps = int(position_deg / DEGREES_PER_STEP_1)
-        Motor1.move_to(steps)
+        gimbal.move_to((steps, None))
     elif motor_num == 2:
         steps = int(position_deg / DEGREES_PER_STEP_2)
-        Motor2.move_to(steps)
+        gimbal.move_to((None, steps))
 
 @app.route('/set_motor_position')
 def set_motor_position():
@@ -417,9 +416,7 @@ def motor_loop():
     homing_procedure()
     print("[INFO] Homing complete.")
     while True:
-        Motor1.run()
-        Motor2.run()
-        time.sleep(0.001)
+        step_scheduler.service(0.01)
 
 if __name__ == '__main__':
     laser_pin.on()  # 🚨 TURN ON LASER HERE
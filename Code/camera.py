@@ -15,11 +15,13 @@ from detectors import YoloV5VinoDetector
 from detectors import YoloV8SegDetector
 from detectors import YoloV8OpenVINOSegDetector
 import threading
+import itertools
 from app_state import app_state, GimbalState
 import zmq
 import base64
 import cv2
-from multi_tracker import Sort
+from latency_trace import FrameTrace, frame_traces
+from multi_tracker import Sort, COL_ID, COL_DET, COL_CLASS, COL_VX, COL_VY
 
 
 logger = logging.getLogger("Camera")
@@ -66,6 +68,7 @@ yolov8_xml = os.path.expanduser(
 frame_lock = Lock()
 frame_available = Event()
 latest_frame = None
+latest_frame_trace = None  # FrameTrace with capture/convert stamps of latest_frame
 
 def tiled_detect(frame, detector, tile_size=(1280, 1280), overlap=200):
     """
@@ -136,12 +139,16 @@ def tiled_detect(frame, detector, tile_size=(1280, 1280), overlap=200):
 
 
 def capture_and_process():
-    global latest_frame, latest_detections
+    global latest_frame, latest_frame_trace, latest_detections
 
+    frame_ids = itertools.count()
     while not app_state.shutdown_event.is_set():
         try:
             frame = picam2.capture_array()
+            trace = FrameTrace(next(frame_ids))
+            trace.mark("capture")
             frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+            trace.mark("convert")
 
             # grab snapshot of detections & tracked center
             with detection_lock:
@@ -186,6 +193,7 @@ def capture_and_process():
             # publish
             with frame_lock:
                 latest_frame = frame.copy()
+                latest_frame_trace = trace
                 frame_available.set()
 
         except Exception:
@@ -237,8 +245,11 @@ def detect_in_background():
             # 1) grab current frame copy
             with frame_lock:
                 frame = latest_frame.copy()
+                trace = latest_frame_trace.copy()
+            frame_time = trace.t_capture
 
             # 2) run (tiled) detection
+            trace.mark("detect_start")
             with detector_lock:
                 if detector:
                     t0 = time.perf_counter()
@@ -250,6 +261,7 @@ def detect_in_background():
                     infer_ms = (time.perf_counter() - t0)*1e3
                 else:
                     dets, infer_ms = [], 0.0
+            trace.mark("detect_end")
 
             # 3) normalize boxes
             for d in dets:
@@ -262,59 +274,53 @@ def detect_in_background():
 
             # 5) build SORT input array
             if dets:
-                dets_arr = np.array([[*d.box, d.confidence] for d in dets], dtype=np.float32)
+                dets_arr = np.array([[*d.box, d.confidence, d.class_id] for d in dets], dtype=np.float32)
             else:
-                dets_arr = np.empty((0,5), dtype=np.float32)
-
-            # 6) run SORT to get tracks: [[x1,y1,x2,y2,track_id],…]
-            tracks = multi_tracker.update(dets_arr)
-
-            # 7) map tracks back to Detection objects *only* if we have any dets
-            tracked_objs = []
-            if dets and tracks.shape[0] > 0:
-                for x1, y1, x2, y2, tid in tracks:
-                    # find which detection this corresponds to by center proximity
-                    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-                    best = min(
-                        dets,
-                        key=lambda d: ((d.box[0] + d.box[2]) / 2 - cx) ** 2 +
-                                      ((d.box[1] + d.box[3]) / 2 - cy) ** 2
-                    )
-                    tracked_objs.append({
-                        "id":    int(tid),
-                        "label": best.label.lower(),
-                        "conf":  best.confidence,
-                        "box":   best.box
-                    })
+                dets_arr = np.empty((0,6), dtype=np.float32)
 
-            # 8) decide which one to drive the gimbal
+            # 6) run SORT to get tracks: [[x1,y1,x2,y2,track_id,det_idx,class_id,conf,vx,vy],…]
+            tracks = multi_tracker.update(dets_arr, timestamp=frame_time)
+            trace.mark("track")
+
+            # 7) keep only tracks matched to a detection of the selected class
             selected_label = (
                 app_state.tracking_target.lower()
                 if app_state.tracking_target else None
             )
-            candidates = [
-                o for o in tracked_objs
-                if selected_label and o["label"] == selected_label
+            target_class_ids = [
+                d.class_id for d in dets
+                if selected_label and d.label.lower() == selected_label
             ]
-            # filter to only objects of that class
-            if candidates:
+            candidates = tracks[
+                (tracks[:, COL_DET] >= 0) &
+                np.isin(tracks[:, COL_CLASS], target_class_ids)
+            ]
+
+            # 8) decide which one to drive the gimbal
+            if candidates.shape[0] > 0:
                 # pick lowest ID among matching class
-                best = min(candidates, key=lambda o: o["id"])
-                x1,y1,x2,y2 = best["box"]
+                best = candidates[np.argmin(candidates[:, COL_ID])]
+                x1,y1,x2,y2 = dets[int(best[COL_DET])].box
                 cx, cy = (x1+x2)//2, (y1+y2)//2
+                # stamp before publishing, the motor loop stamps predict/move as soon as it sees the trace
+                trace.mark("select")
+                app_state.latest_target_motion = (best[COL_VX], best[COL_VY], frame_time)
                 app_state.latest_target_coords = (cx, cy)
+                app_state.latest_target_trace = trace
                 app_state.target_lock.set()
             else:
+                trace.mark("select")
                 app_state.target_lock.clear()
+            frame_traces.push(trace)
 
             # 9) (optional) timing log
             loop_ms = (time.perf_counter() - loop_start)*1e3
             fps = 1000.0/loop_ms if loop_ms>0 else float('inf')
             # logger.info(f"Infer {infer_ms:.1f}ms, loop {loop_ms:.1f}ms, FPS {fps:.1f}")
             # # Print confidence and box for each tracked object
-            # for obj in tracked_objs:
-            #     logger.info(f"Track ID {obj['id']}, Label: {obj['label']}, "
-            #                 f"Confidence: {obj['conf']:.2f}, Box: {obj['box']}")
+            # for trk in tracks:
+            #     logger.info(f"Track ID {int(trk[COL_ID])}, Class: {int(trk[COL_CLASS])}, "
+            #                 f"Confidence: {trk[COL_CONF]:.2f}, Box: {trk[:4]}")
 
         except Exception:
             logger.exception("Exception in detect_in_background")
@@ -0,0 +1,104 @@
+# clock_sync.py
+#
+# NTP-style estimate of the Gimbal Pi's clock as seen from the camera Pi,
+# so commands can be scheduled and telemetry timed in one timebase.
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger("App")
+
+CLOCK_SYNC_INTERVAL = float(os.getenv("CLOCK_SYNC_INTERVAL", 1.0))  # seconds between exchanges once synced
+CLOCK_SYNC_WINDOW = 64       # exchanges kept for the fit
+CLOCK_SYNC_BURST = 8         # quick exchanges right after connecting
+CLOCK_SYNC_JUMP = 0.05       # seconds off the estimate, beyond the rtt bound, that count as a clock jump
+
+
+class ClockSync:
+    """
+    Offset and drift of a remote clock against `clock`, from exchanges of
+    four timestamps: t0 local send, t1 remote receive, t2 remote send, t3
+    local receive. Each gives
+
+        offset = ((t1 - t0) + (t2 - t3)) / 2     rtt = (t3 - t0) - (t2 - t1)
+
+    and the true offset is within rtt / 2 of it, so queueing delays only
+    widen the error bound. The estimate is a least squares line through the
+    lowest-rtt quarter of the last CLOCK_SYNC_WINDOW samples; its slope is
+    the drift. A sample outside the bound of the current estimate means the
+    remote clock jumped (e.g. the Gimbal Pi rebooted) and starts over.
+    """
+
+    def __init__(self, clock=time.perf_counter, window=CLOCK_SYNC_WINDOW):
+        self.clock = clock
+        self.samples = deque(maxlen=window)  # (local midpoint, offset, rtt)
+        self.offset = 0.0   # remote - local at ref, seconds
+        self.drift = 0.0    # seconds per second
+        self.ref = 0.0      # local time the line is anchored at
+        self.rtt = None     # last round trip, seconds
+        self.srtt = None    # smoothed round trip, seconds
+        self.resets = 0
+        self._lock = threading.Lock()
+
+    @property
+    def synced(self):
+        return len(self.samples) > 0
+
+    def add(self, t0, t1, t2, t3):
+        """Record one exchange; returns its (offset, rtt)."""
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        rtt = max((t3 - t0) - (t2 - t1), 0.0)
+        local = (t0 + t3) / 2
+        with self._lock:
+            if self.samples and abs(offset - self._predict(local)) > rtt / 2 + self._bound() + CLOCK_SYNC_JUMP:
+                logger.warning(f"[ClockSync] Remote clock jumped by {offset - self._predict(local):+.3f} s, resyncing")
+                self.samples.clear()
+                self.resets += 1
+            self.samples.append((local, offset, rtt))
+            self.rtt = rtt
+            self.srtt = rtt if self.srtt is None else 0.875 * self.srtt + 0.125 * rtt  # as TCP does
+            self._fit()
+        return offset, rtt
+
+    def _predict(self, local):
+        return self.offset + self.drift * (local - self.ref)
+
+    def _bound(self):
+        """Error bound of the current estimate: half the best rtt in the fit."""
+        return min(s[2] for s in self.samples) / 2
+
+    def _fit(self):
+        best = sorted(self.samples, key=lambda s: s[2])[:max(len(self.samples) // 4, 2)]
+        self.ref = sum(s[0] for s in best) / len(best)
+        self.offset = sum(s[1] for s in best) / len(best)
+        spread = sum((s[0] - self.ref) ** 2 for s in best)
+        # drift needs samples spread over time, a burst alone only gives the offset
+        self.drift = (sum((s[0] - self.ref) * (s[1] - self.offset) for s in best) / spread
+                      if spread > 1.0 else 0.0)
+
+    def remote_time(self, local=None):
+        """Remote clock reading at local time `local` (default: now)."""
+        local = self.clock() if local is None else local
+        with self._lock:
+            return local + self._predict(local)
+
+    def local_time(self, remote):
+        """Local time at which the remote clock reads `remote`."""
+        with self._lock:
+            # remote = local + offset + drift * (local - ref), solved for local
+            return (remote - self.offset + self.drift * self.ref) / (1.0 + self.drift)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "synced": self.synced,
+                "offset_s": self._predict(self.clock()) if self.samples else None,
+                "drift_ppm": self.drift * 1e6,
+                "rtt_ms": None if self.rtt is None else self.rtt * 1e3,
+                "srtt_ms": None if self.srtt is None else self.srtt * 1e3,
+                "min_rtt_ms": self._bound() * 2e3 if self.samples else None,
+                "samples": len(self.samples),
+                "resets": self.resets,
+            }
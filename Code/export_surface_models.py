@@ -0,0 +1,17 @@
+# export_surface_models.py
+# One-off conversion of the sklearn pickles listed in models/model_mapping.json
+# into models/surface_models.npz, the format app.py loads without sklearn.
+import json
+import joblib
+from surface_model import PolySurfaceModel, save_surface_models
+
+with open('models/model_mapping.json', 'r') as f:
+    model_mapping = json.load(f)
+
+models = {
+    int(idx): PolySurfaceModel.from_sklearn(joblib.load(path))
+    for idx, path in model_mapping.items()
+}
+save_surface_models('models/surface_models.npz', models)
+
+print(f"✅ Exported {len(models)} surface models to models/surface_models.npz")
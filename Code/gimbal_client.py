@@ -2,16 +2,31 @@
 
 import os
 import time
+import json
+import heapq
+import itertools
 import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 import zmq
 
 from app_state import app_state, GimbalState
+from gimbal_protocol import GIMBAL_BINARY, TELEMETRY_TOPICS, encode_move2, decode_reply, decode_telemetry
+from clock_sync import ClockSync, CLOCK_SYNC_INTERVAL, CLOCK_SYNC_BURST
 
 
 USE_REMOTE_GIMBAL = os.getenv("USE_REMOTE_GIMBAL", "False") == "True"
 GIMBAL_HOST       = os.getenv("GIMBAL_HOST", "127.0.0.1")
 GIMBAL_PORT       = int(os.getenv("GIMBAL_PORT",     5555))
 GIMBAL_SUB_PORT   = int(os.getenv("GIMBAL_SUB_PORT", 5556))
+GIMBAL_SETPOINT_PORT = int(os.getenv("GIMBAL_SETPOINT_PORT", 5557))
+
+# how long (s) a command waits for its reply
+COMMAND_TIMEOUT = 0.5
+
+# predicted paths are uploaded as this many seconds of waypoints, dt apart
+TRAJECTORY_HORIZON = float(os.getenv("TRAJECTORY_HORIZON", 0.5))
+TRAJECTORY_DT = 0.05
 
 # how long (s) w/o telemetry before we call it "disconnected"
 _LOST_THRESHOLD = 1.0
@@ -19,34 +34,318 @@ _LOST_THRESHOLD = 1.0
 # internal trackers:
 _received_first_packet = False
 _prev_gimbal_state    = None
+_telemetry_latency    = None  # seconds from the Gimbal Pi stamping a sample to us receiving it
+_telemetry_dropped    = 0     # position samples lost between the Gimbal Pi and us
+
+
+class GimbalClient:
+    """
+    One persistent DEALER connection to gimbal_server, shared by all threads.
+    Every command gets an "id" that the server echoes back, so several can be
+    in flight and replies are matched whatever order they come in. Only the
+    client's I/O thread touches the DEALER socket: callers hand commands over
+    through an inproc PUSH socket and get a Future for the reply, so a slow
+    reply never blocks them. Commands without a reply after `timeout` seconds
+    resolve to {"error": "gimbal server timeout"}.
+
+    Aiming setpoints go through send_setpoint() instead: fire-and-forget
+    move2 messages on a separate PUSH connection to GIMBAL_SETPOINT_PORT.
+    A newer setpoint overwrites one that hasn't gone out yet, and both ends
+    set CONFLATE, so under load the server skips straight to the newest.
+
+    A background exchange of "sync" commands keeps clock_sync, the Gimbal
+    Pi's clock as seen from here. Once it has a sample, every command is
+    stamped with "t", its send time on the Gimbal Pi's clock.
+    """
+
+    def __init__(self, host=GIMBAL_HOST, port=GIMBAL_PORT, setpoint_port=GIMBAL_SETPOINT_PORT,
+                 timeout=COMMAND_TIMEOUT, context=None, binary=GIMBAL_BINARY):
+        self.ctx = context or zmq.Context.instance()
+        self.binary = binary  # move2 as a packed struct instead of JSON
+        self.address = f"tcp://{host}:{port}"
+        self.setpoint_address = f"tcp://{host}:{setpoint_port}"
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._pending = {}    # id -> Future
+        self._stamps = {}     # id -> local send time, for requests that want t0/t3 in the reply
+        self._deadlines = []  # heap of (deadline, id)
+        self._lock = threading.Lock()       # guards _pending
+        self._send_lock = threading.Lock()  # guards _push
+        self._inproc = f"inproc://gimbal-client-{id(self)}"
+        # a fresh session per client, so the server restarts its stale check instead of
+        # comparing against sequence numbers of an earlier run
+        self._session = int.from_bytes(os.urandom(4), "little")
+        self._seq = itertools.count(1)
+        self._setpoint = None  # (seq, motor1 deg, motor2 deg) not sent yet
+        self.setpoints_queued = 0
+        self.setpoints_sent = 0
+        self.bytes_sent = 0
+        self.clock_sync = ClockSync()
+
+        self._pull = self.ctx.socket(zmq.PULL)
+        self._pull.bind(self._inproc)
+        self._push = self.ctx.socket(zmq.PUSH)
+        self._push.connect(self._inproc)
+        self._closed = threading.Event()
+        threading.Thread(target=self._io_loop, daemon=True).start()
+        threading.Thread(target=self._sync_loop, daemon=True).start()
+
+    def request(self, command: dict, timeout=None, stamp=False) -> Future:
+        """
+        Queue a command; the Future resolves to the reply dict. With stamp,
+        the reply also gets "t0" and "t3", the local clock_sync times the
+        I/O thread sent the command and received the reply.
+        """
+        future = Future()
+        request_id = next(self._ids)
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        if self.clock_sync.synced and not stamp:
+            command = dict(command, t=self.clock_sync.remote_time())
+        payload = json.dumps(dict(command, id=request_id)).encode()
+        with self._lock:
+            self._pending[request_id] = future
+            if stamp:
+                self._stamps[request_id] = None
+            heapq.heappush(self._deadlines, (deadline, request_id))
+        with self._send_lock:  # the PUSH socket may block when the I/O thread falls behind
+            self._push.send_multipart([b"%d" % request_id, payload])
+        return future
+
+    def send_setpoint(self, motor1_deg, motor2_deg):
+        """
+        Aim both axes with one move2; None leaves an axis where it is. It
+        replaces a setpoint that hasn't gone out yet, keeping that one's
+        angle for an axis this one leaves alone.
+        """
+        with self._lock:
+            wake = self._setpoint is None
+            if not wake:
+                _, pending1, pending2 = self._setpoint
+                motor1_deg = pending1 if motor1_deg is None else motor1_deg
+                motor2_deg = pending2 if motor2_deg is None else motor2_deg
+            self._setpoint = (next(self._seq), motor1_deg, motor2_deg)
+            self.setpoints_queued += 1
+        if wake:
+            with self._send_lock:
+                self._push.send_multipart([b"S", b""])
+
+    def send(self, command: dict, timeout=None, stamp=False) -> dict:
+        """Blocking request()."""
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return self.request(command, timeout, stamp).result(timeout + 0.1)
+        except FutureTimeout:
+            return {"error": "gimbal server timeout"}
+
+    def sync_clock(self) -> bool:
+        """One clock_sync exchange; False when the server didn't answer it."""
+        reply = self.send({"cmd": "sync"}, stamp=True)
+        if "t1" not in reply or reply.get("t0") is None:
+            return False
+        self.clock_sync.add(reply["t0"], reply["t1"], reply["t2"], reply["t3"])
+        return True
+
+    def close(self):
+        self._closed.set()
+
+    def _sync_loop(self):
+        synced = 0  # exchanges since the server last answered
+        while not self._closed.wait(CLOCK_SYNC_INTERVAL if synced >= CLOCK_SYNC_BURST else 0.05):
+            synced = synced + 1 if self.sync_clock() else 0
+
+    def _resolve(self, request_id, reply):
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+            self._stamps.pop(request_id, None)
+        if entry is not None:
+            entry.set_result(reply)
+
+    def _send_setpoint(self, push):
+        with self._lock:
+            setpoint, self._setpoint = self._setpoint, None
+        if setpoint is None:
+            return
+        payload = encode_move2(0, self._session, *setpoint, binary=self.binary)  # no reply, so no request id
+        try:
+            push.send(payload, zmq.NOBLOCK)
+        except zmq.Again:
+            with self._lock:  # keep it unless a newer one came in meanwhile
+                self._setpoint = self._setpoint or setpoint
+            return
+        self.bytes_sent += len(payload)
+        self.setpoints_sent += 1
+
+    def _expire(self, now):
+        expired = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                expired.append(heapq.heappop(self._deadlines)[1])
+        for request_id in expired:  # already answered ones are no longer pending
+            self._resolve(request_id, {"error": "gimbal server timeout"})
+
+    def _io_loop(self):
+        dealer = self.ctx.socket(zmq.DEALER)
+        dealer.setsockopt(zmq.LINGER, 0)
+        dealer.setsockopt(zmq.IMMEDIATE, 1)  # hold commands here, where they can expire, while disconnected
+        dealer.connect(self.address)
+        setpoints = self.ctx.socket(zmq.PUSH)
+        setpoints.setsockopt(zmq.LINGER, 0)
+        setpoints.setsockopt(zmq.CONFLATE, 1)  # only the newest setpoint waits for the wire
+        setpoints.connect(self.setpoint_address)
+        poller = zmq.Poller()
+        poller.register(dealer, zmq.POLLIN)
+        poller.register(self._pull, zmq.POLLIN)
+
+        unsent = deque()  # (id, payload) held back while the server is unreachable
+        while not self._closed.is_set():
+            try:
+                socks = dict(poller.poll(10 if unsent or self._setpoint else 50))
+                if socks.get(self._pull) == zmq.POLLIN:
+                    while True:
+                        try:
+                            request_id, payload = self._pull.recv_multipart(zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        if request_id != b"S":  # b"S" only wakes us for a new setpoint
+                            unsent.append((int(request_id), payload))
+                # forward with the empty delimiter frame REP/ROUTER expect
+                while unsent:
+                    request_id, payload = unsent[0]
+                    if request_id in self._pending:
+                        if request_id in self._stamps:
+                            self._stamps[request_id] = self.clock_sync.clock()
+                        try:
+                            dealer.send_multipart([b"", payload], zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        self.bytes_sent += len(payload)
+                    unsent.popleft()
+                if socks.get(dealer) == zmq.POLLIN:
+                    while True:
+                        try:
+                            frames = dealer.recv_multipart(zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        received = self.clock_sync.clock()
+                        reply = decode_reply(frames[-1])
+                        request_id = reply.pop("id", None)
+                        sent = self._stamps.get(request_id)
+                        if sent is not None:
+                            reply["t0"], reply["t3"] = sent, received
+                        self._resolve(request_id, reply)
+                self._expire(time.monotonic())
+                self._send_setpoint(setpoints)
+            except Exception as e:
+                if not app_state.shutdown_event.is_set():
+                    print(f"[Gimbal Client Error] {e}")
+
+        dealer.close()
+        setpoints.close()
+        self._pull.close()
+        self._push.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gimbal_client() -> GimbalClient:
+    """The shared client, connected on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GimbalClient()
+        return _client
 
 
 def send_gimbal_command(command: dict) -> dict:
     """
-    Send REQ→REP with a 500 ms send/recv timeout.
+    Send a command over the shared connection and wait up to
+    COMMAND_TIMEOUT for the reply.
     """
     if not USE_REMOTE_GIMBAL:
         return {"error": "send_gimbal_command called in local mode"}
+    return get_gimbal_client().send(command)
 
-    ctx = zmq.Context.instance()
-    sock = ctx.socket(zmq.REQ)
-    sock.connect(f"tcp://{GIMBAL_HOST}:{GIMBAL_PORT}")
-    sock.setsockopt(zmq.SNDTIMEO, 500)
-    sock.setsockopt(zmq.RCVTIMEO, 500)
 
-    try:
-        sock.send_json(command)
-        poller = zmq.Poller()
-        poller.register(sock, zmq.POLLIN)
-        socks = dict(poller.poll(500))
-        if socks.get(sock) == zmq.POLLIN:
-            return sock.recv_json()
-        else:
-            return {"error": "gimbal server timeout"}
-    except Exception as e:
-        return {"error": str(e)}
-    finally:
-        sock.close()
+def send_gimbal_command_async(command: dict) -> Future:
+    """
+    Like send_gimbal_command() but returns at once; the Future resolves to
+    the reply. For commands whose reply the caller doesn't wait for.
+    """
+    if not USE_REMOTE_GIMBAL:
+        future = Future()
+        future.set_result({"error": "send_gimbal_command called in local mode"})
+        return future
+    return get_gimbal_client().request(command)
+
+
+def send_gimbal_setpoint(motor1_deg, motor2_deg) -> None:
+    """Aim both axes, None leaves one alone; latest-wins, see GimbalClient.send_setpoint()."""
+    if USE_REMOTE_GIMBAL:
+        get_gimbal_client().send_setpoint(motor1_deg, motor2_deg)
+
+
+def sample_trajectory(path, horizon=TRAJECTORY_HORIZON, dt=TRAJECTORY_DT) -> list:
+    """
+    Waypoints [t, θ1, θ2, ω1, ω2] for the trajectory command from a predicted
+    path: path(t) gives the (θ1, θ2) degrees to aim at t seconds from now.
+    Velocities are central differences over one sample.
+    """
+    points = []
+    steps = max(int(round(horizon / dt)), 1)
+    for i in range(steps + 1):
+        t = i * dt
+        theta1, theta2 = path(t)
+        ahead1, ahead2 = path(t + dt / 2)
+        behind1, behind2 = path(t - dt / 2)
+        points.append([t, theta1, theta2, (ahead1 - behind1) / dt, (ahead2 - behind2) / dt])
+    return points
+
+
+def send_trajectory(points, replace=True, delay=0.0, start_at=None) -> Future:
+    """
+    Upload waypoints to play on the Gimbal Pi; replace=False appends to the
+    one playing. start_at is the local perf_counter() time of t=0: once the
+    clocks are synced, the Gimbal Pi then starts the path at that instant,
+    skipping what the link delay ate, instead of `delay` after it arrives.
+    """
+    command = {"cmd": "trajectory", "points": points, "replace": replace, "delay": delay}
+    if start_at is not None and USE_REMOTE_GIMBAL and get_gimbal_client().clock_sync.synced:
+        command["start_at"] = get_gimbal_client().clock_sync.remote_time(start_at + delay)
+    return send_gimbal_command_async(command)
+
+
+def cancel_trajectory() -> Future:
+    return send_gimbal_command_async({"cmd": "trajectory", "cancel": True})
+
+
+def link_delay() -> float:
+    """
+    Seconds a command takes to reach the Gimbal Pi, half the smoothed round
+    trip; 0 in local mode or before the first clock sync.
+    """
+    if not USE_REMOTE_GIMBAL:
+        return 0.0
+    srtt = get_gimbal_client().clock_sync.srtt
+    return 0.0 if srtt is None else srtt / 2
+
+
+def gimbal_time(local=None):
+    """The Gimbal Pi's clock at local perf_counter() time `local` (default: now), or None before a sync."""
+    if not USE_REMOTE_GIMBAL or not get_gimbal_client().clock_sync.synced:
+        return None
+    return get_gimbal_client().clock_sync.remote_time(local)
+
+
+def clock_stats() -> dict:
+    """Clock sync state and link latencies for diagnostics."""
+    if not USE_REMOTE_GIMBAL:
+        return {"synced": False}
+    stats = get_gimbal_client().clock_sync.stats()
+    stats["telemetry_latency_ms"] = None if _telemetry_latency is None else _telemetry_latency * 1e3
+    stats["telemetry_dropped"] = _telemetry_dropped
+    return stats
 
 
 def request_home() -> dict:
@@ -61,21 +360,28 @@ def request_home() -> dict:
 
 def update_gimbal_status_from_telemetry(status: dict):
     """
-    Pulls all numeric/sensor fields into app_state,
-    then maps the incoming 'mode' string into app_state.gimbal_state.
+    Pulls the numeric/sensor fields present in one telemetry message into
+    app_state, then maps an incoming 'gimbal_state' string into
+    app_state.gimbal_state. Position messages carry the sample time "t".
     """
-    global _received_first_packet
+    global _received_first_packet, _telemetry_latency
 
     # 1) Raw telemetry always updates
-    app_state.motor1_deg        = status.get("motor1", 0.0)
-    app_state.motor2_deg        = status.get("motor2", 0.0)
-    app_state.laser_on          = status.get("laser", False)
-    app_state.sensor1_triggered = status.get("sensor1", False)
-    app_state.sensor2_triggered = status.get("sensor2", False)
-    app_state.gimbal_cpu_temp   = status.get("gimbal_cpu_temp", None)
-    app_state.home_requested    = status.get("home_requested", False)
-
-    # 2) Map the incoming string to your new GimbalState enum
+    for field, attr in (("motor1", "motor1_deg"), ("motor2", "motor2_deg"), ("laser", "laser_on"),
+                        ("sensor1", "sensor1_triggered"), ("sensor2", "sensor2_triggered"),
+                        ("gimbal_cpu_temp", "gimbal_cpu_temp"), ("home_requested", "home_requested")):
+        if field in status:
+            setattr(app_state, attr, status[field])
+    if "t" in status and get_gimbal_client().clock_sync.synced:
+        sampled = get_gimbal_client().clock_sync.local_time(status["t"])
+        _telemetry_latency = time.perf_counter() - sampled
+        if "motor1" in status:
+            app_state.motor_position_time = sampled
+
+    # 2) Only health messages carry the state
+    if "gimbal_state" not in status:
+        return
+    # Map the incoming string to your new GimbalState enum
     incoming_str = status.get("gimbal_state", None)
     try:
         incoming_state = GimbalState(incoming_str)
@@ -95,12 +401,13 @@ def update_gimbal_status_from_telemetry(status: dict):
 
 
 
-def listen_for_telemetry(callback):
+def listen_for_telemetry(callback, topics=TELEMETRY_TOPICS):
     """
-    Spawns a thread that:
+    Spawns a thread subscribed to `topics` (see gimbal_protocol) that:
       • on >_LOST_THRESHOLD of silence ⇒ sets DISCONNECTED
       • on first packet or any packet after a drop ⇒ restores previous state,
         then calls callback(msg) to do update_gimbal_status_from_telemetry(msg).
+    msg holds the fields of one topic's message.
     """
     if not USE_REMOTE_GIMBAL:
         return
@@ -108,18 +415,25 @@ def listen_for_telemetry(callback):
     ctx = zmq.Context()
     sock = ctx.socket(zmq.SUB)
     sock.connect(f"tcp://{GIMBAL_HOST}:{GIMBAL_SUB_PORT}")
-    sock.setsockopt_string(zmq.SUBSCRIBE, "")
+    for topic in topics:
+        sock.setsockopt(zmq.SUBSCRIBE, topic)
 
     def _worker():
-        global _prev_gimbal_state, _received_first_packet
+        global _prev_gimbal_state, _received_first_packet, _telemetry_dropped
 
         last_heard = None
+        last_seq = None
 
         while not app_state.shutdown_event.is_set():
             try:
                 if sock.poll(timeout=100):
-                    msg = sock.recv_json()
+                    topic, payload = sock.recv_multipart()
+                    msg = decode_telemetry(topic, payload)
                     now = time.time()
+                    if "seq" in msg:
+                        if last_seq is not None and msg["seq"] > last_seq:
+                            _telemetry_dropped += msg["seq"] - last_seq - 1
+                        last_seq = msg["seq"]
 
                     # 1st-ever or recovering from a drop?
                     if last_heard is None:
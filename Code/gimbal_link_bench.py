@@ -0,0 +1,171 @@
+# gimbal_link_bench.py
+#
+# Commands per second between the app and gimbal_server over loopback:
+# the old connect-per-command REQ socket against the persistent GimbalClient,
+# waiting for each reply and pipelined, how stale aiming gets under load,
+# and how closely clock sync follows a drifting server clock. The server
+# side is gimbal_server's CommandServer with stand-in handlers, so this
+# runs without gimbal hardware.
+import os
+import time
+import threading
+import zmq
+
+os.environ["USE_REMOTE_GIMBAL"] = "True"
+
+from gimbal_client import GimbalClient
+from gimbal_protocol import CommandServer
+
+HOST = "127.0.0.1"
+SLOW_REPLY = 0.2  # seconds the "slow" command takes on the server
+UPDATE_HZ = 500   # aiming updates per second in the setpoint stream test
+SERVER_WORK = 0.005  # seconds the server spends per command under tracking load
+# the stand-in Gimbal Pi clock: far off ours and running 80 ppm fast
+REMOTE_OFFSET = 1234.5
+REMOTE_DRIFT = 80e-6
+
+
+def remote_clock():
+    return REMOTE_OFFSET + time.perf_counter() * (1 + REMOTE_DRIFT)
+
+
+class EchoServer:
+    """
+    gimbal_server's CommandServer with stand-in handlers that take `work`
+    seconds per command or setpoint and remember the last motor1 target.
+    """
+
+    def __init__(self, ctx, port, work=0.0):
+        self.work = work
+        self.commands = 0
+        self.last_target = None
+        self.stop = threading.Event()
+        self.server = CommandServer(ctx, f"tcp://{HOST}:{port}", f"tcp://{HOST}:{port + 100}",
+                                    self.handle, self.apply_setpoint, pooled=("slow",))
+        threading.Thread(target=self.server.serve, args=(self.stop,), daemon=True).start()
+
+    def apply_setpoint(self, message):
+        self.commands += 1
+        time.sleep(self.work)
+        self.last_target = message["motor1"]
+        return "ok"
+
+    def handle(self, message):
+        cmd = message.get("cmd")
+        if cmd == "sync":
+            received = remote_clock()
+            time.sleep(self.work)
+            return {"t1": received, "t2": remote_clock()}
+        if cmd == "slow":
+            time.sleep(SLOW_REPLY)
+            return {"status": "ok"}
+        if cmd == "move2":
+            return {"status": self.apply_setpoint(message)}
+        self.commands += 1
+        time.sleep(self.work)
+        if cmd == "move" and message.get("motor") == 1:
+            self.last_target = message["position"]
+        return {"status": "ok"}
+
+
+def old_send(ctx, port, command):
+    """send_gimbal_command() before the persistent client: a new REQ socket per command."""
+    sock = ctx.socket(zmq.REQ)
+    sock.connect(f"tcp://{HOST}:{port}")
+    try:
+        sock.send_json(command)
+        if sock.poll(500):
+            return sock.recv_json()
+        return {"error": "gimbal server timeout"}
+    finally:
+        sock.close()
+
+
+def rate(n, fn):
+    t0 = time.perf_counter()
+    fn(n)
+    return n / (time.perf_counter() - t0)
+
+
+def stream(ctx, port, mode, seconds=2.0, slow_client=False):
+    """
+    Aim at UPDATE_HZ for `seconds` against a loaded server, optionally while
+    a second client keeps it busy with slow commands. Returns commands the
+    server handled, bytes sent and how long after the last update the
+    server applied the final target.
+    """
+    server = EchoServer(ctx, port, work=SERVER_WORK)
+    client = GimbalClient(HOST, port, port + 100, binary=mode == "move2 binary")
+    client.send({"cmd": "ping"}, timeout=2.0)
+    other = GimbalClient(HOST, port, port + 100)
+    server.commands = client.bytes_sent = 0
+    n = int(seconds * UPDATE_HZ)
+    for i in range(n):
+        angle = float(i)
+        if mode == "move x2":  # RemoteMotor.move_to() for each axis
+            client.request({"cmd": "move", "motor": 1, "position": angle}, timeout=60.0)
+            client.request({"cmd": "move", "motor": 2, "position": -angle}, timeout=60.0)
+        else:
+            client.send_setpoint(angle, -angle)
+        if slow_client and i % 50 == 0:
+            other.request({"cmd": "slow"}, timeout=60.0)
+        time.sleep(1.0 / UPDATE_HZ)
+    t_end = time.perf_counter()
+    while server.last_target != float(n - 1):
+        time.sleep(0.001)
+    lag = time.perf_counter() - t_end
+    client.close()
+    other.close()
+    server.stop.set()
+    time.sleep(0.1)
+    return n, server.commands, client.bytes_sent, lag
+
+
+if __name__ == "__main__":
+    ctx = zmq.Context.instance()
+    port = 5655
+    server = EchoServer(ctx, port)
+    command = {"cmd": "move", "motor": 1, "position": 12.5}
+
+    print(f"connect per command: {rate(500, lambda n: [old_send(ctx, port, command) for _ in range(n)]):8.0f} cmd/s")
+
+    client = GimbalClient(HOST, port, port + 100)
+    client.send(command, timeout=2.0)  # wait for the connection
+    print(f"persistent, blocking: {rate(5000, lambda n: [client.send(command) for _ in range(n)]):8.0f} cmd/s")
+
+    def pipelined(n):
+        futures = [client.request(command, timeout=10.0) for _ in range(n)]
+        assert all(f.result(5.0) == {"status": "ok"} for f in futures)
+    print(f"persistent, pipelined: {rate(20000, pipelined):7.0f} cmd/s")
+
+    # a slow reply only delays its own Future
+    t0 = time.perf_counter()
+    slow = client.request({"cmd": "slow"})
+    queued = time.perf_counter() - t0
+    slow.result(2.0)
+    print(f"slow command: request() returned after {queued * 1e6:.0f} us, "
+          f"reply after {(time.perf_counter() - t0) * 1e3:.0f} ms")
+    client.close()
+    server.stop.set()
+    time.sleep(0.1)
+
+    # aiming stream against a server that needs SERVER_WORK per command
+    runs = [("move x2", False), ("move2 json", False), ("move2 binary", False), ("move2 binary", True)]
+    for i, (mode, slow_client) in enumerate(runs):
+        updates, commands, wire, lag = stream(ctx, port + 1 + i, mode, slow_client=slow_client)
+        print(f"{mode:12s}{' + slow client' if slow_client else '':14s}: {updates} updates -> {commands:4d} commands, "
+              f"{wire:6d} bytes, final target applied {lag * 1e3:6.1f} ms after the last update")
+
+
+    # clock sync against the drifting stand-in clock, with the server busy SERVER_WORK per command
+    server = EchoServer(ctx, port + 10, work=SERVER_WORK)
+    client = GimbalClient(HOST, port + 10, port + 110)
+    t0 = time.perf_counter()
+    for at in (0.5, 5.0, 20.0):
+        time.sleep(at - (time.perf_counter() - t0))
+        stats = client.clock_sync.stats()
+        error = client.clock_sync.remote_time() - remote_clock()
+        print(f"clock sync after {at:4.1f} s: {stats['samples']:2d} samples, offset error {error * 1e6:+7.1f} us, "
+              f"drift {stats['drift_ppm']:5.1f} ppm (true {REMOTE_DRIFT * 1e6:.0f}), srtt {stats['srtt_ms']:.2f} ms")
+    client.close()
+    server.stop.set()
@@ -0,0 +1,173 @@
+# gimbal_protocol.py
+#
+# Wire format between gimbal_client and gimbal_server. Commands are JSON
+# objects, except move2 setpoints, which can also go as a fixed 25 byte
+# struct when GIMBAL_BINARY is set; the first byte tells them apart.
+# CommandServer is the socket side of gimbal_server. Telemetry goes out on
+# a PUB socket as [topic, payload] frames, see TELEMETRY_TOPICS.
+import os
+import json
+import math
+import struct
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import zmq
+
+logger = logging.getLogger("App")
+
+GIMBAL_BINARY = os.getenv("GIMBAL_BINARY", "False") == "True"
+
+# b"M", request id, session, sequence number, motor1 deg, motor2 deg. Sequence
+# numbers only order setpoints within one client session. An axis left as it
+# is goes as NaN (None in JSON).
+MOVE2 = struct.Struct("<cIIQff")
+# b"m", request id, status code
+MOVE2_REPLY = struct.Struct("<cIB")
+MOVE2_STATUS = ["ok", "stale", "not ready", "error"]
+
+# Telemetry topics: positions at TELEMETRY_RATE_HZ as a packed struct, health
+# as a JSON object of only the fields that changed (all of them now and then)
+TOPIC_POSITIONS = b"pos"
+TOPIC_HEALTH = b"health"
+TELEMETRY_TOPICS = (TOPIC_POSITIONS, TOPIC_HEALTH)
+# sample number, gimbal clock, motor1 deg, motor2 deg, flags
+POSITIONS = struct.Struct("<IdffB")
+FLAG_LASER, FLAG_SENSOR1, FLAG_SENSOR2 = 1, 2, 4
+
+
+def encode_move2(request_id, session, seq, motor1_deg, motor2_deg, binary=GIMBAL_BINARY) -> bytes:
+    if binary:
+        return MOVE2.pack(b"M", request_id, session, seq,
+                          math.nan if motor1_deg is None else motor1_deg,
+                          math.nan if motor2_deg is None else motor2_deg)
+    return json.dumps({"cmd": "move2", "id": request_id, "session": session, "seq": seq,
+                       "motor1": motor1_deg, "motor2": motor2_deg}).encode()
+
+
+def decode_command(raw: bytes) -> dict:
+    """Command dict from either encoding; binary ones are flagged with "binary": True."""
+    if raw[:1] == b"M":
+        _, request_id, session, seq, motor1_deg, motor2_deg = MOVE2.unpack(raw)
+        return {"cmd": "move2", "id": request_id, "session": session, "seq": seq,
+                "motor1": None if math.isnan(motor1_deg) else motor1_deg,
+                "motor2": None if math.isnan(motor2_deg) else motor2_deg, "binary": True}
+    return json.loads(raw)
+
+
+def encode_reply(message: dict, response: dict) -> bytes:
+    """Reply in the encoding of the request, echoing its id."""
+    if "id" in message:
+        response["id"] = message["id"]
+    if message.get("binary"):
+        status = response.get("status") or response.get("error")
+        code = MOVE2_STATUS.index(status) if status in MOVE2_STATUS else MOVE2_STATUS.index("error")
+        return MOVE2_REPLY.pack(b"m", message["id"], code)
+    return json.dumps(response).encode()
+
+
+def decode_reply(raw: bytes) -> dict:
+    if raw[:1] == b"m":
+        _, request_id, status = MOVE2_REPLY.unpack(raw)
+        code = MOVE2_STATUS[status]
+        return {"id": request_id, "status": code} if code in ("ok", "stale") else {"id": request_id, "error": code}
+    return json.loads(raw)
+
+
+def encode_positions(seq, t, motor1_deg, motor2_deg, laser, sensor1, sensor2) -> bytes:
+    flags = (FLAG_LASER if laser else 0) | (FLAG_SENSOR1 if sensor1 else 0) | (FLAG_SENSOR2 if sensor2 else 0)
+    return POSITIONS.pack(seq, t, motor1_deg, motor2_deg, flags)
+
+
+def decode_telemetry(topic: bytes, raw: bytes) -> dict:
+    """Telemetry fields from one [topic, payload] message."""
+    if topic == TOPIC_POSITIONS:
+        seq, t, motor1_deg, motor2_deg, flags = POSITIONS.unpack(raw)
+        return {"seq": seq, "t": t, "motor1": motor1_deg, "motor2": motor2_deg,
+                "laser": bool(flags & FLAG_LASER), "sensor1": bool(flags & FLAG_SENSOR1),
+                "sensor2": bool(flags & FLAG_SENSOR2)}
+    return json.loads(raw)
+
+
+class CommandServer:
+    """
+    Server side of the link. A ROUTER takes request/reply commands from any
+    number of clients, and a CONFLATE PULL takes fire-and-forget setpoints,
+    of which only the newest is kept while the loop is busy.
+
+    handle(message) returns the reply dict. Most commands are cheap and run
+    on the loop thread, in the order they arrive, so a pipelined laser
+    on/off can't swap. The slow `pooled` ones run on a worker pool, so they
+    hold up neither other clients nor aiming; their replies come back to
+    the loop thread, the only one touching the sockets, over inproc.
+    apply_setpoint(message) is called for each setpoint received.
+    """
+
+    def __init__(self, ctx, router_address, setpoint_address, handle, apply_setpoint,
+                 workers=4, pooled=("home", "status")):
+        self.ctx = ctx
+        self.handle = handle
+        self.apply_setpoint = apply_setpoint
+        self.pooled = pooled
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self._local = threading.local()
+        self._inproc = f"inproc://gimbal-server-replies-{id(self)}"
+
+        self.router = ctx.socket(zmq.ROUTER)
+        self.router.bind(router_address)
+        self.setpoints = ctx.socket(zmq.PULL)
+        self.setpoints.setsockopt(zmq.CONFLATE, 1)  # must be set before bind
+        self.setpoints.bind(setpoint_address)
+        self.replies = ctx.socket(zmq.PULL)
+        self.replies.bind(self._inproc)
+
+    def _respond(self, identity, message):
+        """Handle one decoded request; returns the reply frames."""
+        try:
+            response = self.handle(message)
+        except Exception as e:
+            response = {"error": str(e)}
+        return [identity, b"", encode_reply(message, response)]
+
+    def _work(self, identity, message):
+        push = getattr(self._local, "push", None)
+        if push is None:  # one PUSH socket per worker thread
+            push = self._local.push = self.ctx.socket(zmq.PUSH)
+            push.connect(self._inproc)
+        push.send_multipart(self._respond(identity, message))
+
+    def serve(self, stop_event):
+        poller = zmq.Poller()
+        poller.register(self.router, zmq.POLLIN)
+        poller.register(self.setpoints, zmq.POLLIN)
+        poller.register(self.replies, zmq.POLLIN)
+        while not stop_event.is_set():
+            socks = dict(poller.poll(timeout=10))
+            if socks.get(self.setpoints) == zmq.POLLIN:
+                try:
+                    self.apply_setpoint(decode_command(self.setpoints.recv()))
+                except Exception as e:
+                    logger.warning(f"[Gimbal Server] Bad setpoint: {e}")
+            if socks.get(self.replies) == zmq.POLLIN:
+                while True:
+                    try:
+                        self.router.send_multipart(self.replies.recv_multipart(zmq.NOBLOCK))
+                    except zmq.Again:
+                        break
+            if socks.get(self.router) == zmq.POLLIN:
+                while True:
+                    try:
+                        frames = self.router.recv_multipart(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    identity = frames[0]
+                    try:
+                        message = decode_command(frames[-1])
+                    except (ValueError, struct.error) as e:
+                        self.router.send_multipart([identity, b"", encode_reply({}, {"error": str(e)})])
+                        continue
+                    if message.get("cmd") in self.pooled:
+                        self.pool.submit(self._work, identity, message)
+                    else:
+                        self.router.send_multipart(self._respond(identity, message))
+        self.pool.shutdown(wait=False)
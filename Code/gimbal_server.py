@@ -1,4 +1,5 @@
 import os
+import json
 import time
 import threading
 import zmq
@@ -15,23 +16,39 @@ assert os.getenv("USE_REMOTE_GIMBAL", "False") == "True", "This script is intend
 os.environ["USE_REMOTE_GIMBAL"] = "False"
 
 from app_utils import graceful_exit, register_shutdown, get_cpu_temp
-from motors import Motor1, Motor2, DEGREES_PER_STEP_1, DEGREES_PER_STEP_2, homing_procedure
+from motors import (Motor1, Motor2, gimbal, DEGREES_PER_STEP_1, DEGREES_PER_STEP_2, STEPPER_ACCELERATION,
+                    homing_procedure, step_scheduler)
 from hardware import laser_pin, water_gun_pin, hall_sensor_1, hall_sensor_2, enable_pin_1, enable_pin_2
 from app_state import app_state, GimbalState
+from gimbal_protocol import CommandServer, TOPIC_POSITIONS, TOPIC_HEALTH, encode_positions
+from trajectory import Trajectory, TrajectoryPlayer
+
+# Session and highest sequence number of the move2 setpoints applied; older
+# setpoints of that session that arrive late are dropped
+last_move2_session = None
+last_move2_seq = 0
+TELEMETRY_RATE_HZ = float(os.getenv("TELEMETRY_RATE_HZ", 50.0))  # position samples per second
+HEALTH_KEYFRAME = 2.0  # seconds between full health messages, for subscribers that just joined
+
+# Smoothed one-way delay (s) of stamped commands from the camera Pi, see GimbalClient
+command_latency = None
+# Uploaded laser paths, played back locally
+trajectory_player = TrajectoryPlayer(gimbal, (DEGREES_PER_STEP_1, DEGREES_PER_STEP_2), STEPPER_ACCELERATION)
 
 
 def create_zmq_sockets():
     context = zmq.Context()
     gimbal_port = int(os.getenv("GIMBAL_PORT", 5555))
     gimbal_sub_port = int(os.getenv("GIMBAL_SUB_PORT", 5556))
+    gimbal_setpoint_port = int(os.getenv("GIMBAL_SETPOINT_PORT", 5557))
 
-    rep_socket = context.socket(zmq.REP)
-    rep_socket.bind(f"tcp://0.0.0.0:{gimbal_port}")
+    server = CommandServer(context, f"tcp://0.0.0.0:{gimbal_port}", f"tcp://0.0.0.0:{gimbal_setpoint_port}",
+                           handle_command, apply_setpoint)
 
     pub_socket = context.socket(zmq.PUB)
     pub_socket.bind(f"tcp://0.0.0.0:{gimbal_sub_port}")
 
-    return rep_socket, pub_socket
+    return server, pub_socket
 
 def run_motor_loop():
     logger.info("[Gimbal Server] Running homing procedure...")
@@ -40,109 +57,179 @@ def run_motor_loop():
     while not app_state.shutdown_event.is_set():
         try:
             if app_state.gimbal_state == GimbalState.READY:
-                Motor1.run()
-                Motor2.run()
-            time.sleep(0.001)
+                step_scheduler.service(0.01)
+            else:
+                time.sleep(0.001)
         except Exception as e:
             logger.info(f"[Motor Loop Error] {e}")
             break
 
+def run_trajectory_loop():
+    while not app_state.shutdown_event.is_set():
+        if app_state.gimbal_state == GimbalState.READY:
+            trajectory_player.update()
+        else:
+            trajectory_player.cancel()  # never fight homing
+        time.sleep(trajectory_player.period)
+
+def health_fields() -> dict:
+    return {
+        "gimbal_cpu_temp": get_cpu_temp(),
+        "gimbal_state": app_state.gimbal_state.value,
+        "home_requested": app_state.home_requested,
+    }
+
 def publish_status_loop(pub_socket: zmq.Socket):
+    """
+    Positions every tick on TOPIC_POSITIONS; health fields on TOPIC_HEALTH
+    when one changes, plus all of them every HEALTH_KEYFRAME seconds.
+    Timestamps are time.monotonic(), the clock GimbalClient syncs to.
+    """
+    period = 1.0 / TELEMETRY_RATE_HZ
+    seq = 0
+    sent_health, keyframe_due = {}, 0.0
+    next_tick = time.monotonic()
     while not app_state.shutdown_event.is_set():
         try:
-            status = {
-                "motor1": Motor1.current_position() * DEGREES_PER_STEP_1,
-                "motor2": Motor2.current_position() * DEGREES_PER_STEP_2,
-                "laser": laser_pin.value,
-                "sensor1": not hall_sensor_1.value,
-                "sensor2": not hall_sensor_2.value,
-                "gimbal_cpu_temp": get_cpu_temp(),
-                "gimbal_state": app_state.gimbal_state.value,
-            }
-            pub_socket.send_json(status)
-            time.sleep(0.5)
+            now = time.monotonic()
+            seq += 1
+            pub_socket.send_multipart([TOPIC_POSITIONS, encode_positions(
+                seq, now,
+                Motor1.current_position() * DEGREES_PER_STEP_1,
+                Motor2.current_position() * DEGREES_PER_STEP_2,
+                laser_pin.value, not hall_sensor_1.value, not hall_sensor_2.value)])
+
+            health = health_fields()
+            if now >= keyframe_due:
+                changed, keyframe_due = health, now + HEALTH_KEYFRAME
+            else:
+                changed = {k: v for k, v in health.items() if sent_health.get(k) != v}
+            if changed:
+                pub_socket.send_multipart([TOPIC_HEALTH, json.dumps(dict(changed, t=now)).encode()])
+                sent_health = health
+
+            next_tick += period
+            time.sleep(max(next_tick - time.monotonic(), 0.0))
+            next_tick = max(next_tick, time.monotonic() - period)  # don't burst to catch up after a stall
         except Exception as e:
             logger.info(f"[Publish Status Loop Error] {e}")
             break
 
-def handle_command(rep_socket: zmq.Socket):
-    try:
-        message: dict = rep_socket.recv_json()
-        logger.info(f"[Gimbal Server] Received message: {message}")
-        cmd = message.get("cmd")
-
-        if cmd == "move":
-            if not app_state.gimbal_state == GimbalState.READY:
-                rep_socket.send_json({"error": "Gimbal not ready for move command"})
-                return
-            motor = message.get("motor")
-            pos_deg = message.get("position", 0)
-            steps = int(pos_deg / (DEGREES_PER_STEP_1 if motor == 1 else DEGREES_PER_STEP_2))
-            (Motor1 if motor == 1 else Motor2).move_to(steps)
-            rep_socket.send_json({"status": "ok"})
-
-        elif cmd == "laser":
-            laser_pin.on() if message.get("on") else laser_pin.off()
-            rep_socket.send_json({"status": "ok"})
-
-        elif cmd == "spray":
-            if message.get("on"):
-                water_gun_pin.spray(message.get("duration", 0.5))
-            rep_socket.send_json({"status": "ok"})
-            
-        elif cmd == "status":
-            rep_socket.send_json({
-                "motor1": Motor1.current_position() * DEGREES_PER_STEP_1,
-                "motor2": Motor2.current_position() * DEGREES_PER_STEP_2,
-                "laser": laser_pin.value,
-                "mode": app_state.gimbal_state.value,
-                "sensor1": not hall_sensor_1.value,
-                "sensor2": not hall_sensor_2.value
-            })
-
-        elif cmd == "enable1":
-            if not app_state.gimbal_state==GimbalState.READY:
-                rep_socket.send_json({"error": "Can't use enable function while the gimbal is not ready"})
-                return
-            enable_pin_1.off() if message.get("on") else enable_pin_1.on()
-            rep_socket.send_json({"status": "ok"})
-            
-        elif cmd == "enable2":
-            if not app_state.gimbal_state==GimbalState.READY:
-                rep_socket.send_json({"error": "Can't use enable function while the gimbal is not ready"})
-                return
-            enable_pin_2.off() if message.get("on") else enable_pin_2.on()
-            rep_socket.send_json({"status": "ok"})
-        
-        elif cmd == "home":
-            threading.Thread(target=homing_procedure, daemon=True).start()
-            rep_socket.send_json({"status": "homing started" if app_state.home_requested else "homing already in progress"})
-            
-        else:
-            rep_socket.send_json({"error": "Unknown command"})
-
-    except Exception as e:
-        rep_socket.send_json({"error": str(e)})
+def apply_setpoint(message: dict) -> str:
+    """Aim both axes at a move2 setpoint unless a newer one was applied already."""
+    global last_move2_session, last_move2_seq
+    if not app_state.gimbal_state == GimbalState.READY:
+        return "not ready"
+    if message.get("session") != last_move2_session:
+        # a new or restarted client numbers its setpoints from scratch
+        last_move2_session = message.get("session")
+        last_move2_seq = 0
+    if message["seq"] <= last_move2_seq:
+        return "stale"
+    last_move2_seq = message["seq"]
+    trajectory_player.cancel()  # live aiming takes over
+    # a stream of retargets, not rest-to-rest moves: each axis at its full limits
+    positions = [None if message[key] is None else int(message[key] / dps)
+                 for key, dps in (("motor1", DEGREES_PER_STEP_1), ("motor2", DEGREES_PER_STEP_2))]
+    gimbal.track(positions, (gimbal.max_speed, gimbal.max_speed))
+    return "ok"
+
+
+def handle_command(message: dict) -> dict:
+    """Reply to one request/reply command."""
+    global command_latency
+    received = time.monotonic()
+    cmd = message.get("cmd")
+    # aiming, status polls and clock syncs come at a high rate, only log control commands
+    logger.log(logging.DEBUG if cmd in ("move", "move2", "status", "sync") else logging.INFO,
+               f"[Gimbal Server] Received message: {message}")
+    if "t" in message:
+        delay = received - message["t"]
+        command_latency = delay if command_latency is None else 0.9 * command_latency + 0.1 * delay
+
+    if cmd == "sync":
+        # NTP-style: when the request arrived and when the reply leaves, on our clock
+        return {"t1": received, "t2": time.monotonic()}
+
+    if cmd == "move2":
+        status = apply_setpoint(message)
+        return {"status": status} if status != "not ready" else {"error": status}
+
+    elif cmd == "move":
+        if not app_state.gimbal_state == GimbalState.READY:
+            return {"error": "Gimbal not ready for move command"}
+        motor = message.get("motor")
+        pos_deg = message.get("position", 0)
+        steps = int(pos_deg / (DEGREES_PER_STEP_1 if motor == 1 else DEGREES_PER_STEP_2))
+        trajectory_player.cancel()
+        gimbal.move_to((steps, None) if motor == 1 else (None, steps))
+        return {"status": "ok"}
+
+    elif cmd == "trajectory":
+        if message.get("cancel"):
+            return {"status": "cancelled" if trajectory_player.cancel() else "idle"}
+        if not app_state.gimbal_state == GimbalState.READY:
+            return {"error": "Gimbal not ready for trajectory command"}
+        trajectory = Trajectory(message.get("points", []))
+        delay = message.get("delay", 0.0)
+        if "start_at" in message:  # on our clock; in the past means the link ate the start
+            delay = message["start_at"] - trajectory_player.clock()
+        trajectory_player.play(trajectory, delay, message.get("replace", True))
+        return {"status": "ok", "duration": trajectory.duration}
+
+    elif cmd == "laser":
+        laser_pin.on() if message.get("on") else laser_pin.off()
+        return {"status": "ok"}
+
+    elif cmd == "spray":
+        if message.get("on"):
+            water_gun_pin.spray(message.get("duration", 0.5))
+        return {"status": "ok"}
+
+    elif cmd == "status":
+        return {
+            "motor1": Motor1.current_position() * DEGREES_PER_STEP_1,
+            "motor2": Motor2.current_position() * DEGREES_PER_STEP_2,
+            "laser": laser_pin.value,
+            "mode": app_state.gimbal_state.value,
+            "sensor1": not hall_sensor_1.value,
+            "sensor2": not hall_sensor_2.value,
+            "stepper": step_scheduler.stats(reset=False),
+            "command_latency_ms": None if command_latency is None else command_latency * 1e3,
+        }
+
+    elif cmd == "enable1":
+        if not app_state.gimbal_state==GimbalState.READY:
+            return {"error": "Can't use enable function while the gimbal is not ready"}
+        enable_pin_1.off() if message.get("on") else enable_pin_1.on()
+        return {"status": "ok"}
+
+    elif cmd == "enable2":
+        if not app_state.gimbal_state==GimbalState.READY:
+            return {"error": "Can't use enable function while the gimbal is not ready"}
+        enable_pin_2.off() if message.get("on") else enable_pin_2.on()
+        return {"status": "ok"}
+
+    elif cmd == "home":
+        threading.Thread(target=homing_procedure, daemon=True).start()
+        return {"status": "homing started" if app_state.home_requested else "homing already in progress"}
+
+    else:
+        return {"error": "Unknown command"}
 
 def main():
     register_shutdown()
-    rep_socket, pub_socket = create_zmq_sockets()
+    server, pub_socket = create_zmq_sockets()
 
     # start motor and status threads
     threading.Thread(target=run_motor_loop, daemon=True).start()
+    threading.Thread(target=run_trajectory_loop, daemon=True).start()
     threading.Thread(target=publish_status_loop, args=(pub_socket,), daemon=True).start()
 
-    # set up a poller to allow polling with timeout
-    poller = zmq.Poller()
-    poller.register(rep_socket, zmq.POLLIN)
-
-    logger.info("[Gimbal Server] Listening on port 5555 for commands...")
+    logger.info("[Gimbal Server] Listening on port 5555 for commands, 5557 for setpoints...")
     try:
         # loop until shutdown_event is set
-        while not app_state.shutdown_event.is_set():
-            socks = dict(poller.poll(timeout=10))  # wait up to 10 ms
-            if socks.get(rep_socket) == zmq.POLLIN:
-                handle_command(rep_socket)
+        server.serve(app_state.shutdown_event)
     except KeyboardInterrupt:
         # fallback in case of manual interrupt
         pass
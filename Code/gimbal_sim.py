@@ -0,0 +1,376 @@
+# gimbal_sim.py
+#
+# Deterministic virtual gimbal: AccelSteppers on a virtual clock, hall
+# sensors that trigger from the simulated rotor angle, and optional missed
+# steps. Runs the real home_motor(), MultiStepper and TrackingController
+# faster than real time, so motion changes can be benchmarked off the Pi.
+import os
+import math
+import time
+import random
+
+# motors.py builds the real motors at import; give it mock pins and keep it in-thread
+os.environ.setdefault("GPIOZERO_PIN_FACTORY", "mock")
+os.environ["USE_REMOTE_GIMBAL"] = "False"
+os.environ["USE_STEPPER_PROCESS"] = "False"
+
+from AccelStepper import AccelStepper
+from multi_stepper import MultiStepper
+from homing import FastHomer, VerifyHomer, home_motor_fast, home_concurrently, HOMING_TICK
+from step_monitor import StepLossMonitor
+from motors import (home_motor, DEGREES_PER_STEP_1, DEGREES_PER_STEP_2,
+                    STEPPER_MAX_SPEED, STEPPER_ACCELERATION)
+
+# Magnet position and trigger arc width of the hall sensors, in degrees of axis rotation
+SENSOR_CENTER_DEG = 0.0
+SENSOR_WIDTH_DEG = 6.0
+
+
+class VirtualClock:
+    """
+    Whole-microsecond clock that only moves when the simulation advances it.
+    Integer ticks like micros(), so `now - last >= interval` holds exactly
+    once a step is due.
+    """
+
+    def __init__(self):
+        self.now_us = 0
+
+    def micros(self):
+        return self.now_us
+
+    def seconds(self):
+        return self.now_us / 1e6
+
+    def advance_to(self, t_us):
+        if t_us > self.now_us:
+            self.now_us = math.ceil(t_us)
+
+    def sleep(self, seconds):
+        self.now_us += int(round(seconds * 1e6))
+
+
+class SimHallSensor:
+    """
+    Stand-in for the DigitalInputDevice of a hall sensor. The output is
+    active-low: value is 0 while the magnet is inside the trigger arc,
+    so callers keep using `not hall_sensor.value`. when_activated and
+    when_deactivated fire on edges like gpiozero's callbacks.
+    """
+
+    def __init__(self, stepper, center_deg=SENSOR_CENTER_DEG, width_deg=SENSOR_WIDTH_DEG):
+        self.stepper = stepper
+        self.center_deg = center_deg
+        self.half_width = width_deg / 2.0
+        self.when_activated = None
+        self.when_deactivated = None
+        self._value = self._level()
+        stepper.sensors.append(self)
+
+    def _level(self):
+        angle = self.stepper.rotor_steps * self.stepper.degrees_per_step
+        offset = (angle - self.center_deg + 180.0) % 360.0 - 180.0
+        return 0 if abs(offset) <= self.half_width else 1
+
+    @property
+    def value(self):
+        return self._value
+
+    def _update(self):
+        level = self._level()
+        if level == self._value:
+            return
+        self._value = level
+        callback = self.when_activated if level else self.when_deactivated
+        if callback is not None:
+            callback()
+
+
+class SimStepper(AccelStepper):
+    """
+    AccelStepper on a VirtualClock with a simulated rotor. Each step moves
+    the rotor unless it is missed: at random with missed_step_prob, or
+    always above stall_speed. A run()/run_speed() call made before the next
+    step is due advances the clock to it, so busy loops such as
+    `while motor.run(): pass` take no real time. With auto_advance off the
+    clock is left to the caller, for loops that step several motors.
+    """
+
+    def __init__(self, clock, degrees_per_step, missed_step_prob=0.0, stall_speed=None, seed=0,
+                 start_deg=0.0):
+        super().__init__(lambda: self._rotor_move(1), lambda: self._rotor_move(-1))
+        self.clock = clock
+        self._clock = clock.micros
+        self.degrees_per_step = degrees_per_step
+        self.missed_step_prob = missed_step_prob
+        self.stall_speed = stall_speed
+        self.rng = random.Random(seed)
+        self.rotor_steps = int(round(start_deg / degrees_per_step))
+        self.missed_steps = 0
+        self.sensors = []
+        self.outputs_enabled = True
+        self.auto_advance = True
+
+    def _rotor_move(self, direction):
+        if ((self.stall_speed and abs(self._speed) > self.stall_speed)
+                or (self.missed_step_prob and self.rng.random() < self.missed_step_prob)):
+            self.missed_steps += 1
+            return
+        self.rotor_steps += direction
+        for sensor in self.sensors:
+            sensor._update()
+
+    def run_speed(self) -> bool:
+        if self._stepInterval and self.auto_advance:
+            self.clock.advance_to(self._lastStepTime + self._stepInterval)
+        return super().run_speed()
+
+    def rotor_deg(self):
+        return self.rotor_steps * self.degrees_per_step
+
+    def disable_outputs(self) -> None:
+        self.outputs_enabled = False
+
+    def enable_outputs(self) -> None:
+        self.outputs_enabled = True
+
+
+class GimbalSim:
+    """Two simulated axes with their hall sensors, stepped in virtual time."""
+
+    def __init__(self, start_deg=(40.0, -70.0), missed_step_prob=0.0, stall_speed=None, seed=0,
+                 max_speed=STEPPER_MAX_SPEED, acceleration=STEPPER_ACCELERATION):
+        self.clock = VirtualClock()
+        self.motors = [
+            SimStepper(self.clock, dps, missed_step_prob, stall_speed, seed + i, start)
+            for i, (dps, start) in enumerate(zip((DEGREES_PER_STEP_1, DEGREES_PER_STEP_2), start_deg))
+        ]
+        self.sensors = [SimHallSensor(m) for m in self.motors]
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+        for motor in self.motors:
+            motor.set_max_speed(max_speed)
+            motor.set_acceleration(acceleration)
+        self.gimbal = MultiStepper(self.motors, max_speed, acceleration)
+        self.zones = {}
+
+    def now(self):
+        return self.clock.seconds()
+
+    def service(self, duration):
+        """Issue every step that falls due in the next `duration` seconds, then advance to its end."""
+        end = self.clock.now_us + int(round(duration * 1e6))
+        while True:
+            earliest = None
+            for motor in self.motors:
+                deadline = motor.next_step_time()
+                if deadline is not None and (earliest is None or deadline < earliest):
+                    earliest = deadline
+            if earliest is None or earliest > end:
+                self.clock.advance_to(end)
+                return
+            self.clock.advance_to(earliest)
+            for motor in self.motors:
+                deadline = motor.next_step_time()
+                if deadline is not None and deadline <= self.clock.now_us:
+                    motor.run()
+
+    def home(self, mode="fast"):
+        """
+        Home both axes like homing_procedure(): one after the other, or both
+        from one loop with mode="concurrent". mode="verify" instead confirms
+        the motors' current positions as if restored from the journal.
+        Returns seconds per axis and {motor number: error} of the axes that failed.
+        """
+        if mode in ("concurrent", "verify"):
+            return self._home_concurrently(VerifyHomer if mode == "verify" else FastHomer)
+        durations, errors = [], {}
+        for i, (motor, sensor) in enumerate(zip(self.motors, self.sensors)):
+            t0 = self.now()
+            try:
+                if mode == "fast":
+                    motor.auto_advance = False
+                    try:
+                        home_motor_fast(motor, sensor, i + 1, motor.degrees_per_step, self._homing_idle)
+                    finally:
+                        motor.auto_advance = True
+                else:
+                    home_motor(motor, sensor, i + 1, sleep=self.clock.sleep)
+            except RuntimeError as e:
+                errors[i + 1] = str(e)
+            durations.append(self.now() - t0)
+            motor.set_max_speed(self.max_speed)
+            motor.set_acceleration(self.acceleration)
+        return durations, errors
+
+    def _homing_idle(self, _active):
+        # what motors.homing_procedure() does between ticks, with service() standing in for StepScheduler
+        self.service(HOMING_TICK)
+
+    def _home_concurrently(self, homer_class):
+        t0 = self.now()
+        durations = [0.0] * len(self.motors)
+        homers = [homer_class(m, s, i + 1, m.degrees_per_step)
+                  for i, (m, s) in enumerate(zip(self.motors, self.sensors))]
+
+        def idle(active):
+            # note when each axis finished, then step like the scheduler would
+            for homer in homers:
+                if homer not in active and not durations[homer.motor_num - 1]:
+                    durations[homer.motor_num - 1] = self.now() - t0
+            self._homing_idle(active)
+
+        for motor in self.motors:
+            motor.auto_advance = False
+        try:
+            errors = home_concurrently(homers, idle)
+        finally:
+            for motor in self.motors:
+                motor.auto_advance = True
+        # trigger zones as measured, for StepLossMonitor.attach()
+        self.zones = {h.motor_num: h.zone for h in homers if h.motor_num not in errors}
+        for i, motor in enumerate(self.motors):
+            durations[i] = durations[i] or self.now() - t0
+            motor.set_max_speed(self.max_speed)
+            motor.set_acceleration(self.acceleration)
+        return durations, errors
+
+    def home_error_deg(self):
+        """Rotor angle at position 0 relative to the magnet center, per axis."""
+        return [(m.rotor_deg() - m.current_position() * m.degrees_per_step - SENSOR_CENTER_DEG + 180.0)
+                % 360.0 - 180.0 for m in self.motors]
+
+    def move(self, degrees, timeout=10.0):
+        """Coordinated move to absolute axis angles; returns the virtual seconds it took."""
+        t0 = self.now()
+        self.gimbal.move_to([int(round(d / m.degrees_per_step)) for d, m in zip(degrees, self.motors)])
+        while self.gimbal.is_running() and self.now() - t0 < timeout:
+            self.service(0.001)
+        return self.now() - t0
+
+
+if __name__ == "__main__":
+    import heapq
+    from tracking import TrackingController
+    from trajectory import Trajectory, TrajectoryPlayer
+    from gimbal_client import sample_trajectory
+
+    wall = time.perf_counter()
+
+    # Homing from a few start angles; sequential modes report the sum of both axes
+    for start in ((40.0, -70.0), (-150.0, 120.0), (2.0, 1.0)):
+        for mode in ("legacy", "fast", "concurrent"):
+            sim = GimbalSim(start_deg=start)
+            durations, failed = sim.home(mode)
+            total = max(durations) if mode == "concurrent" else sum(durations)
+            errors = sim.home_error_deg()
+            print(f"{mode:10s} homing from {start}: {total:6.2f} s, "
+                  f"zero error {errors[0]:+.2f} / {errors[1]:+.2f} deg" + (f", failed {failed}" if failed else ""))
+
+    # One axis without a magnet: the other still homes
+    sim = GimbalSim(start_deg=(40.0, -70.0))
+    sim.sensors[0].half_width = -1.0  # never triggers
+    sim.sensors[0]._value = 1
+    durations, failed = sim.home("concurrent")
+    print(f"concurrent, motor 1 sensor dead: failed {sorted(failed)}, "
+          f"motor 2 zero error {sim.home_error_deg()[1]:+.2f} deg")
+
+    # Restart with the position restored from a clean journal: a short sweep instead of a search
+    for offset in (0, 20, 200):
+        sim = GimbalSim(start_deg=(40.0, -70.0))
+        for motor in sim.motors:
+            motor.set_current_position(motor.rotor_steps + offset)  # journal off by `offset` steps
+        durations, failed = sim.home("verify")
+        errors = sim.home_error_deg()
+        print(f"verify, journal off by {offset:3d} steps: {max(durations):5.2f} s, "
+              f"zero error {errors[0]:+.2f} / {errors[1]:+.2f} deg" + (f", failed {sorted(failed)}" if failed else ""))
+
+    # Slews between fixed aim points
+    sim = GimbalSim(start_deg=(0.0, 0.0))
+    for target in ((30.0, 10.0), (-45.0, 25.0), (0.0, 0.0), (90.0, -60.0)):
+        seconds = sim.move(target)
+        print(f"slew to {target}: {seconds:.3f} s, rotor at "
+              f"({sim.motors[0].rotor_deg():.2f}, {sim.motors[1].rotor_deg():.2f})")
+
+    # Tracking a weaving target with 15 fps detections and 60 ms latency
+    sim = GimbalSim(start_deg=(0.0, 0.0))
+    controller = TrackingController(sim.max_speed, sim.acceleration)
+    controller.reset([0, 0], now=0.0)
+    next_frame, squared, samples, worst = 0.0, 0.0, 0, 0.0
+    while sim.now() < 5.0:
+        now = sim.now()
+        if now >= next_frame + 0.06:
+            t = next_frame
+            controller.set_target([800 * math.sin(2 * t), 300 * math.sin(3 * t)],
+                                  [1600 * math.cos(2 * t), 900 * math.cos(3 * t)], t)
+            next_frame += 1 / 15
+        command = controller.update(now)
+        if command is not None:
+            sim.gimbal.track(*command)
+        sim.service(0.001)
+        if now >= 1.0:
+            err = max(abs(m.rotor_steps - p) for m, p in
+                      zip(sim.motors, (800 * math.sin(2 * sim.now()), 300 * math.sin(3 * sim.now()))))
+            squared += err * err
+            samples += 1
+            worst = max(worst, err)
+    print(f"tracking weave: rms {math.sqrt(squared / samples):.1f} steps, max {worst:.0f} steps")
+
+    # Aiming over a network with 5-45 ms of jitter: setpoints streamed at 100 Hz against
+    # a 0.5 s predicted path uploaded with each 15 fps detection
+    def weave(t):
+        return 30 * math.sin(2 * t), 15 * math.sin(3 * t)
+
+    for mode in ("stream", "trajectory"):
+        rng = random.Random(3)
+        sim = GimbalSim(start_deg=(0.0, 0.0))
+        dps = [m.degrees_per_step for m in sim.motors]
+        player = TrajectoryPlayer(sim.gimbal, dps, sim.acceleration, clock=sim.now)
+        inbox, next_send, seq, last_seq = [], 0.0, 0, 0
+        squared, samples, worst = 0.0, 0, 0.0
+        while sim.now() < 5.0:
+            now = sim.now()
+            while now >= next_send:
+                seq += 1
+                payload = (weave(next_send) if mode == "stream" else
+                           sample_trajectory(lambda t, sent=next_send: weave(sent + t)))
+                heapq.heappush(inbox, (next_send + rng.uniform(0.005, 0.045), seq, payload))
+                next_send += 0.01 if mode == "stream" else 1 / 15
+            while inbox and inbox[0][0] <= now:
+                _, seq_in, payload = heapq.heappop(inbox)
+                if seq_in < last_seq:
+                    continue  # overtaken, like a stale move2
+                last_seq = seq_in
+                if mode == "stream":  # what gimbal_server does with a setpoint
+                    sim.gimbal.track([int(a / d) for a, d in zip(payload, dps)], [sim.max_speed] * 2)
+                else:
+                    player.play(Trajectory(payload))
+            player.update()
+            sim.service(0.001)
+            if now >= 1.0:
+                err = max(abs(m.rotor_deg() - a) for m, a in zip(sim.motors, weave(sim.now())))
+                squared += err * err
+                samples += 1
+                worst = max(worst, err)
+        print(f"jittery link, {mode:10s}: rms {math.sqrt(squared / samples):.2f} deg, max {worst:.2f} deg")
+
+    # Missed steps show up as drift between counted and actual rotor position; sweeps
+    # through home below STEP_CHECK_MAX_SPEED let StepLossMonitor take it out again
+    for monitored in (False, True):
+        sim = GimbalSim(start_deg=(0.0, 0.0), missed_step_prob=0.01, seed=1, max_speed=1500)
+        sim.home("concurrent")
+        monitors = [StepLossMonitor(m, s, i + 1, m.degrees_per_step)
+                    for i, (m, s) in enumerate(zip(sim.motors, sim.sensors))]
+        if monitored:
+            for monitor in monitors:
+                monitor.attach(sim.zones[monitor.motor_num])
+        for target in ((30.0, 20.0), (-30.0, -20.0)) * 10:
+            sim.move(target)
+            for monitor in monitors:
+                monitor.apply_correction()
+        sim.move((0.0, 0.0))
+        print(f"missed steps 1%{', monitored' if monitored else ''}: {[m.missed_steps for m in sim.motors]} lost, "
+              f"{sum(m.corrections for m in monitors)} corrections, rotor "
+              f"{sim.motors[0].rotor_deg():+.2f} / {sim.motors[1].rotor_deg():+.2f} deg at commanded 0")
+
+    print(f"wall time {time.perf_counter() - wall:.2f} s")
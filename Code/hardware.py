@@ -35,7 +35,7 @@ if not USE_REMOTE_GIMBAL:
     enable_pin_2 = OutputDevice(4, active_high=False, initial_value=False)
 
 else:
-    from gimbal_client import send_gimbal_command  # import safely from your ZMQ client
+    from gimbal_client import send_gimbal_command_async  # import safely from your ZMQ client
 
     class RemotePin:
         def __init__(self, name):
@@ -44,15 +44,15 @@ else:
 
         def on(self):
             self.value = True
-            send_gimbal_command({"cmd": self.name, "on": True})   
+            send_gimbal_command_async({"cmd": self.name, "on": True})   
         
         def off(self):
             self.value = False
-            send_gimbal_command({"cmd": self.name, "on": False})
+            send_gimbal_command_async({"cmd": self.name, "on": False})
             
         def spray(self, duration=0.5):
             if self.name == "spray":
-                send_gimbal_command({"cmd": "spray", "duration": duration, "on": True})
+                send_gimbal_command_async({"cmd": "spray", "duration": duration, "on": True})
 
         def close(self):
             self.off()
@@ -0,0 +1,242 @@
+# homing.py
+#
+# Two-phase homing: a fast seek that catches the hall sensor edge with a
+# gpiozero callback instead of polling it, then a slow approach that
+# measures both trigger edges and centres the axis between them.
+import os
+import logging
+
+logger = logging.getLogger("App")
+
+HOMING_SEEK_SPEED = float(os.getenv("HOMING_SEEK_SPEED", 4000))       # steps/s
+HOMING_SEEK_ACCEL = float(os.getenv("HOMING_SEEK_ACCEL", 20000))      # steps/s^2
+HOMING_APPROACH_SPEED = float(os.getenv("HOMING_APPROACH_SPEED", 200))  # steps/s
+HOMING_SEARCH_DEG = 175.0   # search arc on each side of the start position
+HOMING_BACKOFF_DEG = 3.0    # run-up before the trigger zone for the slow approach
+# Seconds of stepping between homing state machine ticks, see home_concurrently()
+HOMING_TICK = 0.001
+# How far the trigger zone may be from where a restored position puts it
+HOMING_VERIFY_DEG = float(os.getenv("HOMING_VERIFY_DEG", 5.0))
+
+# Phases
+START = "start"
+EXIT_ZONE = "exit_zone"
+SEEK_FORWARD = "seek_forward"
+SEEK_BACKWARD = "seek_backward"
+BACKOFF = "backoff"
+APPROACH = "approach"
+CENTER = "center"
+DONE = "done"
+FAILED = "failed"
+
+
+def nearest_home(position, steps_per_rev):
+    """Nearest step position to `position` that is 0 modulo one revolution."""
+    half = steps_per_rev // 2
+    return position - ((position + half) % steps_per_rev - half)
+
+
+class FastHomer:
+    """
+    Homing of one axis as a state machine; call tick() until it returns
+    True. Each tick does at most one step, so several homers can share a
+    stepping loop.
+
+    The hall sensors are active-low: the magnet pulls the input low, so
+    gpiozero reports entering the trigger zone as when_deactivated and
+    leaving it as when_activated. The callbacks only record the step
+    position; tick() acts on it.
+    """
+
+    def __init__(self, motor, hall_sensor, motor_num, degrees_per_step):
+        self.motor = motor
+        self.sensor = hall_sensor
+        self.motor_num = motor_num
+        self.search_steps = int(HOMING_SEARCH_DEG / degrees_per_step)
+        self.backoff_steps = max(int(HOMING_BACKOFF_DEG / degrees_per_step), 1)
+        self.approach_steps = 2 * self.search_steps  # give up the slow approach after this
+        self.state = START
+        self.error = None
+        self.entered_at = None  # step position where the zone was entered
+        self.left_at = None     # step position where it was left
+        self.start_pos = None
+        self.approach_start = None
+        self.zone = None        # (entry, exit) measured by the slow approach
+
+    def _on_enter(self):
+        if self.entered_at is None:
+            self.entered_at = self.motor.current_position()
+
+    def _on_leave(self):
+        if self.left_at is None:
+            self.left_at = self.motor.current_position()
+
+    def _clear_edges(self):
+        self.entered_at = self.left_at = None
+
+    def _sensor_active(self):
+        return not self.sensor.value
+
+    def _fail(self, message):
+        self._detach()
+        self.state = FAILED
+        self.error = message
+        raise RuntimeError(message)
+
+    def _detach(self):
+        self.sensor.when_deactivated = None
+        self.sensor.when_activated = None
+
+    def _seek(self, target, state):
+        self.motor.set_max_speed(HOMING_SEEK_SPEED)
+        self.motor.set_acceleration(HOMING_SEEK_ACCEL)
+        self.motor.move_to(target)
+        self.state = state
+
+    def _backoff_from(self, edge):
+        """Run back to HOMING_BACKOFF_DEG before the zone, then approach forward slowly."""
+        self.motor.move_to(edge - self.backoff_steps)
+        self.state = BACKOFF
+
+    def tick(self) -> bool:
+        motor = self.motor
+        state = self.state
+
+        if state == START:
+            logger.info(f"Homing Motor {self.motor_num} (fast seek)")
+            self.start_pos = motor.current_position()
+            self._clear_edges()
+            self.sensor.when_deactivated = self._on_enter
+            self.sensor.when_activated = self._on_leave
+            if self._sensor_active():
+                # already in the zone: leave it backwards, then approach forward
+                self._seek(self.start_pos - self.search_steps, EXIT_ZONE)
+            else:
+                self._seek(self.start_pos + self.search_steps, SEEK_FORWARD)
+
+        elif state == EXIT_ZONE:
+            if self.left_at is not None:
+                self._backoff_from(self.left_at)
+            elif not motor.run():
+                self._fail(f"Motor {self.motor_num} never left the home sensor zone.")
+
+        elif state in (SEEK_FORWARD, SEEK_BACKWARD):
+            # the approach runs forward, so it starts before the zone's lower edge:
+            # entering it when seeking forward, leaving it when seeking backward
+            edge = self.entered_at if state == SEEK_FORWARD else self.left_at
+            if edge is not None:
+                logger.info(f"Motor {self.motor_num} passed the sensor at {edge} steps")
+                self._backoff_from(edge)
+            elif not motor.run():
+                if state == SEEK_FORWARD:
+                    self._seek(self.start_pos - self.search_steps, SEEK_BACKWARD)
+                else:
+                    self._fail(f"Motor {self.motor_num} failed to find home sensor.")
+
+        elif state == BACKOFF:
+            if not motor.run():
+                self._clear_edges()
+                if self._sensor_active():
+                    # the run-up ended inside the zone; back off further
+                    self._backoff_from(motor.current_position() - self.backoff_steps)
+                    return False
+                self.approach_start = motor.current_position()
+                # a position move, not run_speed(): a StepScheduler servicing the
+                # motor between ticks calls run(), which would steer it back
+                motor.set_max_speed(HOMING_APPROACH_SPEED)
+                motor.move_to(self.approach_start + self.approach_steps)
+                self.state = APPROACH
+
+        elif state == APPROACH:
+            running = motor.run()
+            if self.left_at is not None and self.entered_at is not None:
+                self.zone = (self.entered_at, self.left_at)
+                logger.info(f"Motor {self.motor_num} trigger zone {self.entered_at}..{self.left_at} steps")
+                motor.set_max_speed(HOMING_SEEK_SPEED)
+                motor.set_acceleration(HOMING_SEEK_ACCEL)
+                motor.move_to((self.entered_at + self.left_at) // 2)
+                self.state = CENTER
+            elif not running:
+                self._fail(f"Motor {self.motor_num} lost the home sensor during the approach.")
+
+        elif state == CENTER:
+            if not motor.run():
+                self._detach()
+                motor.set_current_position(0)
+                motor.disable_outputs()
+                self.state = DONE
+
+        return self.state == DONE
+
+
+class VerifyHomer(FastHomer):
+    """
+    Confirms a position restored from the journal instead of searching for
+    the sensor: runs to just before where the trigger zone should be, sweeps
+    through it slowly and centres on it like FastHomer. Fails when the zone
+    is more than HOMING_VERIFY_DEG from where the restored position puts it,
+    so the caller can fall back to a full search.
+    """
+
+    def __init__(self, motor, hall_sensor, motor_num, degrees_per_step):
+        super().__init__(motor, hall_sensor, motor_num, degrees_per_step)
+        self.search_steps = max(int(HOMING_VERIFY_DEG / degrees_per_step), 1)
+        self.approach_steps = 4 * self.search_steps
+        self.steps_per_rev = int(round(360.0 / degrees_per_step))
+        self.expected = None
+
+    def tick(self) -> bool:
+        if self.state == START:
+            self.expected = nearest_home(self.motor.current_position(), self.steps_per_rev)
+            logger.info(f"Verifying home of Motor {self.motor_num} at {self.expected} steps")
+            self._clear_edges()
+            self.sensor.when_deactivated = self._on_enter
+            self.sensor.when_activated = self._on_leave
+            self._seek(self.expected - self.search_steps, BACKOFF)
+            return False
+
+        done = super().tick()
+        if self.state == CENTER and self.zone is not None and self.expected is not None:
+            error = (self.zone[0] + self.zone[1]) // 2 - self.expected
+            self.expected = None  # check once
+            if abs(error) > self.search_steps:
+                self._fail(f"Motor {self.motor_num} home is {error} steps from its restored position.")
+            logger.info(f"Motor {self.motor_num} restored position off by {error} steps")
+        return done
+
+
+def home_motor_fast(motor, hall_sensor, motor_num, degrees_per_step, idle=None):
+    """
+    Blocking two-phase homing of one axis; raises RuntimeError when the
+    sensor isn't found. `idle` as for home_concurrently().
+    """
+    homer = FastHomer(motor, hall_sensor, motor_num, degrees_per_step)
+    while not homer.tick():
+        if idle is not None:
+            idle([homer])
+    return homer
+
+
+def home_concurrently(homers, idle=None):
+    """
+    Tick several FastHomers from one loop until each is done or failed.
+    A failing axis is dropped and the others carry on. `idle` is called
+    with the active homers once per pass, to step the motors until the next
+    tick (e.g. a StepScheduler's service()) or advance a simulator's clock;
+    without one the loop busy-waits. Returns {motor_num: error message} of
+    the axes that failed.
+    """
+    active = list(homers)
+    errors = {}
+    while active:
+        for homer in list(active):
+            try:
+                if homer.tick():
+                    active.remove(homer)
+            except RuntimeError as e:
+                logger.error(f"[Homing] {e}")
+                errors[homer.motor_num] = str(e)
+                active.remove(homer)
+        if idle is not None and active:
+            idle(active)
+    return errors
@@ -0,0 +1,86 @@
+# latency_trace.py
+import os
+import time
+import itertools
+import numpy as np
+
+# Pipeline stages in the order a frame passes through them
+STAGES = ("capture", "convert", "detect_start", "detect_end",
+          "track", "select", "predict", "move")
+
+# Histogram bucket upper bounds in milliseconds (last bucket is open ended)
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class FrameTrace:
+    """perf_counter() timestamps for one frame on its way from the camera to the steppers."""
+    __slots__ = ("frame_id",) + tuple(f"t_{s}" for s in STAGES)
+
+    def __init__(self, frame_id):
+        self.frame_id = frame_id
+        for s in STAGES:
+            setattr(self, f"t_{s}", None)
+
+    def mark(self, stage, t=None):
+        setattr(self, f"t_{stage}", time.perf_counter() if t is None else t)
+
+    def copy(self):
+        other = FrameTrace(self.frame_id)
+        for s in STAGES:
+            setattr(other, f"t_{s}", getattr(self, f"t_{s}"))
+        return other
+
+    def to_dict(self):
+        """Stage times in ms relative to capture, None for stages not reached."""
+        t0 = self.t_capture
+        out = {"frame_id": self.frame_id}
+        for s in STAGES:
+            t = getattr(self, f"t_{s}")
+            out[s] = None if t is None or t0 is None else round((t - t0) * 1e3, 3)
+        return out
+
+
+class TraceRing:
+    """
+    Fixed-size ring of FrameTraces. Writers claim a slot from an
+    itertools.count, which is atomic under the GIL, so neither the
+    detection thread nor the motor loop ever takes a lock.
+    """
+
+    def __init__(self, size=2048):
+        self._size = size
+        self._buf = [None] * size
+        self._counter = itertools.count()
+
+    def push(self, trace):
+        self._buf[next(self._counter) % self._size] = trace
+
+    def last(self, n=100):
+        traces = [t for t in list(self._buf) if t is not None]
+        traces.sort(key=lambda t: t.frame_id)
+        return [t.to_dict() for t in traces[-n:]]
+
+    def histograms(self):
+        """Latency histograms per stage-to-stage segment plus capture-to-move."""
+        traces = [t for t in list(self._buf) if t is not None]
+        segments = list(zip(STAGES, STAGES[1:])) + [("capture", "move")]
+        out = {}
+        for start, end in segments:
+            ms = np.array([
+                (getattr(t, f"t_{end}") - getattr(t, f"t_{start}")) * 1e3
+                for t in traces
+                if getattr(t, f"t_{start}") is not None and getattr(t, f"t_{end}") is not None
+            ])
+            counts = np.bincount(np.searchsorted(BUCKETS_MS, ms), minlength=len(BUCKETS_MS) + 1)
+            out[f"{start}->{end}"] = {
+                "count": int(ms.size),
+                "buckets_ms": list(BUCKETS_MS) + ["inf"],
+                "counts": counts.tolist(),
+                "p50": round(float(np.percentile(ms, 50)), 3) if ms.size else None,
+                "p99": round(float(np.percentile(ms, 99)), 3) if ms.size else None,
+            }
+        return out
+
+
+# Singleton ring to import everywhere
+frame_traces = TraceRing(int(os.getenv("TRACE_RING_SIZE", 2048)))
@@ -0,0 +1,300 @@
+# motor_process.py
+#
+# Runs the stepping loop in its own process, pinned to one core, so step
+# timing no longer shares the GIL with Flask-SocketIO, OpenCV and the
+# detector. The parent talks to it through a shared-memory mailbox of
+# doubles: MotorProxy writes setpoints, the child publishes positions back.
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import subprocess
+from multiprocessing import shared_memory
+
+logger = logging.getLogger("App")
+
+# Per-axis mailbox layout (indices into an array of doubles)
+C_SEQ = 0          # bumped by the parent after every command write
+C_MODE = 1         # MODE_POSITION or MODE_SPEED
+C_TARGET = 2
+C_SPEED = 3
+C_MAX_SPEED = 4
+C_ACCEL = 5
+C_SET_POS_SEQ = 6  # bumped for every set_current_position()
+C_SET_POS = 7
+C_OUTPUTS = 8      # 1 = enabled, 0 = disabled
+S_ACK = 9          # last C_SEQ the child applied
+S_POS = 10
+S_SPEED = 11
+S_RUNNING = 12
+S_STEPS = 13       # StepScheduler stats of the last published window
+S_COMMANDED = 14
+S_ACHIEVED = 15
+S_JITTER_MEAN = 16
+S_JITTER_MAX = 17
+AXIS_FIELDS = 20
+
+MODE_POSITION = 0
+MODE_SPEED = 1
+
+# Fields after the per-axis blocks
+G_STOP = 0
+G_HEARTBEAT = 1
+GLOBAL_FIELDS = 4
+
+STATS_PERIOD = 1.0  # seconds between stats publications from the child
+SET_POS_TIMEOUT = 0.5  # seconds set_current_position() waits for the child
+
+
+def _mailbox_size(n_axes):
+    return 8 * (n_axes * AXIS_FIELDS + GLOBAL_FIELDS)
+
+
+class MotorProxy:
+    """
+    AccelStepper-like handle for one axis stepped by the child process.
+    run() and run_speed() do not step; they only report whether the axis
+    is still busy, so loops like `while motor.run(): pass` keep working.
+    """
+
+    def __init__(self, process, axis):
+        self._buf = process.buf
+        self._base = axis * AXIS_FIELDS
+        self._lock = threading.Lock()
+        self._target = 0
+        self._speed = 0.0
+
+    def _get(self, field):
+        return self._buf[self._base + field]
+
+    def _command(self, *fields):
+        """Write (field, value) pairs, then publish them by bumping C_SEQ; returns the new C_SEQ."""
+        with self._lock:
+            for field, value in fields:
+                self._buf[self._base + field] = value
+            self._buf[self._base + C_SEQ] += 1
+            return self._buf[self._base + C_SEQ]
+
+    def _pending(self):
+        return self._get(S_ACK) != self._get(C_SEQ)
+
+    def move_to(self, absolute: int) -> None:
+        self._target = absolute
+        self._command((C_MODE, MODE_POSITION), (C_TARGET, absolute))
+
+    def move(self, relative: int) -> None:
+        self.move_to(self.current_position() + relative)
+
+    def set_speed(self, speed: float) -> None:
+        self._speed = speed
+        self._command((C_MODE, MODE_SPEED), (C_SPEED, speed))
+
+    def set_max_speed(self, speed: float) -> None:
+        self._command((C_MAX_SPEED, abs(speed)))
+
+    def set_acceleration(self, acceleration: float) -> None:
+        if acceleration:
+            self._command((C_ACCEL, abs(acceleration)))
+
+    def set_current_position(self, position: int) -> None:
+        """Returns once the child has applied it, so current_position() reads the new value."""
+        self._target = position
+        self._speed = 0.0
+        seq = self._command((C_SET_POS, position),
+                            (C_SET_POS_SEQ, self._get(C_SET_POS_SEQ) + 1),
+                            (C_TARGET, position),
+                            (C_MODE, MODE_POSITION))
+        deadline = time.monotonic() + SET_POS_TIMEOUT
+        while self._get(S_ACK) < seq:
+            if time.monotonic() > deadline:
+                logger.warning(f"[Stepper] Child didn't apply set_current_position({position}) in time")
+                return
+            time.sleep(0.0002)
+
+    def current_position(self) -> int:
+        return int(self._get(S_POS))
+
+    def target_position(self) -> int:
+        return self._target
+
+    def distance_to_go(self) -> int:
+        return self._target - self.current_position()
+
+    def speed(self) -> float:
+        return self._get(S_SPEED)
+
+    def is_running(self) -> bool:
+        return self._pending() or bool(self._get(S_RUNNING))
+
+    def run(self) -> bool:
+        time.sleep(0.0005)
+        return self.is_running()
+
+    def run_speed(self) -> bool:
+        time.sleep(0.0005)
+        return False
+
+    def next_step_time(self):
+        return None  # stepped by the child
+
+    def enable_outputs(self) -> None:
+        self._command((C_OUTPUTS, 1))
+
+    def disable_outputs(self) -> None:
+        self._command((C_OUTPUTS, 0))
+
+
+class StepperProcess:
+    """
+    Owns the shared mailbox and the child process. Stands in for the
+    StepScheduler of the in-thread mode: service() just sleeps and stats()
+    returns the child's step-rate and jitter figures.
+    """
+
+    def __init__(self, pins, core=None):
+        self.n_axes = len(pins)
+        self.shm = shared_memory.SharedMemory(create=True, size=_mailbox_size(self.n_axes))
+        self.buf = self.shm.buf.cast("d")
+        for i in range(len(self.buf)):
+            self.buf[i] = 0.0
+        for axis in range(self.n_axes):
+            self.buf[axis * AXIS_FIELDS + C_OUTPUTS] = 1
+        args = [sys.executable, os.path.abspath(__file__), self.shm.name,
+                json.dumps(pins), str(os.getpid()), "" if core is None else str(core)]
+        self.proc = subprocess.Popen(args)
+        logger.info(f"[Stepper] Started stepping process pid={self.proc.pid} core={core}")
+
+    def motor(self, axis):
+        return MotorProxy(self, axis)
+
+    def service(self, duration):
+        time.sleep(duration)
+
+    def stats(self, reset=True):
+        out = {}
+        for axis in range(self.n_axes):
+            base = axis * AXIS_FIELDS
+            out[f"motor{axis + 1}"] = {
+                "steps": int(self.buf[base + S_STEPS]),
+                "commanded_sps": self.buf[base + S_COMMANDED],
+                "achieved_sps": self.buf[base + S_ACHIEVED],
+                "jitter_us_mean": self.buf[base + S_JITTER_MEAN],
+                "jitter_us_max": self.buf[base + S_JITTER_MAX],
+            }
+        return out
+
+    def stop(self):
+        self.buf[self.n_axes * AXIS_FIELDS + G_STOP] = 1
+        try:
+            self.proc.wait(timeout=1.0)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self.buf.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+# ---- child side ----
+
+def _run_child(shm_name, pins, parent_pid, core):
+    from multiprocessing import resource_tracker
+    from AccelStepper import AccelStepper, DRIVER
+    from step_scheduler import StepScheduler
+
+    class _Axis(AccelStepper):
+        """AccelStepper whose run() can also mean run_speed(), so one scheduler serves both modes."""
+        constant_speed = False
+
+        def run(self):
+            if self.constant_speed:
+                return self.run_speed()
+            return super().run()
+
+    if core is not None:
+        os.sched_setaffinity(0, {core})
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(50))
+    except (PermissionError, AttributeError):
+        logger.warning("[Stepper] SCHED_FIFO not permitted, running with normal priority")
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # the parent owns the segment; don't let this process's tracker unlink it
+    resource_tracker.unregister(shm._name, "shared_memory")
+    buf = shm.buf.cast("d")
+    n_axes = len(pins)
+    glob = n_axes * AXIS_FIELDS
+
+    axes = [_Axis(DRIVER, step_pin, dir_pin, None, None, True) for step_pin, dir_pin in pins]
+    if os.getenv("USE_RAMP_TABLE", "False") == "True":
+        for axis in axes:
+            axis.use_ramp_table()
+    scheduler = StepScheduler(axes, spin_us=300)
+    applied = [0.0] * n_axes
+    applied_set_pos = [0.0] * n_axes
+    outputs = [1.0] * n_axes
+    last_stats = time.monotonic()
+    last_parent_check = last_stats
+
+    while not buf[glob + G_STOP]:
+        for i, axis in enumerate(axes):
+            base = i * AXIS_FIELDS
+            seq = buf[base + C_SEQ]
+            if seq == applied[i]:
+                continue
+            if buf[base + C_MAX_SPEED]:
+                axis.set_max_speed(buf[base + C_MAX_SPEED])
+            if buf[base + C_ACCEL]:
+                axis.set_acceleration(buf[base + C_ACCEL])
+            if buf[base + C_SET_POS_SEQ] != applied_set_pos[i]:
+                applied_set_pos[i] = buf[base + C_SET_POS_SEQ]
+                axis.set_current_position(int(buf[base + C_SET_POS]))
+                buf[base + S_POS] = axis.current_position()  # visible by the time S_ACK is
+            if buf[base + C_MODE] == MODE_SPEED:
+                axis.constant_speed = True
+                axis.set_speed(buf[base + C_SPEED])
+            else:
+                axis.constant_speed = False
+                axis.move_to(int(buf[base + C_TARGET]))
+            if buf[base + C_OUTPUTS] != outputs[i]:
+                outputs[i] = buf[base + C_OUTPUTS]
+                axis.enable_outputs() if outputs[i] else axis.disable_outputs()
+            applied[i] = seq
+            buf[base + S_ACK] = seq
+
+        scheduler.service(0.0005)
+
+        for i, axis in enumerate(axes):
+            base = i * AXIS_FIELDS
+            buf[base + S_POS] = axis.current_position()
+            buf[base + S_SPEED] = axis.speed()
+            buf[base + S_RUNNING] = axis.is_running() and not (axis.constant_speed and axis.speed() == 0)
+
+        now = time.monotonic()
+        if now - last_stats >= STATS_PERIOD:
+            last_stats = now
+            for i, s in enumerate(scheduler.stats().values()):
+                base = i * AXIS_FIELDS
+                buf[base + S_STEPS] = s["steps"]
+                buf[base + S_COMMANDED] = s["commanded_sps"]
+                buf[base + S_ACHIEVED] = s["achieved_sps"]
+                buf[base + S_JITTER_MEAN] = s["jitter_us_mean"]
+                buf[base + S_JITTER_MAX] = s["jitter_us_max"]
+            buf[glob + G_HEARTBEAT] += 1
+        if now - last_parent_check >= 0.1:
+            last_parent_check = now
+            if os.getppid() != parent_pid:
+                logger.warning("[Stepper] Parent process gone, stopping")
+                break
+
+    for axis in axes:
+        axis.disable_outputs()
+    buf.release()
+    shm.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    _run_child(sys.argv[1], json.loads(sys.argv[2]), int(sys.argv[3]),
+               int(sys.argv[4]) if sys.argv[4] else None)
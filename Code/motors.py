@@ -4,9 +4,17 @@ import math
 import logging
 import threading
 from AccelStepper import AccelStepper, DRIVER
+from step_scheduler import StepScheduler
+from motor_process import MotorProxy, StepperProcess
+from wave_stepper import WaveStepper
+from multi_stepper import MultiStepper
+from scurve import SCurveStepper
+from homing import FastHomer, VerifyHomer, home_concurrently, HOMING_TICK
+from position_journal import PositionJournal
+from step_monitor import StepLossMonitor
 from hardware import hall_sensor_1, hall_sensor_2
 from app_state import app_state, GimbalState
-from gimbal_client import send_gimbal_command
+from gimbal_client import send_gimbal_command_async, send_gimbal_setpoint
 
 logger = logging.getLogger("App")
 
@@ -47,10 +55,31 @@ def closest_equivalent_angle(target: float, current: float) -> float:
     return c + delta
 
 
+def wrap_step_target(step_pos: int, current_steps: int, degrees_per_step: float) -> int:
+    """Step target equivalent to step_pos (modulo 360°) that is closest to current_steps."""
+    raw_deg = step_pos * degrees_per_step
+    current_deg = current_steps * degrees_per_step
+    target_deg = closest_equivalent_angle(raw_deg, current_deg)
+    return int(round(target_deg / degrees_per_step))
+
+
 # Remote vs Local mode
 USE_REMOTE_GIMBAL = os.getenv("USE_REMOTE_GIMBAL", "False") == "True"
+# Step from a dedicated process pinned to STEPPER_PROCESS_CORE instead of a thread
+USE_STEPPER_PROCESS = os.getenv("USE_STEPPER_PROCESS", "False") == "True"
+STEPPER_PROCESS_CORE = int(os.getenv("STEPPER_PROCESS_CORE", 3))
+# "gpiozero" toggles pins from Python, "lgpio_wave" queues hardware-timed pulse trains
+STEPPER_BACKEND = os.getenv("STEPPER_BACKEND", "gpiozero")
+# Take step intervals from precomputed ramp tables instead of computing them per step
+USE_RAMP_TABLE = os.getenv("USE_RAMP_TABLE", "False") == "True"
+# "trapezoid" is AccelStepper's own ramp, "scurve" follows a jerk-limited profile (gpiozero backend)
+MOTION_PROFILE = os.getenv("MOTION_PROFILE", "trapezoid")
+# "fast" seeks the sensor with edge callbacks and then measures it slowly, "legacy" polls it
+HOMING_MODE = os.getenv("HOMING_MODE", "fast")
 logger.info(f"[Motors] Running with USE_REMOTE_GIMBAL={USE_REMOTE_GIMBAL}")
 
+stepper_process = None  # the child stepping process with USE_STEPPER_PROCESS
+
 if USE_REMOTE_GIMBAL:
     class RemoteMotor:
         def __init__(self, motor_id: int, degrees_per_step: float):
@@ -62,17 +91,21 @@ if USE_REMOTE_GIMBAL:
             if not app_state.gimbal_state == GimbalState.READY: 
                 logger.warning(f"[Remote] Ignoring move_to({step_pos}) in mode {app_state.gimbal_state}")
                 return
-            raw_deg = step_pos * self.degrees_per_step
-            current_deg = self._position * self.degrees_per_step
-            target_deg = closest_equivalent_angle(raw_deg, current_deg)
-            new_steps = int(round(target_deg / self.degrees_per_step))
-            self._position = new_steps
-            send_gimbal_command({
+            target_deg = self.wrap(step_pos)
+            send_gimbal_command_async({
                 "cmd": "move",
                 "motor": self.motor_id,
                 "position": target_deg
             })
 
+        def wrap(self, step_pos: int) -> float:
+            """Angle equivalent to step_pos closest to the current one; it becomes the current position."""
+            raw_deg = step_pos * self.degrees_per_step
+            current_deg = self._position * self.degrees_per_step
+            target_deg = closest_equivalent_angle(raw_deg, current_deg)
+            self._position = int(round(target_deg / self.degrees_per_step))
+            return target_deg
+
         def run(self):
             pass
 
@@ -82,48 +115,136 @@ if USE_REMOTE_GIMBAL:
         def set_acceleration(self, *_):
             pass
 
+        def set_max_speed(self, *_):
+            pass
+
         def current_position(self) -> int:
             return self._position
 
+        def distance_to_go(self) -> int:
+            return 0
+
+        def next_step_time(self):
+            return None
+
         def disable_outputs(self):
-            send_gimbal_command({
+            send_gimbal_command_async({
                 "cmd": "disable",
                 "motor": self.motor_id
             })
         
         def enable_outputs(self):
-            send_gimbal_command({
+            send_gimbal_command_async({
                 "cmd": "enable",
                 "motor": self.motor_id
             })
 
+    class RemoteGimbal:
+        """
+        MultiStepper stand-in that aims both remote axes with one move2
+        setpoint; the Gimbal Pi coordinates the axes itself.
+        """
+
+        def __init__(self, motors):
+            self.steppers = list(motors)
+
+        def set_limits(self, *_):
+            pass
+
+        def move_to(self, positions):
+            if not app_state.gimbal_state == GimbalState.READY:
+                logger.warning(f"[Remote] Ignoring move_to({positions}) in mode {app_state.gimbal_state}")
+                return
+            # an axis passed as None stays untouched on the Gimbal Pi, whatever it is doing
+            angles = [motor.wrap(position) if position is not None else None
+                      for motor, position in zip(self.steppers, positions)]
+            if any(angle is not None for angle in angles):
+                send_gimbal_setpoint(*angles)
+
+        def track(self, positions, speeds):
+            self.move_to(positions)
+
+        def time_to_target(self):
+            return 0.0
+
+        def run(self) -> bool:
+            return False
+
+        def run_to_position(self) -> None:
+            pass
+
+        def is_running(self) -> bool:
+            return False
+
     Motor1 = RemoteMotor(1, DEGREES_PER_STEP_1)
     Motor2 = RemoteMotor(2, DEGREES_PER_STEP_2)
+    step_scheduler = StepScheduler([Motor1, Motor2])  # nothing to step locally
+    position_journal = None  # kept by the Gimbal Pi
 
     def homing_procedure():
         logger.info("[Remote] Skipping homing — expected to be done on Gimbal Pi.")
 
+elif USE_STEPPER_PROCESS:
+    class LocalMotor(MotorProxy):
+        def __init__(self, process, axis, degrees_per_step):
+            super().__init__(process, axis)
+            self.degrees_per_step = degrees_per_step
+
+        def move_to(self, step_pos: int):
+            super().move_to(wrap_step_target(step_pos, self.current_position(), self.degrees_per_step))
+
+    stepper_process = StepperProcess([(19, 13), (18, 24)], core=STEPPER_PROCESS_CORE)
+    Motor1 = LocalMotor(stepper_process, 0, DEGREES_PER_STEP_1)
+    Motor2 = LocalMotor(stepper_process, 1, DEGREES_PER_STEP_2)
+    # the child process does the stepping; this only sleeps and reports its stats
+    step_scheduler = stepper_process
+
+elif STEPPER_BACKEND == "lgpio_wave":
+    class LocalMotor(WaveStepper):
+        def __init__(self, step_pin, dir_pin, degrees_per_step):
+            super().__init__(step_pin, dir_pin)
+            self.degrees_per_step = degrees_per_step
+
+        def move_to(self, step_pos: int):
+            super().move_to(wrap_step_target(step_pos, self.current_position(), self.degrees_per_step))
+
+    Motor1 = LocalMotor(19, 13, DEGREES_PER_STEP_1)
+    Motor2 = LocalMotor(18, 24, DEGREES_PER_STEP_2)
+    # run() only tops up the wave queue, so the scheduler wakes every few ms instead of every step
+    step_scheduler = StepScheduler([Motor1, Motor2])
+
 else:
-    class LocalMotor(AccelStepper):
+    class LocalMotor(SCurveStepper if MOTION_PROFILE == "scurve" else AccelStepper):
         def __init__(self, interface, pin1, pin2, pin3, pin4, invert, degrees_per_step):
             super().__init__(interface, pin1, pin2, pin3, pin4, invert)
             self.degrees_per_step = degrees_per_step
 
         def move_to(self, step_pos: int):
-            raw_deg = step_pos * self.degrees_per_step
-            current_deg = self.current_position() * self.degrees_per_step
-            target_deg = closest_equivalent_angle(raw_deg, current_deg)
-            new_steps = int(round(target_deg / self.degrees_per_step))
-            super().move_to(new_steps)
+            super().move_to(wrap_step_target(step_pos, self.current_position(), self.degrees_per_step))
             
 
     Motor1 = LocalMotor(DRIVER, 19, 13, None, None, True, DEGREES_PER_STEP_1)
     Motor2 = LocalMotor(DRIVER, 18, 24, None, None, True, DEGREES_PER_STEP_2)
+    step_scheduler = StepScheduler([Motor1, Motor2])
+
+# Coordinated two-axis moves; remotely a single move2 setpoint per update
+if USE_REMOTE_GIMBAL:
+    gimbal = RemoteGimbal([Motor1, Motor2])
+else:
+    gimbal = MultiStepper([Motor1, Motor2], STEPPER_MAX_SPEED, STEPPER_ACCELERATION)
 
+if not USE_REMOTE_GIMBAL:
     Motor1.set_max_speed(STEPPER_MAX_SPEED)
     Motor1.set_acceleration(STEPPER_ACCELERATION)
     Motor2.set_max_speed(STEPPER_MAX_SPEED)
     Motor2.set_acceleration(STEPPER_ACCELERATION)
+    if USE_RAMP_TABLE and not USE_STEPPER_PROCESS:  # the stepping process reads the flag itself
+        Motor1.use_ramp_table()
+        Motor2.use_ramp_table()
+    position_journal = PositionJournal([Motor1, Motor2])
+    # corrects small step loss from sensor passes after homing, re-homes on large loss
+    step_monitors = [StepLossMonitor(Motor1, hall_sensor_1, 1, DEGREES_PER_STEP_1, on_rehome=lambda: request_home()),
+                     StepLossMonitor(Motor2, hall_sensor_2, 2, DEGREES_PER_STEP_2, on_rehome=lambda: request_home())]
 
     def homing_procedure():
         if app_state.home_requested:
@@ -132,13 +253,53 @@ else:
         try:
             app_state.home_requested = True
             app_state.gimbal_state = GimbalState.HOMING
-            home_motor(Motor1, hall_sensor_1, 1)
-            home_motor(Motor2, hall_sensor_2, 2)
+            app_state.homing_errors = {}
+            restored = position_journal.restorable_positions()
+            position_journal.invalidate()
+            for monitor in step_monitors:
+                monitor.detach()
+            zones = {}
+
+            def homing_idle(_active):
+                # step on the scheduler's deadlines between ticks instead of spinning a core
+                step_scheduler.service(HOMING_TICK)
+
+            if HOMING_MODE == "fast":
+                axes = [(Motor1, hall_sensor_1, 1, DEGREES_PER_STEP_1),
+                        (Motor2, hall_sensor_2, 2, DEGREES_PER_STEP_2)]
+                if restored is not None:
+                    # clean shutdown last time: confirm the journal with a short sweep
+                    logger.info(f"Restoring positions {restored} from the journal")
+                    for (motor, *_), position in zip(axes, restored):
+                        motor.set_current_position(position)
+                    homers = [VerifyHomer(*axis) for axis in axes]
+                    failed = home_concurrently(homers, homing_idle)
+                    zones.update((h.motor_num, h.zone) for h in homers if h.motor_num not in failed)
+                    axes = [axis for axis in axes if axis[2] in failed]
+                # both axes at once, each failing on its own
+                homers = [FastHomer(*axis) for axis in axes]
+                errors = home_concurrently(homers, homing_idle)
+                zones.update((h.motor_num, h.zone) for h in homers if h.motor_num not in errors)
+                if errors:
+                    app_state.homing_errors = errors
+                    app_state.gimbal_state = (GimbalState.HOMING_ERROR if len(errors) == 2 else
+                                              GimbalState(f"homing_error_motor{next(iter(errors))}"))
+                    app_state.home_requested = False
+                    return False
+            else:
+                home_motor(Motor1, hall_sensor_1, 1)
+                home_motor(Motor2, hall_sensor_2, 2)
             Motor1.set_max_speed(STEPPER_MAX_SPEED)
             Motor1.set_acceleration(STEPPER_ACCELERATION)
             Motor2.set_max_speed(STEPPER_MAX_SPEED)
             Motor2.set_acceleration(STEPPER_ACCELERATION)
             logger.info("Homing procedure complete and speed limits set")
+            position_journal.mark_homed()
+            position_journal.start()
+            for monitor in step_monitors:
+                if monitor.motor_num in zones:  # the legacy homing doesn't measure the zone
+                    monitor.attach(zones[monitor.motor_num])
+                    monitor.start()
             app_state.gimbal_state = GimbalState.READY
             app_state.home_requested = False
             return True
@@ -149,10 +310,11 @@ else:
             return False
 
 
-def home_motor(motor: AccelStepper, hall_sensor, motor_num: int):
+def home_motor(motor: AccelStepper, hall_sensor, motor_num: int, sleep=time.sleep):
     """
     Probe forward up to ±180° and home toward the closer sensor.
     If the sensor triggers within a small forward arc, skip backward probing.
+    `sleep` lets a simulator substitute its virtual clock.
     """
     logger.info(f"Homing Motor {motor_num} with smart arc detection.")
     homing_speed = 500
@@ -164,7 +326,7 @@ def home_motor(motor: AccelStepper, hall_sensor, motor_num: int):
     start_pos = motor.current_position()
 
     def sensor_active():
-        time.sleep(0.004)
+        sleep(0.004)
         return not hall_sensor.value
 
     trigger_start = None
@@ -0,0 +1,109 @@
+# multi_stepper.py
+from math import sqrt
+from AccelStepper import RAMP_TABLE_STEPS_PER_OCTAVE
+
+# Floor for an axis's share of the limits, so a near-zero move never sets a 0 max speed
+MIN_SCALE = 0.001
+# Speed cap of track() = TRACK_SPEED_MARGIN * setpoint speed + TRACK_MIN_SPEED (steps/s)
+TRACK_SPEED_MARGIN = 1.25
+TRACK_MIN_SPEED = 200
+# Margin over the current speed when that sets the cap: ramp tables round limits
+# down by up to one grid step
+TRACK_CAP_HEADROOM = 2.0 ** (1.0 / RAMP_TABLE_STEPS_PER_OCTAVE)
+
+
+def trapezoid_time(distance, max_speed, acceleration):
+    """Seconds for a rest-to-rest move of `distance` steps under the given limits."""
+    distance = abs(distance)
+    if not distance:
+        return 0.0
+    if distance * acceleration >= max_speed * max_speed:
+        return distance / max_speed + max_speed / acceleration
+    return 2.0 * sqrt(distance / acceleration)
+
+
+class MultiStepper:
+    """
+    Coordinated moves for several AccelSteppers. move_to() from rest gives
+    the axis with the longest move the full speed and acceleration limits
+    and every other axis the same limits scaled by its share of the
+    distance. All axes then run the same velocity profile up to that
+    factor, so they arrive together and the move is a straight line in
+    step space.
+    """
+
+    def __init__(self, steppers, max_speed, acceleration):
+        self.steppers = list(steppers)
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+
+    def set_limits(self, max_speed, acceleration):
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+
+    def move_to(self, positions):
+        """
+        Move every axis to its absolute position; None leaves that axis's
+        target and limits unchanged. Limits are only rescaled when every
+        axis is at rest: lowering an axis's max speed while it runs would
+        cut its speed in one step, so a retarget mid-move keeps the limits
+        of the axes still moving.
+        """
+        at_rest = all(s.speed() == 0 for s in self.steppers)
+        moved = []
+        for stepper, position in zip(self.steppers, positions):
+            if position is not None:
+                stepper.move_to(position)
+                moved.append(stepper)
+        if not at_rest:
+            # no common profile to scale into; axes starting from rest get the full limits
+            for stepper in moved:
+                if stepper.speed() == 0:
+                    stepper.set_max_speed(self.max_speed)
+                    stepper.set_acceleration(self.acceleration)
+            return
+        # read back the targets, the steppers may have wrapped them
+        distances = [abs(s.distance_to_go()) for s in moved]
+        longest = max(distances, default=0)
+        if not longest:
+            return
+        for stepper, distance in zip(moved, distances):
+            scale = max(distance / longest, MIN_SCALE)
+            stepper.set_max_speed(self.max_speed * scale)
+            stepper.set_acceleration(self.acceleration * scale)
+
+    def track(self, positions, speeds):
+        """
+        Follow a setpoint stream that is already coordinated, e.g. from
+        TrackingController: full acceleration on every axis and each axis's
+        speed capped just above its setpoint speed, so it cannot run ahead.
+        The cap never drops below the axis's current speed, which would cut
+        it in one step; a faster axis slows down through its braking ramp
+        as it nears the (led) setpoint instead. None leaves an axis alone.
+        """
+        for stepper, position, speed in zip(self.steppers, positions, speeds):
+            if position is None:
+                continue
+            cap = max(speed * TRACK_SPEED_MARGIN + TRACK_MIN_SPEED, abs(stepper.speed()) * TRACK_CAP_HEADROOM)
+            stepper.set_max_speed(min(cap, self.max_speed))
+            stepper.set_acceleration(self.acceleration)
+            stepper.move_to(position)
+
+    def time_to_target(self):
+        """Estimated seconds until the current move ends, assuming it starts from rest."""
+        longest = max(abs(s.distance_to_go()) for s in self.steppers)
+        return trapezoid_time(longest, self.max_speed, self.acceleration)
+
+    def run(self) -> bool:
+        """One step opportunity for every axis. Returns True while any axis is still moving."""
+        running = False
+        for stepper in self.steppers:
+            running = stepper.run() or running
+        return running
+
+    def run_to_position(self) -> None:
+        while self.run():
+            pass
+
+    def is_running(self) -> bool:
+        return any(s.is_running() for s in self.steppers)
@@ -2,12 +2,23 @@ import numpy as np
 from filterpy.kalman import KalmanFilter
 from scipy.optimize import linear_sum_assignment
 
+# Column layout of the array returned by Sort.update()
+COL_X1, COL_Y1, COL_X2, COL_Y2 = 0, 1, 2, 3
+COL_ID = 4          # track id
+COL_DET = 5         # index into the dets passed to update(), -1 if not matched this frame
+COL_CLASS = 6       # class id of the last matched detection
+COL_CONF = 7        # confidence of the last matched detection
+COL_VX, COL_VY = 8, 9   # estimated box velocity in px/s
+NUM_COLS = 10
+
+# Frame interval assumed when update() is called without timestamps
+DEFAULT_DT = 1.0 / 15.0
+
 class Track:
-    def __init__(self, bbox, track_id):
-        # bbox: [x1, y1, x2, y2, score]
+    def __init__(self, bbox, track_id, det_idx=-1):
+        # bbox: [x1, y1, x2, y2, score, class_id]
         self.kf = KalmanFilter(dim_x=7, dim_z=4)
-        # Initialize state transition and measurement matrices here as needed...
-        # For simplicity, assume identity for now (you can fill with proper SORT params)
+        # Constant-velocity model; F is rebuilt for the actual dt in predict()
         self.kf.F = np.eye(7)
         self.kf.H = np.zeros((4, 7))
         self.kf.H[0, 0] = 1
@@ -19,21 +30,36 @@ class Track:
         self.kf.x[:, 0] = init_state
         # process & measurement noise covariances (tweak as needed)
         self.kf.P *= 10.0
+        self.kf.P[4:, 4:] *= 1000.0  # velocity is unknown until the second hit
         self.kf.R *= 1.0
         self.id = track_id
         self.hits = 1
         self.no_losses = 0
+        self.det_idx = det_idx
+        self.score = float(bbox[4])
+        self.class_id = int(bbox[5]) if len(bbox) > 5 else -1
 
-    def predict(self):
-        self.kf.predict()
+    def predict(self, dt=DEFAULT_DT):
+        # corners move with the box velocity (vx, vy); vw is not modelled
+        F = np.eye(7)
+        F[0, 4] = F[2, 4] = dt
+        F[1, 5] = F[3, 5] = dt
+        self.kf.predict(F=F)
         return self.kf.x
 
-    def update(self, bbox):
+    def velocity(self):
+        return float(self.kf.x[4, 0]), float(self.kf.x[5, 0])
+
+    def update(self, bbox, det_idx=-1):
         # measurement z: [x, y, w, h]
         z = np.array([bbox[0], bbox[1], bbox[2], bbox[3]], dtype=float)
         self.kf.update(z)
         self.hits += 1
         self.no_losses = 0
+        self.det_idx = det_idx
+        self.score = float(bbox[4])
+        if len(bbox) > 5:
+            self.class_id = int(bbox[5])
 
 class Sort:
     def __init__(self, max_age=5, min_hits=3, iou_threshold=0.3):
@@ -42,6 +68,7 @@ class Sort:
         self.iou_threshold = iou_threshold
         self.tracks = []
         self.next_id = 1
+        self.last_timestamp = None
 
     @staticmethod
     def iou(bb_det, bb_trk):
@@ -55,14 +82,26 @@ class Sort:
         area2 = (bb_trk[2] - bb_trk[0]) * (bb_trk[3] - bb_trk[1])
         return inter / (area1 + area2 - inter + 1e-6)
 
-    def update(self, dets):
+    def update(self, dets, timestamp=None):
         """
-        dets: ndarray of shape (N,5): [x1,y1,x2,y2,score]
-        returns: ndarray of shape (M,5): [x1,y1,x2,y2,track_id]
+        dets: ndarray of shape (N,5) or (N,6): [x1,y1,x2,y2,score(,class_id)]
+        timestamp: capture time of the frame in seconds; used to scale the
+            motion model so velocities come out in px/s
+        returns: ndarray of shape (M,10):
+            [x1,y1,x2,y2,track_id,det_idx,class_id,conf,vx,vy]
+        det_idx is the row of `dets` the track was matched to in this call,
+        or -1 if the track is coasting on its prediction.
         """
+        dt = DEFAULT_DT
+        if timestamp is not None:
+            if self.last_timestamp is not None:
+                dt = min(max(timestamp - self.last_timestamp, 1e-3), 1.0)
+            self.last_timestamp = timestamp
+
         # 1) Predict all tracks
         for t in self.tracks:
-            t.predict()
+            t.predict(dt)
+            t.det_idx = -1
 
         # 2) Associate
         N = dets.shape[0]
@@ -96,11 +135,11 @@ class Sort:
 
         # 3) Update matched tracks
         for det_idx, trk_idx in matched:
-            self.tracks[trk_idx].update(dets[det_idx])
+            self.tracks[trk_idx].update(dets[det_idx], det_idx)
 
         # 4) Create new tracks for unmatched detections
         for idx in unmatched_dets:
-            self.tracks.append(Track(dets[idx], self.next_id))
+            self.tracks.append(Track(dets[idx], self.next_id, idx))
             self.next_id += 1
 
         # 5) Age out lost tracks and collect results
@@ -110,10 +149,12 @@ class Sort:
                 self.tracks.remove(t)
             elif t.hits >= self.min_hits:
                 x1, y1, x2, y2 = t.kf.x[:4, 0]
-                results.append([float(x1), float(y1), float(x2), float(y2), t.id])
+                vx, vy = t.velocity()
+                results.append([float(x1), float(y1), float(x2), float(y2), t.id,
+                                t.det_idx, t.class_id, t.score, vx, vy])
             t.no_losses += 1
 
         if results:
             return np.array(results, dtype=float)
         else:
-            return np.empty((0, 5), dtype=float)
+            return np.empty((0, NUM_COLS), dtype=float)
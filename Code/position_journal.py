@@ -0,0 +1,126 @@
+# position_journal.py
+#
+# Crash-safe record of where the motors are, so a restart after a clean
+# shutdown can confirm the position with a short sweep past the hall
+# sensors instead of a full homing search.
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger("App")
+
+POSITION_JOURNAL_PATH = os.getenv(
+    "POSITION_JOURNAL_PATH",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "position_journal.json"))
+POSITION_JOURNAL_INTERVAL = float(os.getenv("POSITION_JOURNAL_INTERVAL", 1.0))  # seconds between writes
+JOURNAL_VERSION = 1
+
+
+class PositionJournal:
+    """
+    Periodically writes the commanded and reached step positions of the
+    motors to a JSON file. Writes go through a temp file and os.replace(),
+    so the file is always either the previous or the new entry, and only
+    happen when something changed.
+
+    An entry is only trusted on startup when it is marked both "homed" and
+    "clean": mark_clean() is called after the outputs were disabled on
+    shutdown, and any later record() or invalidate() clears it again.
+    """
+
+    def __init__(self, motors, path=POSITION_JOURNAL_PATH, interval=POSITION_JOURNAL_INTERVAL):
+        self.motors = list(motors)
+        self.path = path
+        self.interval = interval
+        self.homed = False
+        self._last = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _write(self, entry):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _entry(self, clean):
+        return {
+            "version": JOURNAL_VERSION,
+            "homed": self.homed,
+            "clean": clean,
+            "positions": [m.current_position() for m in self.motors],
+            "targets": [m.target_position() for m in self.motors],
+        }
+
+    def record(self, clean=False, force=False):
+        """Write the current positions if they changed since the last write."""
+        with self._lock:
+            if self._stop.is_set() and not force:
+                return False  # the background writer lost the race with mark_clean()
+            entry = self._entry(clean)
+            if entry == self._last and not force:
+                return False
+            try:
+                self._write(dict(entry, time=time.time()))
+            except OSError:
+                logger.exception("[Journal] Failed to write position journal")
+                return False
+            self._last = entry
+            return True
+
+    def mark_homed(self):
+        """Positions are valid from here on (homing finished)."""
+        self.homed = True
+        self.record(force=True)
+
+    def invalidate(self):
+        """Positions can't be trusted, e.g. while homing."""
+        self.homed = False
+        self.record(force=True)
+
+    def mark_clean(self):
+        """Last write before exiting, with the outputs already disabled."""
+        self.stop()
+        self.record(clean=True, force=True)
+
+    def load(self):
+        """The last entry, or None when the file is missing or unreadable."""
+        try:
+            with open(self.path) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.exception("[Journal] Ignoring unreadable position journal")
+            return None
+        if entry.get("version") != JOURNAL_VERSION or len(entry.get("positions", ())) != len(self.motors):
+            return None
+        return entry
+
+    def restorable_positions(self):
+        """Step positions to restore when the last run ended cleanly after homing, else None."""
+        entry = self.load()
+        if entry is None or not entry.get("homed") or not entry.get("clean"):
+            return None
+        return [int(p) for p in entry["positions"]]
+
+    def start(self):
+        """Start the background writer; safe to call again after each homing."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            if self.homed:
+                self.record()
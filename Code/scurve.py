@@ -0,0 +1,248 @@
+# scurve.py
+#
+# Jerk-limited (S-curve) motion for the steppers. SCurveProfile is the
+# online trajectory generator; SCurveStepper drives an AccelStepper along
+# it, so LocalMotor can swap the trapezoidal ramp for a smooth one.
+import os
+from math import sqrt, copysign
+from AccelStepper import AccelStepper, DIRECTION_CW, DIRECTION_CCW
+
+# Time (s) to ramp acceleration from 0 to max; max jerk = acceleration / SCURVE_JERK_TIME
+SCURVE_JERK_TIME = float(os.getenv("SCURVE_JERK_TIME", 0.02))
+PROFILE_DT_US = 1000     # profile update period while moving
+FOLLOW_GAIN = 50.0       # 1/s, pulls the step count onto the profile position
+SETTLE_STEPS = 0.5       # position error below which a stopped profile snaps to the target
+
+
+def sqrt_controller(error, gain, limit):
+    """
+    Proportional near zero, sqrt(2 * limit * error) further out: the largest
+    rate from which `error` can still be closed under a constant `limit`.
+    """
+    linear = limit / (gain * gain)
+    if error > linear:
+        return sqrt(2.0 * limit * (error - linear / 2.0))
+    if error < -linear:
+        return -sqrt(2.0 * limit * (-error - linear / 2.0))
+    return error * gain
+
+
+class SCurveProfile:
+    """
+    Online jerk-limited trajectory in steps. Every update() re-plans from
+    the current position, velocity and acceleration, so the target can be
+    changed at any time. Position error shapes a velocity demand, velocity
+    error an acceleration demand, and acceleration then moves toward that
+    demand at no more than the jerk limit.
+    """
+
+    def __init__(self, max_speed, max_accel, max_jerk):
+        self.position = 0.0
+        self.velocity = 0.0
+        self.acceleration = 0.0
+        self.target = 0.0
+        self.set_limits(max_speed, max_accel, max_jerk)
+
+    def set_limits(self, max_speed, max_accel, max_jerk):
+        self.max_speed = max_speed
+        self.max_accel = max_accel
+        self.max_jerk = max_jerk
+        # velocity loop bandwidth follows how fast acceleration can change;
+        # the position loop runs slower so the two don't fight
+        self._accel_gain = max_jerk / max_accel
+        self._vel_gain = self._accel_gain / 3.0
+        # brake a bit softer than max_accel, the jerk-limited corners need the margin
+        self._brake_accel = max_accel * 0.75
+
+    def reset(self, position):
+        self.position = self.target = float(position)
+        self.velocity = self.acceleration = 0.0
+
+    def settled(self):
+        return self.velocity == 0.0 and self.acceleration == 0.0 and self.position == self.target
+
+    def update(self, dt):
+        error = self.target - self.position
+        if (abs(error) < SETTLE_STEPS and abs(self.velocity) < self.max_accel * dt
+                and abs(self.acceleration) <= self.max_jerk * dt):
+            self.reset(self.target)
+            return
+
+        v_demand = sqrt_controller(error, self._vel_gain, self._brake_accel)
+        v_demand = max(-self.max_speed, min(self.max_speed, v_demand))
+        a_demand = sqrt_controller(v_demand - self.velocity, self._accel_gain, self.max_jerk)
+        a_demand = max(-self.max_accel, min(self.max_accel, a_demand))
+
+        max_da = self.max_jerk * dt
+        da = max(-max_da, min(max_da, a_demand - self.acceleration))
+        a0 = self.acceleration
+        self.acceleration = a0 + da
+        v0 = self.velocity
+        self.velocity = v0 + (a0 + self.acceleration) * 0.5 * dt
+        self.position += (v0 + self.velocity) * 0.5 * dt
+
+
+class SCurveStepper(AccelStepper):
+    """
+    AccelStepper that follows an SCurveProfile toward its target instead of
+    the trapezoidal ramp. The profile is sampled every PROFILE_DT_US and
+    the step rate set to its velocity, so StepScheduler and `while run()`
+    loops work unchanged. set_speed()/run_speed() keep the constant-speed
+    behaviour homing relies on.
+    """
+    _profile = None  # AccelStepper.__init__ already calls the limit setters
+    _profiling = False
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._profile = SCurveProfile(self._maxSpeed, self._acceleration, self._jerk())
+        self._last_tick = 0
+        self._next_tick = 0
+
+    def _jerk(self):
+        return self._acceleration / SCURVE_JERK_TIME
+
+    def set_max_speed(self, speed: float) -> None:
+        super().set_max_speed(speed)
+        if self._profile is not None:
+            self._profile.set_limits(self._maxSpeed, self._acceleration, self._jerk())
+
+    def set_acceleration(self, acceleration: float) -> None:
+        super().set_acceleration(acceleration)
+        if self._profile is not None:
+            self._profile.set_limits(self._maxSpeed, self._acceleration, self._jerk())
+
+    def move_to(self, absolute: int) -> None:
+        self._targetPos = absolute
+        self._profile.target = absolute
+        if not self._profiling:
+            # start from wherever the stepper is, including constant-speed motion
+            self._profile.position = float(self._currentPos)
+            self._profile.velocity = self._speed
+            self._profile.acceleration = 0.0
+            self._profiling = True
+            self._last_tick = self._next_tick = self._clock()
+
+    def compute_new_speed(self) -> None:
+        if self._profiling:
+            self._follow_profile()
+
+    def _follow_profile(self):
+        """Advance the profile to now and set the step rate that follows it."""
+        now = self._clock()
+        profile = self._profile
+        profile.update(min(now - self._last_tick, 10 * PROFILE_DT_US) / 1e6)
+        self._last_tick = now
+        self._next_tick = now + PROFILE_DT_US
+
+        speed = profile.velocity + FOLLOW_GAIN * (profile.position - self._currentPos)
+        speed = max(-self._maxSpeed, min(self._maxSpeed, speed))  # catching up never exceeds the limit
+        if profile.settled() and self._currentPos == self._targetPos:
+            self._profiling = False
+            speed = 0.0
+        if abs(speed) < 1.0:
+            self._stepInterval = 0
+            self._speed = 0.0
+        else:
+            self._stepInterval = 1000000.0 / abs(speed)
+            self._direction = DIRECTION_CW if speed > 0 else DIRECTION_CCW
+            self._speed = speed
+
+    def run(self) -> bool:
+        if self._profiling and self._clock() >= self._next_tick:
+            self._follow_profile()
+        self.run_speed()
+        return self.is_running()
+
+    def next_step_time(self):
+        step = super().next_step_time()
+        if not self._profiling:
+            return step
+        return self._next_tick if step is None else min(step, self._next_tick)
+
+    def is_running(self) -> bool:
+        return self._profiling or super().is_running()
+
+    def set_speed(self, speed: float) -> None:
+        self._profiling = False
+        super().set_speed(speed)
+
+    def set_current_position(self, position: int) -> None:
+        super().set_current_position(position)
+        self._profile.reset(position)
+        self._profiling = False
+
+    def stop(self) -> None:
+        v = self._profile.velocity
+        brake = v * v / (2.0 * self._profile._brake_accel) + abs(v) * SCURVE_JERK_TIME
+        self.move_to(int(self._currentPos + copysign(brake, v)))
+
+
+def _simulate_trapezoid(distance, max_speed, accel, retarget=None):
+    """Step times of AccelStepper's own ramp: (times_s, positions)."""
+    stepper = AccelStepper(lambda: None, lambda: None)
+    stepper.set_max_speed(max_speed)
+    stepper.set_acceleration(accel)
+    stepper.move_to(distance)
+    t, times, positions = 0.0, [0.0], [0]
+    while stepper._stepInterval:
+        t += stepper._stepInterval / 1e6
+        stepper._currentPos += 1 if stepper._direction == DIRECTION_CW else -1
+        if retarget and t >= retarget[0] and stepper.target_position() != retarget[1]:
+            stepper.move_to(retarget[1])
+        stepper.compute_new_speed()
+        times.append(t)
+        positions.append(stepper._currentPos)
+    return times, positions
+
+
+def _simulate_scurve(distance, max_speed, accel, retarget=None, dt=PROFILE_DT_US / 1e6):
+    profile = SCurveProfile(max_speed, accel, accel / SCURVE_JERK_TIME)
+    profile.target = distance
+    t, times, positions, accels = 0.0, [0.0], [0.0], [0.0]
+    while not profile.settled() and t < 10.0:
+        if retarget and t >= retarget[0]:
+            profile.target = retarget[1]
+        profile.update(dt)
+        t += dt
+        times.append(t)
+        positions.append(profile.position)
+        accels.append(profile.acceleration)
+    return times, positions, accels
+
+
+def _step_accels(times, positions):
+    """Acceleration implied by consecutive step intervals, in steps/s^2."""
+    speeds = []
+    for i in range(1, len(times)):
+        dt = times[i] - times[i - 1]
+        speeds.append(((positions[i] - positions[i - 1]) / dt, times[i]))
+    return [abs(v1 - v0) / (t1 - t0) for (v0, t0), (v1, t1) in zip(speeds, speeds[1:]) if t1 > t0]
+
+
+def _overshoot(times, positions, retarget, distance):
+    """Steps past the final target after first reaching it."""
+    t_change, target = retarget or (0.0, distance)
+    i = next(k for k, t in enumerate(times) if t >= t_change)
+    sign = 1 if target >= positions[i] else -1
+    past = [(p - target) * sign for p in positions[i:]]
+    reached = next((k for k, e in enumerate(past) if e >= 0), len(past))
+    return max(past[reached:], default=0.0)
+
+
+if __name__ == "__main__":
+    # Simulated comparison of AccelStepper's trapezoidal ramp against the S-curve
+    max_speed, accel = 8000, 20000
+    cases = [("short hop", 200, None), ("long slew", 6000, None),
+             ("retarget mid-move", 4000, (0.5, 1000))]
+    print(f"{'':18s} {'profile':16s} {'settle s':>8s} {'peak accel':>10s} {'peak jerk':>10s} {'overshoot':>9s}")
+    for name, distance, retarget in cases:
+        t_trap, p_trap = _simulate_trapezoid(distance, max_speed, accel, retarget)
+        print(f"{name:18s} {'trapezoid':16s} {t_trap[-1]:8.3f} {max(_step_accels(t_trap, p_trap)):10.0f} "
+              f"{'unbounded':>10s} {_overshoot(t_trap, p_trap, retarget, distance):9.1f}")
+        for scale in (1.0, 1.5):
+            t_s, p_s, a_s = _simulate_scurve(distance, max_speed, accel * scale, retarget)
+            jerk = max(abs(a1 - a0) for a0, a1 in zip(a_s, a_s[1:])) / (PROFILE_DT_US / 1e6)
+            label = "s-curve" if scale == 1.0 else f"s-curve x{scale} acc"
+            print(f"{'':18s} {label:16s} {t_s[-1]:8.3f} {max(map(abs, a_s)):10.0f} "
+                  f"{jerk:10.0f} {_overshoot(t_s, p_s, retarget, distance):9.1f}")
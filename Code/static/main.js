@@ -266,6 +266,9 @@ document.addEventListener("DOMContentLoaded", function () {
         } else if (data.gimbal_state === "homing_error") {
             homingStatus.textContent = "Error Homing";
             homingStatus.className = "status-value Error";
+        } else if (data.gimbal_state.startsWith("homing_error_motor")) {
+            homingStatus.textContent = "Error Homing Motor " + data.gimbal_state.slice(-1);
+            homingStatus.className = "status-value Error";
         } else if (data.gimbal_state === "unknown") {
             homingStatus.textContent = "Unknown State";
             homingStatus.className = "status-value Error";
@@ -280,7 +283,7 @@ document.addEventListener("DOMContentLoaded", function () {
         document.getElementById("sensor-status-1").textContent = data.sensor1 ? "Detected!" : "Not detected";
         document.getElementById("sensor-status-2").textContent = data.sensor2 ? "Detected!" : "Not detected";
 
-        trackBtn.disabled = data.gimbal_state === "gimbal_not_found" || data.gimbal_state === "homing_error" || data.gimbal_state === "unknown";
+        trackBtn.disabled = data.gimbal_state === "gimbal_not_found" || data.gimbal_state.startsWith("homing_error") || data.gimbal_state === "unknown";
     });
 
     // 🔁 Auto Mode Feedback
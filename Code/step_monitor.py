@@ -0,0 +1,128 @@
+# step_monitor.py
+#
+# Catches step loss while the gimbal runs: every slow pass through the home
+# position is a free position measurement from the hall sensor.
+import os
+import time
+import logging
+import threading
+from homing import nearest_home
+
+logger = logging.getLogger("App")
+
+STEP_CHECK_MAX_SPEED = float(os.getenv("STEP_CHECK_MAX_SPEED", 2000))      # steps/s; faster passes are ignored
+STEP_CHECK_DEADBAND_DEG = float(os.getenv("STEP_CHECK_DEADBAND_DEG", 0.5))  # errors below this are left alone
+STEP_CHECK_REHOME_DEG = float(os.getenv("STEP_CHECK_REHOME_DEG", 5.0))      # errors above this request a re-home
+STEP_CHECK_INTERVAL = 0.05  # seconds between checks for a pending correction
+
+
+class StepLossMonitor:
+    """
+    Watches one hall sensor after homing. A full pass through the trigger
+    zone (enter and leave while moving the same way, below
+    STEP_CHECK_MAX_SPEED) puts the zone's centre, i.e. step 0 modulo one
+    revolution, at the midpoint of the two edges. Its offset from where the
+    step count puts it is the accumulated step loss:
+
+    - up to STEP_CHECK_DEADBAND_DEG: ignored (sensor hysteresis, latency)
+    - up to STEP_CHECK_REHOME_DEG: set_current_position() is corrected the
+      next time the motor is at rest
+    - beyond that: on_rehome() is called and the monitor detaches
+
+    Passes whose width doesn't match the zone measured by homing, e.g. a
+    reversal inside the zone, are skipped.
+    """
+
+    def __init__(self, motor, hall_sensor, motor_num, degrees_per_step, on_rehome=None):
+        self.motor = motor
+        self.sensor = hall_sensor
+        self.motor_num = motor_num
+        self.steps_per_rev = int(round(360.0 / degrees_per_step))
+        self.deadband = STEP_CHECK_DEADBAND_DEG / degrees_per_step
+        self.rehome_steps = STEP_CHECK_REHOME_DEG / degrees_per_step
+        self.on_rehome = on_rehome
+        self.zone_width = None
+        self.pending = None      # correction in steps waiting for the motor to stop
+        self.crossings = 0       # passes measured since homing
+        self.corrections = 0
+        self.last_error = None
+        self._entered = None     # (position, moving forward) at the zone entry
+        self._thread = None
+
+    def attach(self, zone):
+        """Start watching with the (entry, exit) step positions measured by homing."""
+        self.zone_width = abs(zone[1] - zone[0])
+        self.pending = self._entered = None
+        self.crossings = self.corrections = 0
+        self.sensor.when_deactivated = self._on_enter  # active-low, see FastHomer
+        self.sensor.when_activated = self._on_leave
+
+    def detach(self):
+        self.zone_width = None
+        self.pending = None
+        if self.sensor.when_deactivated == self._on_enter:
+            self.sensor.when_deactivated = None
+            self.sensor.when_activated = None
+
+    def _moving(self):
+        """Direction of travel (True = forward), or None when too slow or too fast to measure."""
+        speed = self.motor.speed()
+        if not speed or abs(speed) > STEP_CHECK_MAX_SPEED:
+            return None
+        return speed > 0
+
+    def _on_enter(self):
+        forward = self._moving()
+        self._entered = None if forward is None else (self.motor.current_position(), forward)
+
+    def _on_leave(self):
+        entered, self._entered = self._entered, None
+        forward = self._moving()
+        if entered is None or forward is None or forward != entered[1] or self.zone_width is None:
+            return
+        position = self.motor.current_position()
+        if abs(abs(position - entered[0]) - self.zone_width) > 2 * self.deadband:
+            return
+        centre = (position + entered[0]) / 2
+        self.check(centre - nearest_home(int(round(centre)), self.steps_per_rev))
+
+    def check(self, error):
+        """Act on a measured offset (steps) of the home position from step 0."""
+        self.crossings += 1
+        self.last_error = error
+        if abs(error) <= self.deadband:
+            return
+        if abs(error) > self.rehome_steps:
+            logger.warning(f"[StepMonitor] Motor {self.motor_num} is {error:.0f} steps off, requesting re-home")
+            self.detach()
+            if self.on_rehome is not None:
+                self.on_rehome()
+            return
+        self.pending = int(round(error))
+
+    def apply_correction(self):
+        """Apply a pending correction if the motor is at rest; returns True when one was applied."""
+        error = self.pending
+        if error is None or self.motor.is_running():
+            return False
+        self.pending = None
+        target = self.motor.target_position()
+        self.motor.set_current_position(self.motor.current_position() - error)
+        if target != self.motor.current_position() + error:
+            self.motor.move_to(target)  # a move came in since the check, keep it
+        self.corrections += 1
+        logger.info(f"[StepMonitor] Motor {self.motor_num} corrected by {-error} steps")
+        return True
+
+    def start(self):
+        """Apply corrections from a background thread; safe to call again after each homing."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(STEP_CHECK_INTERVAL)
+            if self.zone_width is not None:
+                self.apply_correction()
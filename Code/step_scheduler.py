@@ -0,0 +1,104 @@
+# step_scheduler.py
+import time
+from AccelStepper import micros
+
+try:
+    # app.py monkey-patches time.sleep to gevent's, which only has ms resolution
+    from gevent.monkey import get_original
+    _sleep = get_original("time", "sleep")
+except ImportError:
+    _sleep = time.sleep
+
+# Gap after which a step is treated as the start of a new move for rate stats
+_MOVE_GAP_US = 100000
+
+
+class _AxisStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.intervals = 0       # steps that followed another step of the same move
+        self.commanded_us = 0.0  # sum of step intervals AccelStepper asked for
+        self.actual_us = 0.0     # sum of step intervals actually achieved
+        self.late_sum_us = 0.0
+        self.late_max_us = 0.0
+
+    def to_dict(self):
+        n = self.steps
+        k = self.intervals
+        return {
+            "steps": n,
+            "commanded_sps": round(k / self.commanded_us * 1e6, 1) if self.commanded_us else 0.0,
+            "achieved_sps": round(k / self.actual_us * 1e6, 1) if self.actual_us else 0.0,
+            "jitter_us_mean": round(self.late_sum_us / k, 1) if k else 0.0,
+            "jitter_us_max": round(self.late_max_us, 1),
+        }
+
+
+class StepScheduler:
+    """
+    Steps several AccelSteppers from one thread. Instead of one run() per
+    1 ms tick, it sleeps until the earliest step deadline and issues every
+    step that is due on each wake, so each axis can reach its configured
+    max speed. Sleeps end spin_us early and busy-wait the remainder.
+    """
+
+    def __init__(self, motors, spin_us=100):
+        self.motors = list(motors)
+        self.spin_us = spin_us
+        self._stats = [_AxisStats() for _ in self.motors]
+        self._last_step = [None] * len(self.motors)
+
+    def _wait_until(self, deadline):
+        remaining = deadline - micros()
+        if remaining > self.spin_us:
+            _sleep((remaining - self.spin_us) / 1e6)
+        while micros() < deadline:
+            pass
+
+    def service(self, duration):
+        """Issue due steps for `duration` seconds, then return for control work."""
+        end = micros() + duration * 1e6
+        while True:
+            now = micros()
+            earliest = None
+            for i, motor in enumerate(self.motors):
+                deadline = motor.next_step_time()
+                if deadline is not None and deadline <= now:
+                    interval = motor._stepInterval
+                    pos = motor.current_position()
+                    motor.run()
+                    if motor.current_position() != pos:
+                        self._record(i, now, deadline, interval)
+                    deadline = motor.next_step_time()
+                if deadline is not None and (earliest is None or deadline < earliest):
+                    earliest = deadline
+            if earliest is None or earliest >= end:
+                self._wait_until(end)
+                return
+            self._wait_until(earliest)
+
+    def _record(self, i, now, deadline, interval):
+        stats = self._stats[i]
+        last = self._last_step[i]
+        self._last_step[i] = now
+        stats.steps += 1
+        # the first step of a move is due "in the past" by design; only
+        # steps that follow another one say anything about timing
+        if last is not None and now - last < _MOVE_GAP_US:
+            late = max(now - deadline, 0.0)
+            stats.intervals += 1
+            stats.commanded_us += interval
+            stats.actual_us += now - last
+            stats.late_sum_us += late
+            stats.late_max_us = max(stats.late_max_us, late)
+
+    def stats(self, reset=True):
+        """Commanded vs achieved step rate and deadline lateness per axis since the last reset."""
+        out = {f"motor{i + 1}": s.to_dict() for i, s in enumerate(self._stats)}
+        if reset:
+            for s in self._stats:
+                s.reset()
+        return out
@@ -0,0 +1,48 @@
+# stepper_bench.py
+#
+# How many steps per second the Python side of AccelStepper can issue,
+# with the ramp recurrence evaluated per step vs taken from ramp tables.
+# Uses the functional interface, so no GPIO is touched.
+import sys
+import time
+from AccelStepper import AccelStepper
+
+
+def make_stepper(table, max_speed, acceleration):
+    stepper = AccelStepper(lambda: None, lambda: None)
+    stepper.set_max_speed(max_speed)
+    stepper.set_acceleration(acceleration)
+    if table:
+        stepper.use_ramp_table()
+    return stepper
+
+
+def bench_profile(table, steps=200000, max_speed=8000, acceleration=20000):
+    """Speed updates per second: walk a whole move, one compute_new_speed() per step."""
+    stepper = make_stepper(table, max_speed, acceleration)
+    stepper.move_to(steps)
+    t0 = time.perf_counter()
+    while stepper._stepInterval:
+        stepper._currentPos += 1
+        stepper.compute_new_speed()
+    return steps / (time.perf_counter() - t0)
+
+
+def bench_run(table, steps=200000):
+    """Steps per second of a `while run()` loop when every call is due to step."""
+    # limits far above what Python can reach, so run() is never waiting on time
+    stepper = make_stepper(table, 1e6, 1e9)
+    stepper.move_to(steps)
+    t0 = time.perf_counter()
+    while stepper.run():
+        pass
+    return steps / (time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for name, bench in (("compute_new_speed", bench_profile), ("run() loop", bench_run)):
+        recurrence = bench(False, steps)
+        table = bench(True, steps)
+        print(f"{name:18s} recurrence {recurrence:10.0f} steps/s   "
+              f"table {table:10.0f} steps/s   x{table / recurrence:.2f}")
@@ -0,0 +1,111 @@
+# surface_index.py
+import os
+import hashlib
+import logging
+import cv2
+import numpy as np
+
+logger = logging.getLogger("App")
+
+# Bump when the raster layout or the nearest-surface rule changes
+INDEX_VERSION = 1
+
+
+def surface_labels(surfaces, width, height):
+    """
+    Raster holding, for every pixel, the index of the first surface polygon
+    containing it, or -1 outside all surfaces.
+    """
+    labels = np.full((height, width), -1, np.int16)
+    # paint in reverse so the lowest index wins where polygons overlap,
+    # matching the first-match order of the old polygon scan
+    for idx in reversed(range(len(surfaces))):
+        poly = np.round(np.array(surfaces[idx]["points"])).astype(np.int32)
+        cv2.fillPoly(labels, [poly], idx)
+    return labels
+
+
+def nearest_surface_labels(labels):
+    """
+    Distance transform of the background: for every pixel, the surface it lies
+    in or the surface with the closest edge, plus the distance to it in pixels.
+    """
+    inside = labels >= 0
+    if not inside.any():
+        return np.full(labels.shape, -1, np.int16), np.full(labels.shape, np.inf, np.float32)
+
+    # every surface pixel becomes its own zero-pixel seed
+    src = np.where(inside, 0, 255).astype(np.uint8)
+    distance, seeds = cv2.distanceTransformWithLabels(
+        src, cv2.DIST_L2, cv2.DIST_MASK_PRECISE, labelType=cv2.DIST_LABEL_PIXEL)
+    seed_surface = np.full(seeds.max() + 1, -1, np.int16)
+    seed_surface[seeds[inside]] = labels[inside]
+    return seed_surface[seeds], distance.astype(np.float32)
+
+
+class SurfaceIndex:
+    """
+    surfaces.json compiled to rasters so both "which surface contains this
+    pixel" and "which surface is closest" are a single array index.
+    """
+
+    def __init__(self, labels, nearest, distance):
+        self.labels = labels
+        self.nearest = nearest
+        self.distance = distance
+        self.height, self.width = labels.shape
+
+    def _clamp(self, x, y):
+        return (min(max(int(y), 0), self.height - 1),
+                min(max(int(x), 0), self.width - 1))
+
+    def surface_at(self, x, y):
+        """Index of the surface containing (x, y), or -1."""
+        return int(self.labels[self._clamp(x, y)])
+
+    def nearest_surface(self, x, y):
+        """Index of the surface containing or closest to (x, y), or -1 without surfaces."""
+        return int(self.nearest[self._clamp(x, y)])
+
+    def _clamp_many(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        return (np.clip(points[:, 1].astype(np.intp), 0, self.height - 1),
+                np.clip(points[:, 0].astype(np.intp), 0, self.width - 1))
+
+    def surface_at_many(self, points):
+        """Vectorized surface_at() for an (N, 2) array of pixels."""
+        return self.labels[self._clamp_many(points)]
+
+    def nearest_surface_many(self, points):
+        """Vectorized nearest_surface() for an (N, 2) array of pixels."""
+        return self.nearest[self._clamp_many(points)]
+
+
+def _file_key(surfaces_path, width, height):
+    h = hashlib.sha1()
+    with open(surfaces_path, "rb") as f:
+        h.update(f.read())
+    h.update(f"v{INDEX_VERSION}/{width}x{height}".encode())
+    return h.hexdigest()
+
+
+def load_surface_index(surfaces, surfaces_path, cache_path, width, height):
+    """Load the compiled rasters from cache_path, rebuilding them when surfaces.json changed."""
+    key = _file_key(surfaces_path, width, height)
+
+    if os.path.exists(cache_path):
+        try:
+            cached = np.load(cache_path)
+            if str(cached["key"]) == key:
+                return SurfaceIndex(cached["labels"], cached["nearest"], cached["distance"])
+        except Exception:
+            logger.exception("Failed to read surface index cache, rebuilding")
+
+    logger.info("Compiling surface index...")
+    labels = surface_labels(surfaces, width, height)
+    nearest, distance = nearest_surface_labels(labels)
+    # write through a temp file so a crash never leaves a half-written cache
+    tmp_path = cache_path + ".tmp.npz"
+    np.savez_compressed(tmp_path, key=key, labels=labels, nearest=nearest, distance=distance)
+    os.replace(tmp_path, cache_path)
+    return SurfaceIndex(labels, nearest, distance)
@@ -0,0 +1,59 @@
+# surface_model.py
+import numpy as np
+
+# Header written into every exported .npz; bump MODEL_FORMAT_VERSION on layout changes
+MODEL_FORMAT = "purrfectspray-surface-models"
+MODEL_FORMAT_VERSION = 1
+
+
+class PolySurfaceModel:
+    """
+    Pixel -> (theta1, theta2) polynomial evaluated with plain NumPy. Holds the
+    same numbers as a PolynomialFeatures + LinearRegression pipeline and has
+    a compatible predict(), so the runtime never needs to import sklearn.
+    """
+
+    def __init__(self, powers, coef, intercept):
+        self.powers = np.asarray(powers, dtype=np.int64)        # (F, 2) exponents of x, y
+        self.coef = np.asarray(coef, dtype=np.float64)          # (2, F)
+        self.intercept = np.asarray(intercept, dtype=np.float64)  # (2,)
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, 2)
+        features = np.prod(X[:, None, :] ** self.powers[None, :, :], axis=2)
+        return features @ self.coef.T + self.intercept
+
+    @classmethod
+    def from_sklearn(cls, pipeline):
+        """Extract coefficients from a fitted make_pipeline(PolynomialFeatures, LinearRegression)."""
+        poly = pipeline.steps[0][1]
+        linear = pipeline.steps[-1][1]
+        return cls(poly.powers_, linear.coef_, linear.intercept_)
+
+
+def save_surface_models(path, models):
+    """Write {surface_idx: PolySurfaceModel} into a single versioned .npz."""
+    arrays = {
+        "format": np.array(MODEL_FORMAT),
+        "version": np.array(MODEL_FORMAT_VERSION),
+        "surfaces": np.array(sorted(models), dtype=np.int64),
+    }
+    for idx, model in models.items():
+        arrays[f"powers_{idx}"] = model.powers
+        arrays[f"coef_{idx}"] = model.coef
+        arrays[f"intercept_{idx}"] = model.intercept
+    np.savez(path, **arrays)
+
+
+def load_surface_models(path):
+    """Read a .npz written by save_surface_models. Returns {surface_idx: PolySurfaceModel}."""
+    with np.load(path, allow_pickle=False) as data:
+        if str(data["format"]) != MODEL_FORMAT:
+            raise ValueError(f"{path} is not a surface model file")
+        version = int(data["version"])
+        if version != MODEL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported surface model version {version} in {path}")
+        return {
+            int(idx): PolySurfaceModel(data[f"powers_{idx}"], data[f"coef_{idx}"], data[f"intercept_{idx}"])
+            for idx in data["surfaces"]
+        }
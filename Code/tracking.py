@@ -0,0 +1,195 @@
+# tracking.py
+#
+# Turns sparse target updates (one per detection, ~15 Hz) into a smooth
+# stream of motor position commands. The setpoint is recomputed only when
+# a new target arrives; between detections the reference is extrapolated
+# along the target's velocity and followed by a critically damped filter.
+import os
+import time
+from scurve import sqrt_controller
+
+TRACKING_OMEGA = float(os.getenv("TRACKING_OMEGA", 40.0))              # rad/s, filter bandwidth
+TRACKING_COMMAND_HZ = float(os.getenv("TRACKING_COMMAND_HZ", 100.0))   # max move_to rate
+MAX_EXTRAPOLATION = 0.5  # seconds a reference is extrapolated past its capture time
+
+
+class TrackingController:
+    """
+    Per-axis critically damped follower with velocity feed-forward, in steps.
+    Near the reference it is the linear law
+
+        a = w^2 (r(t) - x) + 2 w (v_ref - v),   r(t) = r0 + v_ref (t - t0)
+
+    which tracks a constant-velocity target with zero steady-state lag. For
+    large errors the position term becomes a sqrt braking curve, so the
+    clamp to the motor's acceleration cannot cause overshoot.
+
+    update() returns (positions, speeds) at most `rate_hz` times per second
+    and only when the positions changed. Each position leads the setpoint
+    by the distance AccelStepper needs to stop from the setpoint's speed,
+    so a stepper capped at that speed cruises along the setpoint instead
+    of braking toward every command (see MultiStepper.track()).
+    """
+
+    def __init__(self, max_speed, max_accel, n_axes=2, omega=TRACKING_OMEGA,
+                 rate_hz=TRACKING_COMMAND_HZ, max_extrapolation=MAX_EXTRAPOLATION):
+        self.max_speed = max_speed
+        self.max_accel = max_accel
+        self.omega = omega
+        self.brake_accel = 0.8 * max_accel
+        self.period = 1.0 / rate_hz
+        self.max_extrapolation = max_extrapolation
+        self.n_axes = n_axes
+        self.x = [0.0] * n_axes
+        self.v = [0.0] * n_axes
+        self.ref = None            # reference positions at ref_time
+        self.ref_v = [0.0] * n_axes
+        self.ref_time = 0.0
+        self.last_update = None
+        self.last_command_time = None
+        self.last_command = None
+        self.commands = 0
+        self.last_target = None  # perf_counter() of the last set_target() call
+
+    def reset(self, positions, now=None):
+        """Start from the motors' current positions at rest."""
+        self.x = [float(p) for p in positions]
+        self.v = [0.0] * self.n_axes
+        self.ref = None
+        self.last_update = time.perf_counter() if now is None else now
+        self.last_command = None
+        self.last_target = None
+
+    def set_target(self, positions, velocities=None, timestamp=None):
+        """New target in steps, its velocity in steps/s and when it was observed (perf_counter)."""
+        self.ref = [float(p) for p in positions]
+        self.ref_v = [float(v) for v in velocities] if velocities is not None else [0.0] * self.n_axes
+        self.ref_time = time.perf_counter() if timestamp is None else timestamp
+        self.last_target = time.perf_counter()
+
+    def _reference(self, i, now):
+        ahead = min(max(now - self.ref_time, 0.0), self.max_extrapolation)
+        return self.ref[i] + self.ref_v[i] * ahead
+
+    def update(self, now=None):
+        """Advance the follower to `now`; returns (positions, speeds) to command, or None."""
+        now = time.perf_counter() if now is None else now
+        if self.ref is None:
+            self.last_update = now
+            return None
+        if self.last_update is None:
+            self.last_update = now
+        dt = min(now - self.last_update, 0.05)
+        self.last_update = now
+
+        w = self.omega
+        for i in range(self.n_axes):
+            error = self._reference(i, now) - self.x[i]
+            v_demand = self.ref_v[i] + sqrt_controller(error, 0.5 * w, self.brake_accel)
+            a = 2.0 * w * (v_demand - self.v[i])
+            a = max(-self.max_accel, min(self.max_accel, a))
+            v = max(-self.max_speed, min(self.max_speed, self.v[i] + a * dt))
+            self.x[i] += (self.v[i] + v) * 0.5 * dt
+            self.v[i] = v
+
+        if self.last_command_time is not None and now - self.last_command_time < self.period:
+            return None
+        lead = 0.5 / self.max_accel
+        command = [int(round(x + v * abs(v) * lead)) for x, v in zip(self.x, self.v)]
+        if command == self.last_command:
+            return None
+        self.last_command_time = now
+        self.last_command = command
+        self.commands += 1
+        return command, [abs(v) for v in self.v]
+
+
+if __name__ == "__main__":
+    # Step and ramp responses on simulated steppers, old 10% interpolation vs this controller
+    import math
+    from AccelStepper import AccelStepper, DIRECTION_CW
+    from multi_stepper import MultiStepper
+
+    MAX_SPEED, ACCEL = 8000, 20000
+    LOOP_DT = 0.001       # run_motor_loop period
+    FRAME_DT = 1 / 15     # detection rate
+    LATENCY = 0.06        # capture -> target available
+
+    class SimAxis(AccelStepper):
+        """AccelStepper stepped in virtual time."""
+
+        def __init__(self):
+            super().__init__(lambda: None, lambda: None)
+            self.set_max_speed(MAX_SPEED)
+            self.set_acceleration(ACCEL)
+            self.last_step = -1.0
+
+        def advance(self, t0, t1):
+            while self._stepInterval:
+                t = max(self.last_step + self._stepInterval / 1e6, t0)
+                if t > t1:
+                    break
+                self._currentPos += 1 if self._direction == DIRECTION_CW else -1
+                self.last_step = t
+                self.compute_new_speed()
+
+    def simulate(method, target_fn, duration):
+        """target_fn(t) -> ((p1, p2), (v1, v2)); returns sampled errors, settle info and command count."""
+        axes = [SimAxis(), SimAxis()]
+        gimbal = MultiStepper(axes, MAX_SPEED, ACCEL)
+        controller = TrackingController(MAX_SPEED, ACCEL)
+        controller.reset([0, 0], now=0.0)
+        last_steps = [0, 0]
+        seen = None          # (capture time, positions, velocities) of the newest detection
+        next_frame = 0.0
+        commands, errors, t = 0, [], 0.0
+        while t < duration:
+            # a frame captured at next_frame becomes available LATENCY later
+            if t >= next_frame + LATENCY:
+                positions, velocities = target_fn(next_frame)
+                seen = (next_frame, positions, velocities)
+                if method == "controller":
+                    controller.set_target(positions, velocities, next_frame)
+                next_frame += FRAME_DT
+            if seen is not None:
+                if method == "interpolate":
+                    t_capture, positions, velocities = seen
+                    aim = [p + v * (t - t_capture) for p, v in zip(positions, velocities)]
+                    last_steps = [int(l + (a - l) * 0.1) for l, a in zip(last_steps, aim)]
+                    gimbal.move_to(last_steps)
+                    commands += 1
+                else:
+                    command = controller.update(t)
+                    if command is not None:
+                        gimbal.track(*command)
+                        commands += 1
+            for axis in axes:
+                axis.advance(t, t + LOOP_DT)
+            t += LOOP_DT
+            truth, _ = target_fn(t)
+            errors.append((t, max(abs(a.current_position() - p) for a, p in zip(axes, truth))))
+        return errors, commands
+
+    def settle_time(errors, tolerance):
+        for k in range(len(errors) - 1, -1, -1):
+            if errors[k][1] > tolerance:
+                return errors[k + 1][0] if k + 1 < len(errors) else math.inf
+        return 0.0
+
+    step = lambda t: ((1500, 400), (0.0, 0.0)) if t >= 0.0 else ((0, 0), (0.0, 0.0))
+    ramp = lambda t: ((600 * t, -250 * t), (600.0, -250.0))
+    weave = lambda t: ((800 * math.sin(2 * t), 300 * math.sin(3 * t)),
+                       (1600 * math.cos(2 * t), 900 * math.cos(3 * t)))
+
+    print(f"{'scenario':22s} {'method':12s} {'settle(2 steps)':>15s} {'final err':>9s} "
+          f"{'rms err':>8s} {'max err':>8s} {'move_to/s':>9s}")
+    for name, fn, duration, warmup in (("step 1500/400", step, 2.0, 0.0),
+                                       ("ramp 600/-250 sps", ramp, 3.0, 1.0),
+                                       ("weave", weave, 4.0, 1.0)):
+        for method in ("interpolate", "controller"):
+            errors, commands = simulate(method, fn, duration)
+            tail = [e for t, e in errors if t >= warmup]
+            rms = math.sqrt(sum(e * e for e in tail) / len(tail))
+            settle = settle_time(errors, 2) if fn is step else math.nan
+            print(f"{name:22s} {method:12s} {settle:15.3f} {errors[-1][1]:9.0f} "
+                  f"{rms:8.1f} {max(tail):8.0f} {commands / duration:9.0f}")
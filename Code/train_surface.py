@@ -4,6 +4,7 @@ from sklearn.preprocessing import PolynomialFeatures
 from sklearn.linear_model import LinearRegression
 from sklearn.pipeline import make_pipeline
 import joblib
+from surface_model import PolySurfaceModel, save_surface_models
 from shapely.geometry import Polygon, Point
 import os
 
@@ -45,6 +46,7 @@ os.makedirs('models', exist_ok=True)
 
 # Train model per surface
 model_mapping = {}
+compact_models = {}
 for idx, points in surface_points.items():
     if not points:
         print(f"Skipping surface {idx}: no points.")
@@ -60,9 +62,13 @@ for idx, points in surface_points.items():
     joblib.dump(model, model_path)
 
     model_mapping[idx] = model_path
+    compact_models[idx] = PolySurfaceModel.from_sklearn(model)
 
 # Save mapping
 with open('models/model_mapping.json', 'w') as f:
     json.dump(model_mapping, f, indent=2)
 
+# Same models as raw polynomial coefficients, loaded by app.py without sklearn
+save_surface_models('models/surface_models.npz', compact_models)
+
 print("✅ All surface models trained and saved.")
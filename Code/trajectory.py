@@ -0,0 +1,145 @@
+# trajectory.py
+#
+# Timed laser paths played back on the gimbal Pi. The camera Pi uploads a
+# short list of waypoints once per detection instead of streaming every
+# setpoint, so network jitter no longer reaches the motors.
+import os
+import time
+import logging
+import threading
+from bisect import bisect_right
+
+logger = logging.getLogger("App")
+
+TRAJECTORY_RATE_HZ = float(os.getenv("TRAJECTORY_RATE_HZ", 100.0))  # playback command rate
+MAX_WAYPOINTS = 2000
+
+
+class Trajectory:
+    """
+    Waypoints (t, θ1, θ2) or (t, θ1, θ2, ω1, ω2): seconds from the start,
+    degrees and optionally degrees/s. Between waypoints the path is a cubic
+    Hermite spline; missing velocities are estimated from the neighbouring
+    waypoints (Catmull-Rom). Before the first and after the last waypoint
+    it holds still.
+    """
+
+    def __init__(self, points):
+        if not 0 < len(points) <= MAX_WAYPOINTS:
+            raise ValueError(f"trajectory needs 1..{MAX_WAYPOINTS} waypoints")
+        self.times = [float(p[0]) for p in points]
+        if any(b <= a for a, b in zip(self.times, self.times[1:])):
+            raise ValueError("trajectory times must increase")
+        self.angles = [(float(p[1]), float(p[2])) for p in points]
+        if all(len(p) >= 5 for p in points):
+            self.rates = [(float(p[3]), float(p[4])) for p in points]
+        else:
+            self.rates = [self._estimate_rate(i) for i in range(len(points))]
+
+    def _estimate_rate(self, i):
+        lo, hi = max(i - 1, 0), min(i + 1, len(self.times) - 1)
+        if lo == hi:
+            return (0.0, 0.0)
+        dt = self.times[hi] - self.times[lo]
+        return tuple((b - a) / dt for a, b in zip(self.angles[lo], self.angles[hi]))
+
+    @property
+    def duration(self):
+        return self.times[-1]
+
+    def sample(self, t):
+        """(angles, rates) at t seconds from the start."""
+        if t <= self.times[0]:
+            return self.angles[0], (0.0, 0.0)
+        if t >= self.times[-1]:
+            return self.angles[-1], (0.0, 0.0)
+        i = bisect_right(self.times, t) - 1
+        h = self.times[i + 1] - self.times[i]
+        s = (t - self.times[i]) / h
+        s2, s3 = s * s, s * s * s
+        # Hermite basis and its derivative
+        h00, h10, h01, h11 = 2 * s3 - 3 * s2 + 1, s3 - 2 * s2 + s, -2 * s3 + 3 * s2, s3 - s2
+        d00, d10, d01, d11 = 6 * s2 - 6 * s, 3 * s2 - 4 * s + 1, -6 * s2 + 6 * s, 3 * s2 - 2 * s
+        angles, rates = [], []
+        for axis in range(2):
+            p0, p1 = self.angles[i][axis], self.angles[i + 1][axis]
+            m0, m1 = self.rates[i][axis] * h, self.rates[i + 1][axis] * h
+            angles.append(h00 * p0 + h10 * m0 + h01 * p1 + h11 * m1)
+            rates.append((d00 * p0 + d10 * m0 + d01 * p1 + d11 * m1) / h)
+        return angles, rates
+
+
+class TrajectoryPlayer:
+    """
+    Plays a Trajectory against a MultiStepper from its own thread, like
+    TrackingController's output: each command leads the path by the
+    distance the stepper needs to stop from the path's speed, with the
+    speed capped just above it (see MultiStepper.track()).
+
+    play() replaces the current trajectory, or with replace=False appends
+    to it; cancel() stops following and leaves the motors at their target.
+    degrees_per_step has one entry per axis.
+    """
+
+    def __init__(self, gimbal, degrees_per_step, max_accel, rate_hz=TRAJECTORY_RATE_HZ, clock=time.monotonic):
+        self.gimbal = gimbal
+        self.degrees_per_step = degrees_per_step
+        self.brake_accel = 0.8 * max_accel
+        self.period = 1.0 / rate_hz
+        self.clock = clock
+        self.trajectory = None
+        self.start = None
+        self._lock = threading.Lock()
+        self._last_command = None
+
+    def play(self, trajectory, delay=0.0, replace=True):
+        """Start `trajectory` `delay` seconds from now (replace) or after the current one ends."""
+        now = self.clock()
+        with self._lock:
+            if not replace and self.trajectory is not None:
+                end = self.start + self.trajectory.duration
+                start = max(end, now + delay)
+                merged = list(zip(self.trajectory.times, self.trajectory.angles, self.trajectory.rates))
+                merged += [(t + start - self.start, a, r) for t, a, r in
+                           zip(trajectory.times, trajectory.angles, trajectory.rates)
+                           if t + start - self.start > merged[-1][0]]
+                self.trajectory = Trajectory([(t, *a, *r) for t, a, r in merged])
+            else:
+                self.trajectory = trajectory
+                self.start = now + delay
+            self._last_command = None
+
+    def cancel(self):
+        with self._lock:
+            active = self.trajectory is not None
+            self.trajectory = None
+        return active
+
+    @property
+    def active(self):
+        return self.trajectory is not None
+
+    def update(self, now=None):
+        """Command the motors for `now`; returns False once no trajectory is playing."""
+        now = self.clock() if now is None else now
+        with self._lock:
+            trajectory, start = self.trajectory, self.start
+            if trajectory is None:
+                return False
+            if now - start > trajectory.duration:
+                self.trajectory = None  # the last command already holds the end point
+        if now < start + trajectory.times[0]:
+            # not started yet: get to the first waypoint at full speed
+            angles, rates = trajectory.angles[0], (float("inf"), float("inf"))
+        else:
+            angles, rates = trajectory.sample(now - start)
+        positions, speeds = [], []
+        for angle, rate, dps in zip(angles, rates, self.degrees_per_step):
+            v = rate / dps
+            lead = v * abs(v) / (2.0 * self.brake_accel) if abs(v) != float("inf") else 0.0
+            positions.append(int(round(angle / dps + lead)))
+            speeds.append(abs(v))
+        if positions != self._last_command:
+            self._last_command = positions
+            self.gimbal.track(positions, speeds)
+        return True
@@ -0,0 +1,297 @@
+# wave_stepper.py
+#
+# AccelStepper backend that precomputes the acceleration profile and hands
+# it to lgpio as hardware-timed waves, so pulse timing comes from the GPIO
+# layer rather than from how often Python gets to call step().
+import bisect
+from collections import deque
+from AccelStepper import AccelStepper, DIRECTION_CW, micros
+
+STEP_BIT = 0b01       # bit of the step gpio within the claimed group
+DIR_BIT = 0b10        # bit of the direction gpio within the claimed group
+PULSE_US = 3          # step pulse high time
+DIR_SETUP_US = 5      # direction settle time before a step in the new direction
+CHUNK_US = 10000      # length of each queued wave; bounds retarget latency
+QUEUED_CHUNKS = 2     # waves kept queued ahead of the one playing
+
+
+class _Chunk:
+    __slots__ = ("start", "end", "step_offsets", "direction", "start_pos")
+
+    def __init__(self, start, end, step_offsets, direction, start_pos):
+        self.start = start
+        self.end = end
+        self.step_offsets = step_offsets
+        self.direction = direction
+        self.start_pos = start_pos
+
+
+class WaveStepper(AccelStepper):
+    """
+    Drop-in AccelStepper for a step/dir driver. The inherited ramp state
+    (_currentPos, _n, _cn, ...) describes the end of the queued waves; each
+    run() tops the queue up with the next CHUNK_US of the same profile
+    AccelStepper would have produced. current_position() reports the step
+    the hardware has actually reached.
+
+    `gpio` is the lgpio module or a MockWaveGPIO.
+    """
+
+    def __init__(self, step_pin, dir_pin, gpio=None, chip=0):
+        super().__init__(lambda: None, lambda: None)
+        if gpio is None:
+            import lgpio as gpio
+        self._gpio = gpio
+        self._step_pin = step_pin
+        self._handle = gpio.gpiochip_open(chip)
+        gpio.group_claim_output(self._handle, [step_pin, dir_pin])
+        self._chunks = deque()
+        self._constant_speed = False
+        self._last_dir = None
+
+    # ---- profile generation ----
+
+    def _plan_chunk(self):
+        """Advance the ramp state by up to CHUNK_US; returns (pulses, step_offsets, length_us)."""
+        g = self._gpio
+        pulses, offsets = [], []
+        t = 0
+        while t < CHUNK_US and self._stepInterval:
+            dir_bits = DIR_BIT if self._direction == DIRECTION_CW else 0
+            if dir_bits != self._last_dir:
+                pulses.append(g.pulse(dir_bits, STEP_BIT | DIR_BIT, DIR_SETUP_US))
+                t += DIR_SETUP_US
+                self._last_dir = dir_bits
+            offsets.append(t)
+            self._currentPos += 1 if self._direction == DIRECTION_CW else -1
+            if not self._constant_speed:
+                self.compute_new_speed()
+            interval = int(self._stepInterval) if self._stepInterval else PULSE_US * 2
+            pulses.append(g.pulse(STEP_BIT | dir_bits, STEP_BIT | DIR_BIT, PULSE_US))
+            pulses.append(g.pulse(dir_bits, STEP_BIT | DIR_BIT, max(interval - PULSE_US, PULSE_US)))
+            t += max(interval, PULSE_US * 2)
+        return pulses, offsets, t
+
+    def _top_up(self):
+        now = self._clock()
+        while self._chunks and self._chunks[0].end <= now:
+            self._chunks.popleft()
+        queued = len(self._chunks)
+        while queued < QUEUED_CHUNKS + 1 and self._stepInterval:
+            start_pos = self._currentPos
+            direction = 1 if self._direction == DIRECTION_CW else -1
+            pulses, offsets, length = self._plan_chunk()
+            if not pulses:
+                break
+            start = max(now, self._chunks[-1].end) if self._chunks else now
+            self._gpio.tx_wave(self._handle, self._step_pin, pulses)
+            self._chunks.append(_Chunk(start, start + length, offsets, direction, start_pos))
+            queued += 1
+
+    # ---- AccelStepper interface ----
+
+    def run(self) -> bool:
+        self._constant_speed = False
+        self._top_up()
+        return self.is_running()
+
+    def run_speed(self) -> bool:
+        self._constant_speed = True
+        self._top_up()
+        return bool(self._chunks)
+
+    def next_step_time(self):
+        """When the queue needs topping up, for StepScheduler."""
+        if not self._stepInterval:
+            return None
+        if len(self._chunks) <= QUEUED_CHUNKS:
+            return self._clock()
+        return self._chunks[-QUEUED_CHUNKS].start
+
+    def current_position(self) -> int:
+        now = self._clock()
+        for chunk in reversed(self._chunks):
+            if chunk.start <= now:
+                done = bisect.bisect_right(chunk.step_offsets, now - chunk.start)
+                return chunk.start_pos + chunk.direction * done
+        if self._chunks:
+            return self._chunks[0].start_pos
+        return self._currentPos
+
+    def set_current_position(self, position: int) -> None:
+        # drop whatever is still queued; tx_pulse(0, 0) cancels the gpio's tx queue
+        self._gpio.tx_pulse(self._handle, self._step_pin, 0, 0)
+        self._chunks.clear()
+        super().set_current_position(position)
+
+    def is_running(self) -> bool:
+        return bool(self._chunks and self._chunks[-1].end > self._clock()) or super().is_running()
+
+    def disable_outputs(self) -> None:
+        self._gpio.group_write(self._handle, self._step_pin, 0, STEP_BIT | DIR_BIT)
+
+
+class MockWaveGPIO:
+    """
+    Records the waves a WaveStepper sends, with the time each would start
+    playing, so generated pulse timings can be checked without a Pi.
+    """
+    TX_WAVE = 1
+
+    class pulse:
+        def __init__(self, group_bits, group_mask, pulse_delay):
+            self.group_bits = group_bits
+            self.group_mask = group_mask
+            self.pulse_delay = pulse_delay
+
+    def __init__(self, clock=micros):
+        self.clock = clock
+        self.waves = []  # (start_us, [pulse, ...])
+        self._end = 0
+        self.level = 0
+
+    def gpiochip_open(self, chip):
+        return 0
+
+    def group_claim_output(self, handle, gpios, levels=None, flags=0):
+        self.gpios = list(gpios)
+        return 0
+
+    def group_write(self, handle, gpio, bits, mask):
+        self.level = (self.level & ~mask) | (bits & mask)
+        return 0
+
+    def tx_wave(self, handle, gpio, pulses):
+        start = max(self.clock(), self._end)
+        self.waves.append((start, list(pulses)))
+        self._end = start + sum(p.pulse_delay for p in pulses)
+        return 0
+
+    def tx_pulse(self, handle, gpio, micros_on, micros_off, offset=0, cycles=0):
+        if micros_on == 0 and micros_off == 0:
+            # drop the queued waves and cut the playing one short at now
+            now = self.clock()
+            waves = []
+            for start, pulses in self.waves:
+                if start > now:
+                    break
+                t, kept = start, []
+                for p in pulses:
+                    if t > now:
+                        break
+                    kept.append(p)
+                    t += p.pulse_delay
+                waves.append((start, kept))
+            self.waves = waves
+            self._end = min(self._end, now)
+        return 0
+
+    def tx_busy(self, handle, gpio, kind):
+        return int(self.clock() < self._end)
+
+    def rising_edges(self, bit=STEP_BIT):
+        """Absolute times at which `bit` goes high, over all recorded waves."""
+        edges, level = [], self.level
+        for start, pulses in self.waves:
+            t = start
+            for p in pulses:
+                new_level = (level & ~p.group_mask) | (p.group_bits & p.group_mask)
+                if new_level & bit and not level & bit:
+                    edges.append(t)
+                level = new_level
+                t += p.pulse_delay
+        return edges
+
+
+if __name__ == "__main__":
+    # Check the recorded pulse timings against the step times plain AccelStepper
+    # would aim for, on a virtual clock; exits non-zero on a mismatch
+    import sys
+
+    MAX_SPEED, ACCELERATION, TICK_US = 8000, 20000, 1000
+    failures = []
+
+    def check(name, ok, detail=""):
+        print(f"{'ok  ' if ok else 'FAIL'} {name} {detail}")
+        if not ok:
+            failures.append(name)
+
+    def make_stepper():
+        clock = [0]
+        mock = MockWaveGPIO(clock=lambda: clock[0])
+        stepper = WaveStepper(19, 13, gpio=mock)
+        stepper._clock = mock.clock
+        stepper.set_max_speed(MAX_SPEED)
+        stepper.set_acceleration(ACCELERATION)
+        return stepper, mock, clock
+
+    def run_until(stepper, clock, done):
+        while not done():
+            stepper.run()
+            clock[0] += TICK_US
+
+    def expected_edges(target, retarget=None):
+        """Step times, relative to the first, of AccelStepper's profile; retarget=(pos, target)."""
+        ideal = AccelStepper(lambda: None, lambda: None)
+        ideal.set_max_speed(MAX_SPEED)
+        ideal.set_acceleration(ACCELERATION)
+        ideal.move_to(target)
+        expected, t, last_dir = [], 0, None
+        while ideal._stepInterval:
+            if last_dir is not None and ideal._direction != last_dir:
+                t += DIR_SETUP_US
+            last_dir = ideal._direction
+            expected.append(t)
+            ideal._currentPos += 1 if ideal._direction == DIRECTION_CW else -1
+            ideal.compute_new_speed()
+            if retarget and ideal._currentPos == retarget[0]:
+                ideal.move_to(retarget[1])
+                retarget = None
+            interval = int(ideal._stepInterval) if ideal._stepInterval else PULSE_US * 2
+            t += max(interval, PULSE_US * 2)
+        return expected
+
+    def check_timing(name, edges, expected):
+        offsets = [e - edges[0] for e in edges]
+        check(f"{name}: step count", len(offsets) == len(expected), f"({len(offsets)} vs {len(expected)})")
+        err = max(abs(a - b) for a, b in zip(offsets, expected))
+        check(f"{name}: pulse timing", err == 0, f"(max error {err} us over {offsets[-1] / 1e6:.3f} s)")
+
+    # 1. a single move from rest
+    stepper, mock, clock = make_stepper()
+    stepper.move_to(4000)
+    run_until(stepper, clock, lambda: not stepper.is_running())
+    check_timing("4000-step move", mock.rising_edges(), expected_edges(4000))
+    check("4000-step move: final position", stepper.current_position() == 4000, f"({stepper.current_position()})")
+
+    # 2. retargets mid-move, further on and back past the start; the new profile
+    # continues from the end of the queued waves
+    for new_target in (6000, -1500):
+        stepper, mock, clock = make_stepper()
+        stepper.move_to(4000)
+        run_until(stepper, clock, lambda: stepper.current_position() >= 1000)
+        planned = stepper._currentPos
+        stepper.move_to(new_target)
+        run_until(stepper, clock, lambda: not stepper.is_running())
+        name = f"retarget to {new_target} at step {planned}"
+        check_timing(name, mock.rising_edges(), expected_edges(4000, (planned, new_target)))
+        check(f"{name}: final position", stepper.current_position() == new_target, f"({stepper.current_position()})")
+
+    # 3. set_current_position() cancels the queued waves at once
+    stepper, mock, clock = make_stepper()
+    stepper.move_to(4000)
+    run_until(stepper, clock, lambda: stepper.current_position() >= 1500)
+    reached, cancelled_at = stepper.current_position(), clock[0]
+    stepper.set_current_position(0)
+    edges = mock.rising_edges()
+    check("cancel: steps played before the cancel", len(edges) == reached, f"({len(edges)} vs {reached})")
+    check("cancel: no step after the cancel", edges[-1] <= cancelled_at)
+    check("cancel: stopped", not stepper.is_running() and stepper.current_position() == 0)
+    stepper.move_to(300)
+    run_until(stepper, clock, lambda: not stepper.is_running())
+    after = mock.rising_edges()[reached:]
+    check("cancel: next move", len(after) == 300 and after[0] >= cancelled_at
+          and stepper.current_position() == 300,
+          f"({len(after)} steps, position {stepper.current_position()})")
+
+    sys.exit(1 if failures else 0)